@@ -0,0 +1,127 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class EngineState:
+    """Load signals for one inference engine (image or text)"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.latency_ewma = None
+        self.overloaded = False
+        self.overloaded_since = None
+        self.last_probe = 0.0
+        self.stats = {'admitted': 0, 'degraded': 0, 'probes': 0, 'overload_episodes': 0}
+
+
+class AdmissionController:
+    """Sends requests to the cheap fallback engines while the full models are overloaded.
+
+    A request is degraded when the engine already has max_in_flight full-model
+    calls running (queue depth), or while the engine is marked overloaded
+    because its latency EWMA went above the SLO. An overloaded engine still
+    admits one probe request per probe_interval so the EWMA keeps tracking
+    the real model latency, and it recovers once the EWMA falls below
+    recover_ratio * SLO.
+    """
+
+    def __init__(self, enabled=True, max_in_flight=8, latency_slo_ms=1000.0, recover_ratio=0.7,
+                 ewma_alpha=0.2, probe_interval=1.0):
+        self.enabled = enabled
+        self.max_in_flight = max(int(max_in_flight), 1)
+        self.latency_slo = float(latency_slo_ms) / 1000.0
+        self.recover_ratio = float(recover_ratio)
+        self.ewma_alpha = float(ewma_alpha)
+        self.probe_interval = float(probe_interval)
+        self._lock = threading.Lock()
+        self._engines = {}
+
+    @classmethod
+    def from_env(cls):
+        """Build a controller from ECOSORT_ADMISSION_* environment variables"""
+        return cls(
+            enabled=os.environ.get('ECOSORT_ADMISSION_ENABLED', '1').lower() not in ('0', 'false', 'no'),
+            max_in_flight=int(os.environ.get('ECOSORT_ADMISSION_MAX_IN_FLIGHT', 8)),
+            latency_slo_ms=float(os.environ.get('ECOSORT_ADMISSION_SLO_MS', 1000.0)),
+            recover_ratio=float(os.environ.get('ECOSORT_ADMISSION_RECOVER_RATIO', 0.7))
+        )
+
+    def _engine(self, engine):
+        state = self._engines.get(engine)
+        if state is None:
+            state = self._engines[engine] = EngineState()
+        return state
+
+    def _admit(self, engine):
+        with self._lock:
+            state = self._engine(engine)
+            if not self.enabled:
+                state.in_flight += 1
+                state.stats['admitted'] += 1
+                return True
+
+            admitted = state.in_flight < self.max_in_flight
+            if admitted and state.overloaded:
+                now = time.monotonic()
+                admitted = now - state.last_probe >= self.probe_interval
+                if admitted:
+                    state.last_probe = now
+                    state.stats['probes'] += 1
+
+            if admitted:
+                state.in_flight += 1
+                state.stats['admitted'] += 1
+            else:
+                state.stats['degraded'] += 1
+            return admitted
+
+    def _release(self, engine, elapsed):
+        with self._lock:
+            state = self._engine(engine)
+            state.in_flight -= 1
+            if state.latency_ewma is None:
+                state.latency_ewma = elapsed
+            else:
+                state.latency_ewma += self.ewma_alpha * (elapsed - state.latency_ewma)
+
+            # Hysteresis: enter above the SLO, leave only well below it
+            if not state.overloaded and state.latency_ewma > self.latency_slo:
+                state.overloaded = True
+                state.overloaded_since = time.monotonic()
+                state.stats['overload_episodes'] += 1
+            elif state.overloaded and state.latency_ewma < self.latency_slo * self.recover_ratio:
+                state.overloaded = False
+                state.overloaded_since = None
+
+    @contextmanager
+    def slot(self, engine):
+        """Yield True if the request may use the full model, False if it must degrade"""
+        admitted = self._admit(engine)
+        started = time.perf_counter()
+        try:
+            yield admitted
+        finally:
+            if admitted:
+                self._release(engine, time.perf_counter() - started)
+
+    def get_stats(self):
+        """Current load signals and counters per engine"""
+        with self._lock:
+            now = time.monotonic()
+            return {
+                'enabled': self.enabled,
+                'max_in_flight': self.max_in_flight,
+                'latency_slo_ms': self.latency_slo * 1000.0,
+                'engines': {
+                    engine: {
+                        'in_flight': state.in_flight,
+                        'latency_ewma_ms': state.latency_ewma * 1000.0 if state.latency_ewma is not None else None,
+                        'overloaded': state.overloaded,
+                        'overloaded_for_seconds': now - state.overloaded_since if state.overloaded else 0.0,
+                        **state.stats
+                    }
+                    for engine, state in self._engines.items()
+                }
+            }
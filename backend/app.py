@@ -1,8 +1,9 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, g, Response, stream_with_context
 from flask_cors import CORS
 import os
+import atexit
+import hmac
 import json
-import base64
 import numpy as np
 from PIL import Image
 import io
@@ -10,11 +11,24 @@ import sqlite3
 from datetime import datetime
 import uuid
 import logging
+import time
 
 # Import AI models
 from models.image_classifier import ImageClassifier
 from models.text_classifier import TextClassifier
-from models.sustainability_scorer import SustainabilityScorer
+from models.sustainability_scorer import SustainabilityScorer, CONDITION_CODES
+from profiler import RequestProfiler
+from admission import AdmissionController
+from singleflight import SingleFlight, image_key, text_key
+from live_analytics import AnalyticsBroker
+from sketches import ClassificationSketches
+from shared_counters import CounterFlusher, CounterStore
+from image_input import RAW_TENSOR_MIMETYPES, PayloadError, parse_shape, tensor_from_bytes, tensor_from_json
+from archive import ARROW_AVAILABLE, ArchiveReader, archive_classifications
+from backup import BackupInProgress, BackupScheduler, create_snapshot, integrity_check, list_backups
+from export import EXPORT_FORMATS, decode_cursor, export_stream
+from storage import SQLiteStorage, create_storage, sqlite_path
+from serialization import dumps, encode_response, negotiate
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -27,7 +41,7 @@ CORS(app, resources={
     r"/*": {
         "origins": ["http://localhost:3000", "http://127.0.0.1:3000"],
         "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"]
+        "allow_headers": ["Content-Type", "Authorization", "X-EcoSort-Profile"]
     }
 })
 
@@ -36,6 +50,8 @@ try:
     image_classifier = ImageClassifier()
     text_classifier = TextClassifier()
     sustainability_scorer = SustainabilityScorer()
+    if float(os.environ.get('ECOSORT_KB_WATCH_INTERVAL', 0)) > 0:
+        sustainability_scorer.start_watcher(float(os.environ['ECOSORT_KB_WATCH_INTERVAL']))
     logger.info("AI models initialized successfully")
 except Exception as e:
     logger.error(f"Failed to initialize AI models: {e}")
@@ -44,44 +60,140 @@ except Exception as e:
     text_classifier = None
     sustainability_scorer = None
 
+# SQLite database (ECOSORT_DB_PATH); also holds the sketches when classifications live in DuckDB
+DB_PATH = sqlite_path()
+
+# Parquet archive of classifications past the retention window
+ARCHIVE_DIR = os.environ.get('ECOSORT_ARCHIVE_DIR', 'archive')
+archive_reader = ArchiveReader(ARCHIVE_DIR)
+
+# Online snapshots of the SQLite database, on demand or every ECOSORT_BACKUP_INTERVAL seconds
+BACKUP_DIR = os.environ.get('ECOSORT_BACKUP_DIR', 'backups')
+
+# Opt-in request profiler for the classify endpoints
+request_profiler = RequestProfiler.from_env()
+
+# Routes classify requests to the fallback engines while the models are overloaded
+admission_controller = AdmissionController.from_env()
+
+# Identical concurrent classify requests share one inference
+inference_flights = SingleFlight()
+
+# Pushes stored classifications to live dashboards on /analytics/stream
+analytics_broker = AnalyticsBroker.from_env()
+
+# Rollup and analytics counts go through a store shared by all workers
+# (ECOSORT_COUNTERS) and are written by one elected flusher
+analytics_counters = CounterStore.from_env()
+
+# Classification storage backend (ECOSORT_STORAGE)
+storage = create_storage(counters=analytics_counters)
+if analytics_counters is not None and not isinstance(storage, SQLiteStorage):
+    logger.warning(f"ECOSORT_COUNTERS only applies to SQLite storage; ignored for {storage.name}")
+    analytics_counters = None
+
+counter_flusher = None
+if analytics_counters is not None:
+    counter_flusher = CounterFlusher(
+        analytics_counters,
+        lambda: sqlite3.connect(DB_PATH),
+        interval=float(os.environ.get('ECOSORT_COUNTERS_FLUSH_INTERVAL', 1.0))
+    )
+    counter_flusher.start()
+    atexit.register(counter_flusher.stop)
+
+# Top item texts and per-category quantiles, saved per worker and merged on read
+classification_sketches = ClassificationSketches.from_env()
+atexit.register(classification_sketches.close, lambda: sqlite3.connect(DB_PATH))
+
+backup_scheduler = BackupScheduler.from_env(DB_PATH)
+if backup_scheduler is not None:
+    backup_scheduler.start()
+    atexit.register(backup_scheduler.stop)
+
+# Admin endpoints (exports, archiving, partitions, backups, profiles) stay closed without a token
+if not os.environ.get('ECOSORT_ADMIN_TOKEN'):
+    logger.warning("ECOSORT_ADMIN_TOKEN is not set; admin endpoints will reject every request")
+
+def _admin_authorized():
+    """Admin endpoints require X-Admin-Token matching ECOSORT_ADMIN_TOKEN"""
+    token = os.environ.get('ECOSORT_ADMIN_TOKEN')
+    if not token:
+        return False
+    return hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token)
+
+@app.before_request
+def start_request_profile():
+    if not request.path.startswith('/classify/'):
+        return
+    g.request_started = time.perf_counter()
+    requested = (request.headers.get('X-EcoSort-Profile') == '1'
+                 or request.args.get('profile') == '1')
+    g.request_profile = request_profiler.start() if request_profiler.should_profile(requested) else None
+
+def _finish_request_profile():
+    """Stop this request's profiler and record its timing once; returns the profile id, if any"""
+    started = g.pop('request_started', None)
+    if started is None:
+        return None
+    profile = g.pop('request_profile', None)
+    elapsed = time.perf_counter() - started
+    request_profiler.record_request(elapsed, profiled=profile is not None)
+    if profile is None:
+        return None
+    try:
+        return request_profiler.finish(profile, request.path, elapsed)
+    except Exception as e:
+        profile.disable()
+        logger.error(f"Failed to write request profile: {e}")
+        return None
+
+@app.after_request
+def add_request_profile_id(response):
+    profile_id = _finish_request_profile()
+    if profile_id:
+        response.headers['X-EcoSort-Profile-Id'] = profile_id
+    return response
+
+@app.teardown_request
+def finish_request_profile(error=None):
+    # Runs even when the request failed before after_request, so cProfile is never left enabled
+    _finish_request_profile()
+
 # Database initialization
 def init_db():
     try:
-        conn = sqlite3.connect('ecosort.db')
-        cursor = conn.cursor()
-        
-        # Create tables
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS classifications (
-                id TEXT PRIMARY KEY,
-                timestamp DATETIME,
-                input_type TEXT,
-                input_data TEXT,
-                predicted_category TEXT,
-                confidence REAL,
-                sustainability_score REAL,
-                disposal_tips TEXT
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS analytics (
-                id TEXT PRIMARY KEY,
-                date DATE,
-                biodegradable_count INTEGER,
-                recyclable_count INTEGER,
-                hazardous_count INTEGER,
-                total_classifications INTEGER
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
-        logger.info("Database initialized successfully")
+        # Create (or migrate to) the storage backend's schema
+        storage.initialize()
+        logger.info(f"Database initialized successfully ({storage.name} storage)")
     except Exception as e:
         logger.error(f"Database initialization failed: {e}")
         raise
 
+def classification_response(classification_id, prediction, card, degraded=False, tip_set_id=None):
+    """Classify response in the format negotiated by the client.
+    
+    The full JSON response splices in the card's pre-encoded sustainability
+    fields; the compact response (?response=compact, or Accept:
+    application/vnd.ecosort.compact+json or application/msgpack) only carries
+    the id, the prediction and the tip-set id to look up at /tip-sets/<id>.
+    """
+    fields = {
+        "id": classification_id,
+        "category": prediction['category'],
+        "confidence": prediction['confidence']
+    }
+    if degraded:
+        fields["degraded"] = True
+    
+    compact, encoding = negotiate(request)
+    if compact:
+        fields["tip_set_id"] = tip_set_id
+        return encode_response(fields, encoding)
+    
+    body = dumps(fields)[:-1] + b',' + card.classify_fragment + b'}'
+    return Response(body, mimetype='application/json')
+
 @app.route('/')
 def home():
     return jsonify({
@@ -89,10 +201,24 @@ def home():
         "version": "1.0.0",
         "status": "running",
         "endpoints": {
-            "/classify/image": "POST - Classify waste from image",
+            "/classify/image": "POST - Classify waste from image (file, raw RGB tensor or base64 JSON)",
             "/classify/text": "POST - Classify waste from text",
+            "/score/batch": "POST - Eco-score many items at once",
             "/analytics": "GET - Get analytics data",
-            "/tips/<category>": "GET - Get disposal tips for category"
+            "/analytics/stream": "GET - Server-sent events with live classification counter deltas",
+            "/analytics/top-items": "GET - Most frequently classified items and confidence quantiles",
+            "/export/<format>": "GET - Stream classification history as ndjson or csv",
+            "/tips/<category>": "GET - Get disposal tips for category",
+            "/tip-sets/<id>": "GET - Get the tip list referenced by a compact classify response",
+            "/admin/profiles": "GET - List captured request profiles",
+            "/admin/cascade": "GET - Image cascade stage hit rates",
+            "/admin/admission": "GET - Overload admission control state",
+            "/admin/coalescing": "GET - Coalesced duplicate classify requests",
+            "/admin/image-cache": "GET - Near-duplicate image cache hit rate",
+            "/admin/analytics-stream": "GET - Live analytics subscribers and buffer overflows",
+            "/admin/counters": "GET - Shared analytics counter store and flusher state",
+            "/admin/partitions": "GET - Monthly classification partitions; DELETE /admin/partitions/<month> drops one",
+            "/admin/backups": "GET - Database snapshots and backup metrics; POST - Take a snapshot now"
         }
     })
 
@@ -103,6 +229,10 @@ def classify_image():
         if image_classifier is None or sustainability_scorer is None:
             return jsonify({"error": "AI models not available"}), 503
         
+        # Pre-resized RGB tensors skip decoding and resizing entirely
+        if request.mimetype in RAW_TENSOR_MIMETYPES or request.is_json:
+            return classify_image_tensor()
+        
         if 'image' not in request.files:
             return jsonify({"error": "No image file provided"}), 400
         
@@ -124,45 +254,78 @@ def classify_image():
             return jsonify({"error": "File too large. Maximum size is 10MB."}), 400
         
         # Read and preprocess image
+        image_bytes = file.read()
         try:
-            image = Image.open(file.stream)
+            image = Image.open(io.BytesIO(image_bytes))
             image = image.convert('RGB')
         except Exception as e:
             return jsonify({"error": f"Invalid image file: {str(e)}"}), 400
         
-        # Classify image
-        prediction = image_classifier.predict(image)
-        
-        # Get sustainability score and tips
-        sustainability_data = sustainability_scorer.get_score(prediction['category'])
-        
-        # Store classification
-        classification_id = str(uuid.uuid4())
-        store_classification(
-            classification_id, 
-            'image', 
-            file.filename,
-            prediction['category'],
-            prediction['confidence'],
-            sustainability_data['score'],
-            sustainability_data['tips']
-        )
-        
-        logger.info(f"Image classified successfully: {prediction['category']} (confidence: {prediction['confidence']:.2f})")
-        
-        return jsonify({
-            "id": classification_id,
-            "category": prediction['category'],
-            "confidence": prediction['confidence'],
-            "sustainability_score": sustainability_data['score'],
-            "disposal_tips": sustainability_data['tips'],
-            "environmental_impact": sustainability_data['impact']
-        })
+        return image_classification_response(image_key(image_bytes), file.filename, image)
         
     except Exception as e:
         logger.error(f"Image classification error: {e}")
         return jsonify({"error": "Internal server error during image classification"}), 500
 
+def classify_image_tensor():
+    """Classify a raw uint8 RGB tensor sent as the body or as base64 JSON"""
+    input_size = image_classifier.input_size
+    try:
+        if request.is_json:
+            array, payload = tensor_from_json(request.get_json(silent=True), input_size)
+        else:
+            payload = request.get_data()
+            array = tensor_from_bytes(
+                payload,
+                input_size,
+                shape=parse_shape(request.headers.get('X-Tensor-Shape')),
+                compression=request.headers.get('Content-Encoding')
+            )
+    except PayloadError as e:
+        return jsonify({"error": str(e), "expected_shape": [input_size, input_size, 3]}), 400
+    
+    return image_classification_response(
+        image_key(payload), request.headers.get('X-Image-Name', 'raw_tensor'),
+        image_classifier.image_from_array(array)
+    )
+
+def image_classification_response(key, input_data, image):
+    """Classify, store and respond for one image request.
+    
+    Concurrent requests with the same key share one inference, on the
+    fallback engine if the model is overloaded. Perceptual cache hits are
+    answered before admission control, so they neither add to the model's
+    latency signal nor count as degraded.
+    """
+    def classify():
+        cache_key, cached = image_classifier.lookup(image)
+        if cached is not None:
+            return cached, False
+        with admission_controller.slot('image') as admitted:
+            return image_classifier.predict(image, degraded=not admitted, key=cache_key), not admitted
+    
+    (prediction, degraded), _ = inference_flights.do(key, classify)
+    
+    # Get the pre-encoded sustainability knowledge card
+    card = sustainability_scorer.get_knowledge_card(prediction['category'], request.args.get('region'))
+    sustainability_data = card.data
+    
+    # Store classification
+    classification_id = str(uuid.uuid4())
+    tip_set_id = store_classification(
+        classification_id,
+        'image',
+        input_data,
+        prediction['category'],
+        prediction['confidence'],
+        sustainability_data['score'],
+        sustainability_data['tips']
+    )
+    
+    logger.info(f"Image classified successfully: {prediction['category']} (confidence: {prediction['confidence']:.2f})")
+    
+    return classification_response(classification_id, prediction, card, degraded=degraded, tip_set_id=tip_set_id)
+
 @app.route('/classify/text', methods=['POST'])
 def classify_text():
     try:
@@ -181,15 +344,21 @@ def classify_text():
         if len(text) > 1000:  # Limit text length
             return jsonify({"error": "Text too long. Maximum length is 1000 characters."}), 400
         
-        # Classify text
-        prediction = text_classifier.predict(text)
+        # Classify text, on the fallback engine if the model is overloaded;
+        # concurrent requests for the same normalized text share one inference
+        def classify():
+            with admission_controller.slot('text') as admitted:
+                return text_classifier.predict(text, degraded=not admitted), not admitted
+        
+        (prediction, degraded), _ = inference_flights.do(text_key(text), classify)
         
-        # Get sustainability score and tips
-        sustainability_data = sustainability_scorer.get_score(prediction['category'])
+        # Get the pre-encoded sustainability knowledge card
+        card = sustainability_scorer.get_knowledge_card(prediction['category'], request.args.get('region'))
+        sustainability_data = card.data
         
         # Store classification
         classification_id = str(uuid.uuid4())
-        store_classification(
+        tip_set_id = store_classification(
             classification_id,
             'text',
             text,
@@ -201,19 +370,69 @@ def classify_text():
         
         logger.info(f"Text classified successfully: {prediction['category']} (confidence: {prediction['confidence']:.2f})")
         
-        return jsonify({
-            "id": classification_id,
-            "category": prediction['category'],
-            "confidence": prediction['confidence'],
-            "sustainability_score": sustainability_data['score'],
-            "disposal_tips": sustainability_data['tips'],
-            "environmental_impact": sustainability_data['impact']
-        })
+        return classification_response(classification_id, prediction, card, degraded=degraded,
+                                       tip_set_id=tip_set_id)
         
     except Exception as e:
         logger.error(f"Text classification error: {e}")
         return jsonify({"error": "Internal server error during text classification"}), 500
 
+@app.route('/score/batch', methods=['POST'])
+def score_batch():
+    try:
+        if sustainability_scorer is None:
+            return jsonify({"error": "AI models not available"}), 503
+        
+        data = request.get_json(silent=True)
+        if not data or 'categories' not in data or 'confidences' not in data:
+            return jsonify({"error": "categories and confidences are required"}), 400
+        
+        categories = data['categories']
+        count = len(categories) if isinstance(categories, list) else -1
+        for field in ('confidences', 'quantities', 'conditions'):
+            if field in data and (not isinstance(data[field], list) or len(data[field]) != count):
+                return jsonify({"error": f"{field} must be a list with one entry per category"}), 400
+        if count < 0:
+            return jsonify({"error": "categories must be a list"}), 400
+        
+        # Items may use names or the integer codes from /score/batch's "category_codes"
+        if all(isinstance(category, int) for category in categories):
+            category_codes = np.array(categories, dtype=np.int64)
+        else:
+            category_codes = sustainability_scorer.encode_categories(categories, data.get('region'))
+        
+        quantities = None
+        if 'quantities' in data:
+            quantities = np.array([np.nan if q is None else q for q in data['quantities']], dtype=np.float64)
+        
+        condition_codes = None
+        if 'conditions' in data:
+            conditions = data['conditions']
+            if all(isinstance(condition, int) for condition in conditions):
+                condition_codes = np.array(conditions, dtype=np.int64)
+            else:
+                condition_codes = sustainability_scorer.encode_conditions(conditions)
+        
+        scores = sustainability_scorer.calculate_eco_scores(
+            category_codes,
+            np.array(data['confidences'], dtype=np.float64),
+            quantities,
+            condition_codes,
+            region=data.get('region')
+        )
+        
+        return jsonify({
+            "scores": scores.tolist(),
+            "count": count,
+            "category_codes": list(sustainability_scorer.knowledge(data.get('region')).category_codes),
+            "condition_codes": list(CONDITION_CODES)
+        })
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid batch: {str(e)}"}), 400
+    except Exception as e:
+        logger.error(f"Batch scoring error: {e}")
+        return jsonify({"error": "Internal server error during batch scoring"}), 500
+
 @app.route('/analytics', methods=['GET'])
 def get_analytics():
     try:
@@ -228,124 +447,403 @@ def get_analytics():
         except ValueError:
             return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
         
-        conn = sqlite3.connect('ecosort.db')
-        cursor = conn.cursor()
-        
-        # Get daily statistics
-        cursor.execute('''
-            SELECT 
-                date,
-                biodegradable_count,
-                recyclable_count,
-                hazardous_count,
-                total_classifications
-            FROM analytics
-            WHERE date BETWEEN ? AND ?
-            ORDER BY date
-        ''', (start_date, end_date))
-        
-        daily_stats = cursor.fetchall()
-        
-        # Get category distribution
-        cursor.execute('''
-            SELECT 
-                predicted_category,
-                COUNT(*) as count
-            FROM classifications
-            WHERE timestamp BETWEEN ? AND ?
-            GROUP BY predicted_category
-        ''', (f"{start_date} 00:00:00", f"{end_date} 23:59:59"))
-        
-        category_distribution = dict(cursor.fetchall())
-        
-        # Get total classifications
-        cursor.execute('''
-            SELECT COUNT(*) FROM classifications
-            WHERE timestamp BETWEEN ? AND ?
-        ''', (f"{start_date} 00:00:00", f"{end_date} 23:59:59"))
-        
-        total_classifications = cursor.fetchone()[0]
-        
-        conn.close()
+        # Live dashboards apply only the stream deltas after stream_sequence
+        with analytics_broker.snapshot() as stream_sequence:
+            analytics = storage.range_analytics(start_date, end_date)
         
         return jsonify({
-            "daily_statistics": [
-                {
-                    "date": row[0],
-                    "biodegradable": row[1],
-                    "recyclable": row[2],
-                    "hazardous": row[3],
-                    "total": row[4]
-                } for row in daily_stats
-            ],
-            "category_distribution": category_distribution,
-            "total_classifications": total_classifications,
+            "daily_statistics": analytics['daily_statistics'],
+            "category_distribution": analytics['category_distribution'],
+            "category_averages": analytics['category_averages'],
+            "input_type_distribution": analytics['input_type_distribution'],
+            "total_classifications": analytics['total_classifications'],
             "date_range": {
                 "start": start_date,
                 "end": end_date
-            }
+            },
+            "stream_sequence": stream_sequence
         })
         
     except Exception as e:
         logger.error(f"Analytics error: {e}")
         return jsonify({"error": "Internal server error while fetching analytics"}), 500
 
+@app.route('/analytics/stream', methods=['GET'])
+def stream_analytics():
+    # Dashboards load one /analytics snapshot and then apply these deltas
+    subscription = analytics_broker.subscribe()
+    if subscription is None:
+        return jsonify({"error": "Too many live analytics connections"}), 503
+    
+    return Response(
+        stream_with_context(analytics_broker.stream(subscription)),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route('/analytics/top-items', methods=['GET'])
+def get_top_items():
+    try:
+        limit = min(max(request.args.get('limit', 20, type=int), 1), classification_sketches.capacity)
+        category = request.args.get('category')
+        
+        conn = sqlite3.connect(DB_PATH)
+        merged, workers = classification_sketches.merged(conn)
+        conn.close()
+        
+        summary = merged.summary(limit=limit, category=category.lower() if category else None)
+        summary["workers"] = workers
+        return jsonify(summary)
+    except Exception as e:
+        logger.error(f"Top items error: {e}")
+        return jsonify({"error": "Internal server error while fetching top items"}), 500
+
+@app.route('/export/<export_format>', methods=['GET'])
+def export_classifications(export_format):
+    if not _admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"error": "Invalid export format. Must be one of: ndjson, csv"}), 400
+    
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    try:
+        for value in (start_date, end_date):
+            if value:
+                datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
+    
+    # Resume after the last received row, either from an NDJSON cursor record
+    # or from the timestamp and id of the last CSV row
+    after = None
+    try:
+        if request.args.get('cursor'):
+            after = decode_cursor(request.args['cursor'])
+        elif request.args.get('after_timestamp') and request.args.get('after_id'):
+            after = (request.args['after_timestamp'], request.args['after_id'])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    compress = request.args.get('compression') == 'gzip'
+    include_archive = request.args.get('include_archive') == '1'
+    filename = f"classifications.{export_format}" + ('.gz' if compress else '')
+    
+    stream = export_stream(
+        storage,
+        export_format,
+        start_date=start_date,
+        end_date=end_date,
+        after=after,
+        compress=compress,
+        archive_reader=archive_reader if include_archive else None
+    )
+    
+    return Response(
+        stream_with_context(stream),
+        mimetype='application/gzip' if compress else EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+@app.route('/admin/archive', methods=['GET'])
+def get_archive():
+    if not _admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    try:
+        for value in (start_date, end_date):
+            if value:
+                datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
+    
+    if storage.name != 'sqlite':
+        return jsonify({"error": "Archiving requires SQLite storage"}), 400
+    
+    try:
+        partitions = archive_reader.list_partitions(start_date, end_date)
+        return jsonify({
+            "archive_available": ARROW_AVAILABLE,
+            "partitions": [{"month": month, "path": path} for month, path in partitions],
+            "category_distribution": archive_reader.category_distribution(DB_PATH, start_date, end_date)
+        })
+    except Exception as e:
+        logger.error(f"Archive query error: {e}")
+        return jsonify({"error": "Internal server error while querying archive"}), 500
+
+@app.route('/admin/archive', methods=['POST'])
+def run_archive():
+    if not _admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    if not ARROW_AVAILABLE:
+        return jsonify({"error": "Archiving requires pyarrow"}), 503
+    if storage.name != 'sqlite':
+        return jsonify({"error": "Archiving requires SQLite storage"}), 400
+    
+    data = request.get_json(silent=True) or {}
+    older_than_days = data.get('older_than_days')
+    if not isinstance(older_than_days, int) or older_than_days < 1:
+        return jsonify({"error": "older_than_days must be a positive integer"}), 400
+    
+    try:
+        summary = archive_classifications(
+            DB_PATH,
+            ARCHIVE_DIR,
+            older_than_days,
+            vacuum=bool(data.get('vacuum', False))
+        )
+        return jsonify(summary)
+    except Exception as e:
+        logger.error(f"Archive job error: {e}")
+        return jsonify({"error": "Internal server error while archiving"}), 500
+
+@app.route('/admin/partitions', methods=['GET'])
+def get_partitions():
+    if not _admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    if storage.name != 'partitioned':
+        return jsonify({"error": "Partitions require ECOSORT_STORAGE=partitioned"}), 400
+    
+    partitions = storage.list_partitions(request.args.get('start_date'), request.args.get('end_date'))
+    return jsonify({
+        "partition_dir": storage.partition_dir,
+        "partitions": [
+            {"month": month, "path": path, "size_bytes": os.path.getsize(path)}
+            for month, path in partitions
+        ]
+    })
+
+@app.route('/admin/partitions/<month>', methods=['DELETE'])
+def drop_partition(month):
+    if not _admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    if storage.name != 'partitioned':
+        return jsonify({"error": "Partitions require ECOSORT_STORAGE=partitioned"}), 400
+    
+    try:
+        datetime.strptime(month, '%Y-%m')
+    except ValueError:
+        return jsonify({"error": "Invalid month format. Use YYYY-MM"}), 400
+    
+    try:
+        if not storage.drop_partition(month):
+            return jsonify({"error": f"No partition for {month}"}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except OSError as e:
+        logger.error(f"Partition drop error: {e}")
+        return jsonify({"error": "Internal server error while dropping partition"}), 500
+    
+    # Rollups are kept, so /analytics still covers the dropped month
+    return jsonify({"month": month, "dropped": True})
+
+@app.route('/admin/backups', methods=['GET'])
+def get_backups():
+    if not _admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    return jsonify({
+        "backup_dir": BACKUP_DIR,
+        "backups": [
+            {"name": name, "size_bytes": os.path.getsize(path)}
+            for name, path in list_backups(BACKUP_DIR, DB_PATH)
+        ],
+        "scheduler": backup_scheduler.get_stats() if backup_scheduler is not None else None
+    })
+
+@app.route('/admin/backups', methods=['POST'])
+def run_backup():
+    if not _admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    data = request.get_json(silent=True) or {}
+    keep = data.get('keep', backup_scheduler.keep if backup_scheduler is not None else 7)
+    if not isinstance(keep, int) or keep < 1:
+        return jsonify({"error": "keep must be a positive integer"}), 400
+    
+    try:
+        return jsonify(create_snapshot(DB_PATH, BACKUP_DIR, keep=keep))
+    except BackupInProgress as e:
+        return jsonify({"error": str(e)}), 409
+    except Exception as e:
+        logger.error(f"Backup error: {e}")
+        return jsonify({"error": "Internal server error while taking backup"}), 500
+
+@app.route('/admin/backups/<name>/verify', methods=['POST'])
+def verify_backup(name):
+    if not _admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    backups = dict(list_backups(BACKUP_DIR, DB_PATH))
+    if name not in backups:
+        return jsonify({"error": "Backup not found"}), 404
+    
+    try:
+        started = time.perf_counter()
+        messages = integrity_check(backups[name])
+        return jsonify({
+            "name": name,
+            "ok": messages == ['ok'],
+            "messages": messages,
+            "duration_seconds": round(time.perf_counter() - started, 4)
+        })
+    except Exception as e:
+        logger.error(f"Backup verify error: {e}")
+        return jsonify({"error": "Internal server error while verifying backup"}), 500
+
 @app.route('/tips/<category>', methods=['GET'])
 def get_disposal_tips(category):
     try:
         # Validate category
-        valid_categories = ['biodegradable', 'recyclable', 'hazardous']
-        if category.lower() not in valid_categories:
-            return jsonify({"error": "Invalid category. Must be one of: biodegradable, recyclable, hazardous"}), 400
-        
         if sustainability_scorer is None:
             return jsonify({"error": "AI models not available"}), 503
         
-        sustainability_data = sustainability_scorer.get_score(category.lower())
-        return jsonify({
-            "category": category.lower(),
-            "tips": sustainability_data['tips'],
-            "score": sustainability_data['score'],
-            "impact": sustainability_data['impact']
-        })
+        valid_categories = sustainability_scorer.category_codes
+        if category.lower() not in valid_categories:
+            return jsonify({"error": f"Invalid category. Must be one of: {', '.join(valid_categories)}"}), 400
+        
+        # Serve the pre-encoded knowledge card; clients revalidate with If-None-Match
+        card = sustainability_scorer.get_knowledge_card(category.lower(), request.args.get('region'))
+        response = Response(card.body, mimetype='application/json')
+        response.set_etag(card.etag)
+        return response.make_conditional(request)
     except Exception as e:
         logger.error(f"Tips error: {e}")
         return jsonify({"error": "Internal server error while fetching tips"}), 500
 
+@app.route('/tip-sets/<int:tip_set_id>', methods=['GET'])
+def get_tip_set(tip_set_id):
+    try:
+        tips = storage.get_tip_set(tip_set_id)
+        if tips is None:
+            return jsonify({"error": "Tip set not found"}), 404
+        
+        # Tip sets are never modified once written, so clients can cache them indefinitely
+        response = Response(dumps({"id": tip_set_id, "tips": tips}), mimetype='application/json')
+        response.set_etag(f"tip-set-{tip_set_id}")
+        response.cache_control.public = True
+        response.cache_control.max_age = 31536000
+        response.cache_control.immutable = True
+        return response.make_conditional(request)
+    except Exception as e:
+        logger.error(f"Tip set error: {e}")
+        return jsonify({"error": "Internal server error while fetching tip set"}), 500
+
+@app.route('/admin/knowledge-base', methods=['GET'])
+def get_knowledge_base():
+    if not _admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    if sustainability_scorer is None:
+        return jsonify({"error": "AI models not available"}), 503
+    return jsonify(sustainability_scorer.get_info())
+
+@app.route('/admin/knowledge-base/reload', methods=['POST'])
+def reload_knowledge_base():
+    if not _admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    if sustainability_scorer is None:
+        return jsonify({"error": "AI models not available"}), 503
+    
+    try:
+        sustainability_scorer.reload()
+    except Exception as e:
+        # The previous knowledge base stays active
+        logger.error(f"Knowledge base reload failed: {e}")
+        return jsonify({"error": f"Knowledge base reload failed: {str(e)}"}), 400
+    
+    logger.info(f"Knowledge base reloaded: version {sustainability_scorer.get_info()['version']}")
+    return jsonify(sustainability_scorer.get_info())
+
+@app.route('/admin/admission', methods=['GET'])
+def get_admission_stats():
+    if not _admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify(admission_controller.get_stats())
+
+@app.route('/admin/coalescing', methods=['GET'])
+def get_coalescing_stats():
+    if not _admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify(inference_flights.get_stats())
+
+@app.route('/admin/image-cache', methods=['GET'])
+def get_image_cache_stats():
+    if not _admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    if image_classifier is None:
+        return jsonify({"error": "AI models not available"}), 503
+    return jsonify(image_classifier.get_perceptual_cache_stats())
+
+@app.route('/admin/analytics-stream', methods=['GET'])
+def get_analytics_stream_stats():
+    if not _admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify(analytics_broker.get_stats())
+
+@app.route('/admin/counters', methods=['GET'])
+def get_counter_stats():
+    if not _admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    if counter_flusher is None:
+        return jsonify({"store": "direct"})
+    return jsonify(counter_flusher.get_stats())
+
+@app.route('/admin/cascade', methods=['GET'])
+def get_cascade_stats():
+    if not _admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    if image_classifier is None:
+        return jsonify({"error": "AI models not available"}), 503
+    return jsonify(image_classifier.get_cascade_stats())
+
+@app.route('/admin/profiles', methods=['GET'])
+def list_profiles():
+    if not _admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify({
+        "profiles": request_profiler.list_profiles(),
+        "stats": request_profiler.get_stats()
+    })
+
+@app.route('/admin/profiles/<name>', methods=['GET'])
+def get_profile(name):
+    if not _admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    if request.args.get('format') == 'raw':
+        path = request_profiler.profile_path(name)
+        if path is None:
+            return jsonify({"error": "Profile not found"}), 404
+        with open(path, 'rb') as f:
+            return Response(f.read(), mimetype='application/octet-stream')
+    
+    report = request_profiler.render_profile(name, sort_by=request.args.get('sort', 'cumulative'))
+    if report is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return Response(report, mimetype='text/plain')
+
 def store_classification(id, input_type, input_data, category, confidence, score, tips):
+    """Store one classification; returns its tip-set id, or None if it could not be stored"""
     try:
-        conn = sqlite3.connect('ecosort.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO classifications 
-            (id, timestamp, input_type, input_data, predicted_category, confidence, sustainability_score, disposal_tips)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (id, datetime.now(), input_type, input_data, category, confidence, score, tips))
-        
-        # Update daily analytics
-        today = datetime.now().strftime('%Y-%m-%d')
-        
-        cursor.execute('''
-            INSERT OR REPLACE INTO analytics 
-            (id, date, biodegradable_count, recyclable_count, hazardous_count, total_classifications)
-            VALUES (
-                ?,
-                ?,
-                (SELECT COUNT(*) FROM classifications WHERE predicted_category = 'biodegradable' AND DATE(timestamp) = ?),
-                (SELECT COUNT(*) FROM classifications WHERE predicted_category = 'recyclable' AND DATE(timestamp) = ?),
-                (SELECT COUNT(*) FROM classifications WHERE predicted_category = 'hazardous' AND DATE(timestamp) = ?),
-                (SELECT COUNT(*) FROM classifications WHERE DATE(timestamp) = ?)
-            )
-        ''', (today, today, today, today, today, today))
-        
-        conn.commit()
-        conn.close()
+        timestamp = datetime.now()
+        with analytics_broker.publishing():
+            tip_set_id = storage.insert((id, timestamp, input_type, input_data, category, confidence, score, tips))
+            analytics_broker.publish(timestamp, input_type, category, confidence, score)
         logger.info(f"Classification stored successfully: {id}")
+        classification_sketches.update(input_type, input_data, category, confidence, score)
+        classification_sketches.maybe_persist(lambda: sqlite3.connect(DB_PATH))
+        return tip_set_id
     except Exception as e:
         logger.error(f"Failed to store classification: {e}")
         # Don't raise the exception to avoid breaking the API response
         # The classification result is still returned to the user
+        return None
 
 if __name__ == '__main__':
     try:
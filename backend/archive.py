@@ -0,0 +1,259 @@
+"""
+Retention job that moves old classification rows into monthly Parquet files.
+
+Rows older than the retention window are written, ordered by (timestamp, id),
+to archive/year=YYYY/month=MM/part-*.parquet and then deleted from SQLite.
+Rollups are left untouched, so /analytics keeps covering archived history;
+ArchiveReader answers raw-row queries over the archive plus the live table.
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import uuid
+from datetime import datetime, timedelta
+
+from export import EXPORT_COLUMNS, day_bounds
+
+logger = logging.getLogger(__name__)
+
+ARROW_AVAILABLE = False
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    ARROW_AVAILABLE = True
+except ImportError:
+    logger.info("pyarrow not available, classification archiving disabled")
+
+DUCKDB_AVAILABLE = False
+try:
+    import duckdb
+    DUCKDB_AVAILABLE = True
+except ImportError:
+    pass
+
+
+def archive_schema():
+    """Arrow schema of archived classification rows (the EXPORT_COLUMNS)"""
+    return pa.schema([
+        ('id', pa.string()),
+        ('timestamp', pa.string()),
+        ('input_type', pa.string()),
+        ('input_data', pa.string()),
+        ('predicted_category', pa.string()),
+        ('confidence', pa.float64()),
+        ('sustainability_score', pa.float64()),
+        ('disposal_tips', pa.string())
+    ])
+
+
+def _month_range(month):
+    """Timestamp bounds [low, high) of a 'YYYY-MM' month"""
+    start = datetime.strptime(month, '%Y-%m')
+    end = start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return f"{start:%Y-%m-%d} 00:00:00", f"{end:%Y-%m-%d} 00:00:00"
+
+
+def archive_classifications(db_path, archive_dir, older_than_days, batch_size=50000,
+                            compression='zstd', vacuum=False):
+    """Move classifications older than older_than_days into Parquet and delete them from SQLite.
+
+    Returns a summary with the number of rows and files written per month.
+    """
+    if not ARROW_AVAILABLE:
+        raise RuntimeError("pyarrow is required for archiving")
+
+    cutoff = (datetime.now() - timedelta(days=older_than_days)).strftime('%Y-%m-%d 00:00:00')
+    schema = archive_schema()
+    summary = {'cutoff': cutoff, 'rows_archived': 0, 'files': []}
+
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT DISTINCT SUBSTR(timestamp, 1, 7) FROM classifications
+            WHERE timestamp < ?
+            ORDER BY 1
+        ''', (cutoff,))
+        months = [row[0] for row in cursor.fetchall()]
+
+        for month in months:
+            low, high = _month_range(month)
+            high = min(high, cutoff)
+
+            partition_dir = os.path.join(archive_dir, f"year={month[:4]}", f"month={month[5:7]}")
+            os.makedirs(partition_dir, exist_ok=True)
+
+            read_cursor = conn.cursor()
+            read_cursor.execute(f'''
+                SELECT {', '.join(EXPORT_COLUMNS)} FROM classification_details
+                WHERE timestamp >= ? AND timestamp < ?
+                ORDER BY timestamp, id
+            ''', (low, high))
+
+            writer = None
+            tmp_path = None
+            final_path = None
+            rows_written = 0
+            try:
+                while True:
+                    rows = read_cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    if writer is None:
+                        # Part names start with the first timestamp so they sort chronologically
+                        first = rows[0][1].replace(' ', 'T').replace(':', '')
+                        name = f"part-{first}-{uuid.uuid4().hex[:8]}.parquet"
+                        final_path = os.path.join(partition_dir, name)
+                        tmp_path = final_path + '.tmp'
+                        writer = pq.ParquetWriter(tmp_path, schema, compression=compression)
+                    columns = list(zip(*rows))
+                    batch = pa.RecordBatch.from_arrays(
+                        [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                        schema=schema
+                    )
+                    writer.write_batch(batch)
+                    rows_written += len(rows)
+            finally:
+                if writer is not None:
+                    writer.close()
+
+            if not rows_written:
+                continue
+
+            # Publish the file before deleting so a crash never loses rows
+            os.replace(tmp_path, final_path)
+            conn.execute('DELETE FROM classifications WHERE timestamp >= ? AND timestamp < ?', (low, high))
+            conn.commit()
+
+            summary['rows_archived'] += rows_written
+            summary['files'].append({'month': month, 'path': final_path, 'rows': rows_written})
+            logger.info(f"Archived {rows_written} classifications for {month} to {final_path}")
+
+        if vacuum and summary['rows_archived']:
+            conn.execute('VACUUM')
+    finally:
+        conn.close()
+
+    return summary
+
+
+class ArchiveReader:
+    """Reads archived Parquet partitions, alone or together with the live table"""
+
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+
+    def list_partitions(self, start_date=None, end_date=None):
+        """Archive files as (month, path) pairs in chronological order, pruned to the date range"""
+        if not os.path.isdir(self.archive_dir):
+            return []
+
+        first_month = start_date[:7] if start_date else None
+        last_month = end_date[:7] if end_date else None
+
+        partitions = []
+        for year_dir in sorted(os.listdir(self.archive_dir)):
+            if not year_dir.startswith('year='):
+                continue
+            year_path = os.path.join(self.archive_dir, year_dir)
+            for month_dir in sorted(os.listdir(year_path)):
+                if not month_dir.startswith('month='):
+                    continue
+                month = f"{year_dir[5:]}-{month_dir[6:]}"
+                if (first_month and month < first_month) or (last_month and month > last_month):
+                    continue
+                month_path = os.path.join(year_path, month_dir)
+                for name in sorted(os.listdir(month_path)):
+                    if name.endswith('.parquet'):
+                        partitions.append((month, os.path.join(month_path, name)))
+        return partitions
+
+    def iter_rows(self, start_date=None, end_date=None, after=None, chunk_size=1000):
+        """Yield lists of archived rows in (timestamp, id) order, like export.iter_rows"""
+        if not ARROW_AVAILABLE:
+            return
+
+        low, high = day_bounds(start_date, end_date)
+        for _, path in self.list_partitions(start_date, end_date):
+            parquet_file = pq.ParquetFile(path)
+            for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=list(EXPORT_COLUMNS)):
+                rows = [
+                    row for row in zip(*(batch.column(i).to_pylist() for i in range(batch.num_columns)))
+                    if (low is None or row[1] >= low)
+                    and (high is None or row[1] < high)
+                    and (after is None or (row[1], row[0]) > after)
+                ]
+                if rows:
+                    yield rows
+
+    def _archive_distribution(self, start_date, end_date):
+        paths = [path for _, path in self.list_partitions(start_date, end_date)]
+        if not paths:
+            return {}
+
+        low, high = day_bounds(start_date, end_date)
+        if DUCKDB_AVAILABLE:
+            conditions = []
+            params = []
+            if low:
+                conditions.append('timestamp >= ?')
+                params.append(low)
+            if high:
+                conditions.append('timestamp < ?')
+                params.append(high)
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+            con = duckdb.connect()
+            try:
+                rows = con.execute(f'''
+                    SELECT predicted_category, COUNT(*)
+                    FROM read_parquet(?)
+                    {where}
+                    GROUP BY predicted_category
+                ''', [paths] + params).fetchall()
+            finally:
+                con.close()
+            return dict(rows)
+
+        distribution = {}
+        for rows in self.iter_rows(start_date, end_date, chunk_size=50000):
+            for row in rows:
+                distribution[row[4]] = distribution.get(row[4], 0) + 1
+        return distribution
+
+    def category_distribution(self, db_path, start_date=None, end_date=None):
+        """Category counts over archived plus live rows"""
+        distribution = self._archive_distribution(start_date, end_date) if ARROW_AVAILABLE else {}
+
+        low, high = day_bounds(start_date, end_date)
+        conn = sqlite3.connect(db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT predicted_category, COUNT(*) FROM classification_details
+                WHERE timestamp >= COALESCE(?, '') AND (? IS NULL OR timestamp < ?)
+                GROUP BY predicted_category
+            ''', (low, high, high))
+            for category, count in cursor.fetchall():
+                distribution[category] = distribution.get(category, 0) + count
+        finally:
+            conn.close()
+        return distribution
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive old EcoSortAI classifications to Parquet")
+    parser.add_argument('--db', default='ecosort.db', help="SQLite database path")
+    parser.add_argument('--archive-dir', default=os.environ.get('ECOSORT_ARCHIVE_DIR', 'archive'))
+    parser.add_argument('--older-than-days', type=int, required=True)
+    parser.add_argument('--vacuum', action='store_true', help="VACUUM the database afterwards")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    summary = archive_classifications(args.db, args.archive_dir, args.older_than_days, vacuum=args.vacuum)
+    print(f"Archived {summary['rows_archived']} rows older than {summary['cutoff']} "
+          f"into {len(summary['files'])} files")
+
+
+if __name__ == '__main__':
+    main()
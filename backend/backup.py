@@ -0,0 +1,316 @@
+"""
+Online snapshots of the SQLite database with the SQLite backup API.
+
+The database is copied a few pages at a time, sleeping between steps, so
+writers only wait for one step instead of the whole copy. A commit by
+another connection restarts the copy; after max_restarts the remaining
+copy is done in one step. In WAL mode readers never block writers, so the
+copy is a single read transaction. Snapshots are written to a temporary
+file, checked with PRAGMA integrity_check and only then renamed into place,
+so a snapshot on disk is always complete.
+"""
+import argparse
+import fcntl
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class BackupError(Exception):
+    """A snapshot could not be taken, verified or restored"""
+
+
+class BackupInProgress(BackupError):
+    """Another process holds the snapshot lock"""
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def integrity_check(db_path):
+    """PRAGMA integrity_check messages for a database file; ['ok'] when it is intact"""
+    conn = sqlite3.connect(db_path)
+    try:
+        return [row[0] for row in conn.execute('PRAGMA integrity_check').fetchall()]
+    except sqlite3.DatabaseError as e:
+        # Damage to the header or schema stops the check itself
+        return [str(e)]
+    finally:
+        conn.close()
+
+
+def backup_database(db_path, dest_path, step_pages=256, step_sleep=0.01, max_restarts=5):
+    """Copy db_path to dest_path with the online backup API; returns copy metrics.
+
+    writer_pause times are how long each step held the read lock that keeps
+    writers from committing (zero in WAL mode).
+    """
+    source = sqlite3.connect(db_path)
+    try:
+        journal_mode = source.execute('PRAGMA journal_mode').fetchone()[0].lower()
+        page_size = source.execute('PRAGMA page_size').fetchone()[0]
+        wal = journal_mode == 'wal'
+
+        stats = {
+            'journal_mode': journal_mode,
+            'steps': 0,
+            'restarts': 0,
+            'max_writer_pause_ms': 0.0,
+            'total_writer_pause_ms': 0.0
+        }
+        step_started = [0.0]
+        remaining_before = [None]
+
+        def progress(status, remaining, total):
+            pause_ms = (time.perf_counter() - step_started[0]) * 1000
+            stats['steps'] += 1
+            if not wal:
+                stats['max_writer_pause_ms'] = max(stats['max_writer_pause_ms'], pause_ms)
+                stats['total_writer_pause_ms'] += pause_ms
+            if remaining_before[0] is not None and remaining > remaining_before[0]:
+                stats['restarts'] += 1
+                if stats['restarts'] > max_restarts:
+                    raise _TooManyRestarts()
+            remaining_before[0] = remaining
+            if remaining:
+                # Let writers take the lock before the next step
+                time.sleep(step_sleep)
+            step_started[0] = time.perf_counter()
+
+        dest = sqlite3.connect(dest_path)
+        started = time.perf_counter()
+        try:
+            step_started[0] = started
+            try:
+                source.backup(dest, pages=-1 if wal else step_pages, progress=progress)
+            except _TooManyRestarts:
+                logger.warning(f"Backup of {db_path} restarted {max_restarts} times by writers; copying in one step")
+                step_started[0] = time.perf_counter()
+                remaining_before[0] = None
+                source.backup(dest, pages=-1, progress=progress)
+            duration = time.perf_counter() - started
+
+            # The copy keeps the source's WAL flag; a snapshot should be one self-contained file
+            if wal:
+                dest.execute('PRAGMA journal_mode=DELETE')
+            pages = dest.execute('PRAGMA page_count').fetchone()[0]
+        finally:
+            dest.close()
+    finally:
+        source.close()
+
+    stats.update({
+        'pages': pages,
+        'page_size': page_size,
+        'bytes': pages * page_size,
+        'duration_seconds': round(duration, 4),
+        'throughput_mb_per_second': round(pages * page_size / duration / 1e6, 2) if duration else None,
+        'max_writer_pause_ms': round(stats['max_writer_pause_ms'], 3),
+        'total_writer_pause_ms': round(stats['total_writer_pause_ms'], 3)
+    })
+    return stats
+
+
+def list_backups(backup_dir, db_path):
+    """Snapshots of db_path in backup_dir as (name, path) pairs, oldest first"""
+    if not os.path.isdir(backup_dir):
+        return []
+    prefix = os.path.splitext(os.path.basename(db_path))[0] + '-'
+    return [
+        (name, os.path.join(backup_dir, name))
+        for name in sorted(os.listdir(backup_dir))
+        if name.startswith(prefix) and name.endswith('.db')
+    ]
+
+
+def create_snapshot(db_path, backup_dir, keep=7, step_pages=256, step_sleep=0.01, max_restarts=5,
+                    min_age=None):
+    """Write a verified snapshot of db_path to backup_dir, keeping the newest keep snapshots.
+
+    Returns the copy metrics, or None when the newest snapshot is less than
+    min_age seconds old. Raises BackupInProgress when another process is
+    taking a snapshot and BackupError when the copy fails its integrity check.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    with open(os.path.join(backup_dir, '.backup.lock'), 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise BackupInProgress("Another backup is in progress")
+
+        backups = list_backups(backup_dir, db_path)
+        if min_age and backups and time.time() - os.path.getmtime(backups[-1][1]) < min_age:
+            return None
+
+        stem = os.path.splitext(os.path.basename(db_path))[0]
+        final_path = os.path.join(backup_dir, f"{stem}-{datetime.now():%Y%m%d-%H%M%S}.db")
+        tmp_path = final_path + '.tmp'
+        try:
+            stats = backup_database(db_path, tmp_path, step_pages, step_sleep, max_restarts)
+
+            started = time.perf_counter()
+            messages = integrity_check(tmp_path)
+            stats['verify_seconds'] = round(time.perf_counter() - started, 4)
+            if messages != ['ok']:
+                raise BackupError(f"Snapshot failed integrity check: {'; '.join(messages[:5])}")
+
+            os.replace(tmp_path, final_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        stats['path'] = final_path
+        stats['pruned'] = []
+        backups = list_backups(backup_dir, db_path)
+        for _, path in backups[:max(len(backups) - keep, 0)]:
+            os.remove(path)
+            stats['pruned'].append(path)
+
+    logger.info(f"Backed up {db_path} to {final_path}: {stats['bytes']} bytes in "
+                f"{stats['duration_seconds']}s, {stats['restarts']} restarts, "
+                f"longest writer pause {stats['max_writer_pause_ms']}ms")
+    return stats
+
+
+def restore_backup(snapshot_path, db_path):
+    """Replace db_path's contents with a snapshot and verify the result.
+
+    Both the snapshot and the restored database must pass integrity_check.
+    Writers are locked out while the pages are copied, so stop the service
+    or expect requests to fail with 'database is locked' meanwhile.
+    """
+    messages = integrity_check(snapshot_path)
+    if messages != ['ok']:
+        raise BackupError(f"Snapshot failed integrity check: {'; '.join(messages[:5])}")
+
+    source = sqlite3.connect(snapshot_path)
+    dest = sqlite3.connect(db_path)
+    try:
+        source.backup(dest)
+    finally:
+        dest.close()
+        source.close()
+
+    messages = integrity_check(db_path)
+    if messages != ['ok']:
+        raise BackupError(f"Restored database failed integrity check: {'; '.join(messages[:5])}")
+    logger.info(f"Restored {db_path} from {snapshot_path}")
+    return {'restored_from': snapshot_path, 'path': db_path, 'integrity': 'ok'}
+
+
+class BackupScheduler:
+    """Background thread that takes a snapshot every interval seconds.
+
+    Every worker runs one; the snapshot lock and the age of the newest
+    snapshot keep them from backing up more than once per interval.
+    """
+
+    def __init__(self, db_path, backup_dir, interval, keep=7, step_pages=256, step_sleep=0.01):
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.interval = float(interval)
+        self.keep = keep
+        self.step_pages = step_pages
+        self.step_sleep = step_sleep
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {'snapshots': 0, 'skipped': 0, 'errors': 0, 'last_snapshot': None, 'last_error': None}
+
+    @staticmethod
+    def from_env(db_path):
+        """Scheduler configured by ECOSORT_BACKUP_*, or None when ECOSORT_BACKUP_INTERVAL is unset or 0"""
+        interval = float(os.environ.get('ECOSORT_BACKUP_INTERVAL', 0))
+        if interval <= 0:
+            return None
+        return BackupScheduler(
+            db_path,
+            os.environ.get('ECOSORT_BACKUP_DIR', 'backups'),
+            interval,
+            keep=int(os.environ.get('ECOSORT_BACKUP_KEEP', 7)),
+            step_pages=int(os.environ.get('ECOSORT_BACKUP_STEP_PAGES', 256)),
+            step_sleep=float(os.environ.get('ECOSORT_BACKUP_STEP_SLEEP', 0.01))
+        )
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='backup-scheduler', daemon=True)
+        self._thread.start()
+
+    def run_once(self):
+        """Take a snapshot unless another worker took one during this interval; returns its stats or None"""
+        try:
+            snapshot = create_snapshot(
+                self.db_path, self.backup_dir, self.keep, self.step_pages, self.step_sleep,
+                min_age=self.interval / 2
+            )
+        except BackupInProgress:
+            snapshot = None
+        if snapshot is None:
+            self.stats['skipped'] += 1
+            return None
+        self.stats['snapshots'] += 1
+        self.stats['last_snapshot'] = snapshot
+        return snapshot
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                self.stats['errors'] += 1
+                self.stats['last_error'] = str(e)
+                logger.error(f"Scheduled backup failed: {e}")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['interval_seconds'] = self.interval
+        stats['keep'] = self.keep
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Online backup and restore of the EcoSortAI SQLite database")
+    parser.add_argument('--db', default=os.environ.get('ECOSORT_DB_PATH', 'ecosort.db'), help="SQLite database path")
+    parser.add_argument('--backup-dir', default=os.environ.get('ECOSORT_BACKUP_DIR', 'backups'))
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    snapshot_parser = subcommands.add_parser('snapshot', help="Take a verified snapshot")
+    snapshot_parser.add_argument('--keep', type=int, default=7)
+    snapshot_parser.add_argument('--step-pages', type=int, default=256)
+    snapshot_parser.add_argument('--step-sleep', type=float, default=0.01)
+    subcommands.add_parser('list', help="List snapshots")
+    verify_parser = subcommands.add_parser('verify', help="Run PRAGMA integrity_check on a snapshot")
+    verify_parser.add_argument('snapshot')
+    restore_parser = subcommands.add_parser('restore', help="Restore the database from a snapshot")
+    restore_parser.add_argument('snapshot')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == 'snapshot':
+        stats = create_snapshot(args.db, args.backup_dir, args.keep, args.step_pages, args.step_sleep)
+        print(f"Wrote {stats['path']}: {stats['bytes']} bytes at {stats['throughput_mb_per_second']} MB/s, "
+              f"{stats['steps']} steps, {stats['restarts']} restarts, "
+              f"longest writer pause {stats['max_writer_pause_ms']}ms")
+    elif args.command == 'list':
+        for name, path in list_backups(args.backup_dir, args.db):
+            print(f"{name}\t{os.path.getsize(path)}")
+    elif args.command == 'verify':
+        messages = integrity_check(args.snapshot)
+        print('\n'.join(messages))
+        raise SystemExit(0 if messages == ['ok'] else 1)
+    else:
+        restore_backup(args.snapshot, args.db)
+        print(f"Restored {args.db} from {args.snapshot}; integrity check ok")
+
+
+if __name__ == '__main__':
+    main()
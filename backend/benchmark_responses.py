@@ -0,0 +1,97 @@
+"""
+Bytes and CPU time per classify response body for each response mode.
+
+Compares the original jsonify-style full response, the current full
+response that splices in the card's pre-encoded fields, and the compact
+response with every available serializer, for every knowledge-base
+category:
+
+    python benchmark_responses.py --iterations 100000
+"""
+import argparse
+import json
+import time
+import uuid
+
+from serialization import MSGPACK_AVAILABLE, ORJSON_AVAILABLE, dumps
+
+if ORJSON_AVAILABLE:
+    import orjson
+
+if MSGPACK_AVAILABLE:
+    import msgpack
+
+
+def legacy_body(classification_id, prediction, card):
+    # What jsonify produced before: the whole dict re-encoded on every response
+    return json.dumps({
+        "id": classification_id,
+        "category": prediction['category'],
+        "confidence": prediction['confidence'],
+        "sustainability_score": card.data['score'],
+        "disposal_tips": list(card.data['tips']),
+        "environmental_impact": card.data['impact']
+    }).encode('utf-8')
+
+
+def spliced_body(classification_id, prediction, card):
+    fields = {"id": classification_id, "category": prediction['category'], "confidence": prediction['confidence']}
+    return dumps(fields)[:-1] + b',' + card.classify_fragment + b'}'
+
+
+def compact_fields(classification_id, prediction):
+    return {
+        "id": classification_id,
+        "category": prediction['category'],
+        "confidence": prediction['confidence'],
+        "tip_set_id": 3
+    }
+
+
+def encoders():
+    modes = [
+        ('full (legacy jsonify)', legacy_body),
+        ('full (spliced card)', spliced_body),
+        ('compact json', lambda i, p, c: json.dumps(compact_fields(i, p), separators=(',', ':')).encode('utf-8')),
+    ]
+    if ORJSON_AVAILABLE:
+        modes.append(('compact orjson', lambda i, p, c: orjson.dumps(compact_fields(i, p))))
+    if MSGPACK_AVAILABLE:
+        modes.append(('compact msgpack', lambda i, p, c: msgpack.packb(compact_fields(i, p))))
+    return modes
+
+
+def run(iterations):
+    from models.sustainability_scorer import SustainabilityScorer
+    scorer = SustainabilityScorer()
+    cases = [
+        (str(uuid.uuid4()), {'category': category, 'confidence': 0.8731}, scorer.get_knowledge_card(category))
+        for category in scorer.category_codes
+    ]
+
+    results = []
+    for name, encode in encoders():
+        size = sum(len(encode(*case)) for case in cases) / len(cases)
+        started = time.process_time()
+        for index in range(iterations):
+            encode(*cases[index % len(cases)])
+        cpu = (time.process_time() - started) / iterations
+        results.append((name, size, cpu))
+
+    baseline_size, baseline_cpu = results[0][1], results[0][2]
+    print(f"{'mode':<24}{'bytes':>8}{'cpu us':>10}{'bytes %':>10}{'cpu %':>8}")
+    for name, size, cpu in results:
+        print(f"{name:<24}{size:>8.0f}{cpu * 1e6:>10.2f}"
+              f"{size / baseline_size:>10.0%}{cpu / baseline_cpu:>8.0%}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark classify response encodings")
+    parser.add_argument('--iterations', type=int, default=50000)
+    args = parser.parse_args()
+    run(args.iterations)
+
+
+if __name__ == '__main__':
+    main()
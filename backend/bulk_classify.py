@@ -0,0 +1,319 @@
+"""
+Offline bulk classification of image directories and CSVs of item descriptions.
+
+Inputs are streamed from disk in a fixed order, images are decoded by a
+worker pool while the previous batch is being classified, and each batch is
+classified with one predict_batch call and written in one transaction of
+the configured storage backend (or one Parquet part file). A checkpoint after every batch lets an interrupted
+run resume where it stopped with the same command line.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from PIL import Image
+
+from archive import ARROW_AVAILABLE
+from storage import create_storage
+
+if ARROW_AVAILABLE:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from archive import archive_schema
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+
+# Deterministic ids make a re-written batch recognizable after a crash
+ID_NAMESPACE = uuid.UUID('6f1c6d1e-2b1a-4d8e-9a57-0c5e3f0b7a41')
+
+
+def iter_image_paths(directory):
+    """Image files under directory, recursively, in a stable order"""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(root, name)
+
+
+def iter_texts(csv_path, column):
+    """Values of one CSV column, skipping blank ones"""
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        if column not in (reader.fieldnames or []):
+            raise ValueError(f"Column '{column}' not found in {csv_path}")
+        for row in reader:
+            text = (row[column] or '').strip()
+            if text:
+                yield text
+
+
+def batched(items, batch_size, skip=0):
+    """Yield (index of first item, list of items) batches after skipping already processed items"""
+    batch = []
+    start = skip
+    for index, item in enumerate(items):
+        if index < skip:
+            continue
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield start, batch
+            start += len(batch)
+            batch = []
+    if batch:
+        yield start, batch
+
+
+class Checkpoint:
+    """Items completed per input kind, saved atomically after every written batch"""
+
+    def __init__(self, path, inputs):
+        self.path = path
+        self.inputs = inputs
+        self.done = {}
+
+    def load(self, restart=False):
+        if restart or not os.path.exists(self.path):
+            return
+        with open(self.path, 'r') as f:
+            state = json.load(f)
+        if state.get('inputs') != self.inputs:
+            raise ValueError(f"Checkpoint {self.path} belongs to different inputs; use --restart to discard it")
+        self.done = state.get('done', {})
+
+    def advance(self, kind, count):
+        self.done[kind] = self.done.get(kind, 0) + count
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump({'inputs': self.inputs, 'done': self.done, 'updated_at': datetime.now().isoformat()}, f)
+        os.replace(self.path + '.tmp', self.path)
+
+
+class StorageSink:
+    """Writes each batch in one transaction through a storage backend's insert_many.
+
+    Rows whose deterministic ids already exist are skipped. After a resume
+    only the first batch can have been committed just before the crash, so
+    only it is checked; a run without a checkpoint (new, or --restart) may
+    repeat an earlier run over the same inputs, so every batch is checked.
+    """
+
+    def __init__(self, storage, resumed=False):
+        self.storage = storage
+        self.storage.initialize()
+        self.resumed = resumed
+        self._first_batch = True
+
+    def write(self, kind, start, rows):
+        if not rows:
+            return
+        if self._first_batch or not self.resumed:
+            self._first_batch = False
+            existing = self.storage.existing_ids(row[0] for row in rows)
+            rows = [row for row in rows if row[0] not in existing]
+        if rows:
+            self.storage.insert_many(rows)
+
+    def close(self):
+        self.storage.close()
+
+
+class ParquetSink:
+    """Writes each batch as its own Parquet part file; re-writing a part after a crash replaces it"""
+
+    def __init__(self, output_dir):
+        if not ARROW_AVAILABLE:
+            raise RuntimeError("pyarrow is required for Parquet output")
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self.schema = archive_schema()
+
+    def write(self, kind, start, rows):
+        columns = list(zip(*(
+            (
+                classification_id, timestamp.strftime('%Y-%m-%d %H:%M:%S.%f'), input_type, input_data,
+                category, confidence, score, json.dumps(list(tips))
+            )
+            for classification_id, timestamp, input_type, input_data, category, confidence, score, tips in rows
+        )))
+        table = pa.Table.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+            schema=self.schema
+        )
+        path = os.path.join(self.output_dir, f"part-{kind}-{start:010d}.parquet")
+        pq.write_table(table, path + '.tmp', compression='zstd')
+        os.replace(path + '.tmp', path)
+
+    def close(self):
+        pass
+
+
+class Progress:
+    """Periodic throughput and ETA reporting"""
+
+    def __init__(self, kind, total, already_done, interval=5.0):
+        self.kind = kind
+        self.total = total
+        self.done = already_done
+        self.processed = 0
+        self.errors = 0
+        self.interval = interval
+        self.started = time.perf_counter()
+        self.last_report = self.started
+
+    def update(self, count, errors=0, force=False):
+        self.done += count
+        self.processed += count
+        self.errors += errors
+        now = time.perf_counter()
+        if not force and now - self.last_report < self.interval:
+            return
+        self.last_report = now
+        rate = self.processed / max(now - self.started, 1e-9)
+        message = f"{self.kind}: {self.done}"
+        if self.total is not None:
+            remaining = max(self.total - self.done, 0)
+            eta = remaining / rate if rate else float('inf')
+            message += f"/{self.total} ({self.done / max(self.total, 1):.1%}), ETA {eta / 60:.1f} min"
+        logger.info(f"{message}, {rate:.1f} items/sec, {self.errors} errors")
+
+
+def _decode(path, size):
+    try:
+        img = Image.open(path)
+        # JPEG can decode at a reduced scale close to the model input size
+        img.draft('RGB', (size, size))
+        return img.convert('RGB')
+    except Exception as e:
+        logger.warning(f"Skipping unreadable image {path}: {e}")
+        return None
+
+
+def _rows(kind, start, inputs, predictions, scorer):
+    now = datetime.now()
+    rows = []
+    for offset, (input_data, prediction) in enumerate(zip(inputs, predictions)):
+        if prediction is None:
+            continue
+        data = scorer.get_score(prediction['category'])
+        rows.append((
+            str(uuid.uuid5(ID_NAMESPACE, f"{kind}:{start + offset}:{input_data}")),
+            now, kind, input_data, prediction['category'], prediction['confidence'],
+            data['score'], list(data['tips'])
+        ))
+    return rows
+
+
+def classify_images(directory, classifier, scorer, sink, checkpoint, batch_size, workers, prefetch=2):
+    skip = checkpoint.done.get('image', 0)
+    total = sum(1 for _ in iter_image_paths(directory))
+    progress = Progress('images', total, skip)
+    batches = batched(iter_image_paths(directory), batch_size, skip)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def submit():
+            batch = next(batches, None)
+            if batch is None:
+                return None
+            start, paths = batch
+            return start, paths, [pool.submit(_decode, path, classifier.input_size) for path in paths]
+
+        # Decode upcoming batches while the current one is classified
+        queue = deque(item for item in (submit() for _ in range(prefetch + 1)) if item is not None)
+        while queue:
+            start, paths, futures = queue.popleft()
+            following = submit()
+            if following is not None:
+                queue.append(following)
+
+            images = [future.result() for future in futures]
+            decoded = [index for index, img in enumerate(images) if img is not None]
+            predictions = [None] * len(paths)
+            batch_predictions = classifier.predict_batch([images[index] for index in decoded], batch_size=batch_size)
+            for index, prediction in zip(decoded, batch_predictions):
+                predictions[index] = prediction
+
+            sink.write('image', start, _rows('image', start, paths, predictions, scorer))
+            checkpoint.advance('image', len(paths))
+            progress.update(len(paths), errors=len(paths) - len(decoded))
+    progress.update(0, force=True)
+
+
+def classify_texts(csv_path, column, classifier, scorer, sink, checkpoint, batch_size):
+    skip = checkpoint.done.get('text', 0)
+    total = sum(1 for _ in iter_texts(csv_path, column))
+    progress = Progress('texts', total, skip)
+
+    for start, texts in batched(iter_texts(csv_path, column), batch_size, skip):
+        predictions = classifier.predict_batch(texts)
+        sink.write('text', start, _rows('text', start, texts, predictions, scorer))
+        checkpoint.advance('text', len(texts))
+        progress.update(len(texts))
+    progress.update(0, force=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify image directories and text CSVs in bulk")
+    parser.add_argument('--images', help="Directory of images (searched recursively)")
+    parser.add_argument('--texts', help="CSV file of item descriptions")
+    parser.add_argument('--text-column', default='text', help="CSV column holding the description")
+    parser.add_argument('--output',
+                        help="Database of the ECOSORT_STORAGE backend (default: ECOSORT_DB_PATH, or "
+                             "ECOSORT_DUCKDB_PATH for DuckDB), or a directory for Parquet output")
+    parser.add_argument('--format', choices=['storage', 'parquet'], default='storage',
+                        help="Write through the configured storage backend or as Parquet files")
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4, help="Image decoding threads")
+    parser.add_argument('--checkpoint', help="Checkpoint file (default: <output>.checkpoint.json)")
+    parser.add_argument('--restart', action='store_true', help="Ignore an existing checkpoint")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    if not args.images and not args.texts:
+        parser.error("Provide --images and/or --texts")
+    if args.format == 'parquet' and not args.output:
+        parser.error("--format parquet needs --output")
+
+    inputs = {
+        'images': os.path.abspath(args.images) if args.images else None,
+        'texts': os.path.abspath(args.texts) if args.texts else None,
+        'text_column': args.text_column
+    }
+    storage = create_storage(path=args.output) if args.format == 'storage' else None
+    output = args.output or storage.path
+    checkpoint = Checkpoint(args.checkpoint or output.rstrip('/\\') + '.checkpoint.json', inputs)
+    checkpoint.load(restart=args.restart)
+    if checkpoint.done:
+        logger.info(f"Resuming from checkpoint: {checkpoint.done}")
+
+    from models.sustainability_scorer import SustainabilityScorer
+    scorer = SustainabilityScorer()
+    sink = ParquetSink(args.output) if storage is None else StorageSink(storage, resumed=bool(checkpoint.done))
+
+    try:
+        if args.images:
+            from models.image_classifier import ImageClassifier
+            classify_images(args.images, ImageClassifier(), scorer, sink, checkpoint,
+                            args.batch_size, max(args.workers, 1))
+        if args.texts:
+            from models.text_classifier import TextClassifier
+            classify_texts(args.texts, args.text_column, TextClassifier(), scorer, sink, checkpoint,
+                           args.batch_size)
+    except KeyboardInterrupt:
+        logger.info(f"Interrupted; rerun the same command to resume from {checkpoint.done}")
+        sys.exit(130)
+    finally:
+        sink.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+"""
+Normalized classification schema and its migration.
+
+Categories and disposal tip lists live in small dimension tables, and each
+classification row only stores their integer ids. The classification_details
+view joins them back for readers that want the denormalized columns.
+"""
+import ast
+import json
+import logging
+import threading
+
+from rollups import create_analytics_table, create_rollup_tables, rebuild_rollups, \
+    refresh_analytics_day, rollups_need_backfill, update_rollups
+from shared_counters import CounterStoreFull, counter_key
+from sketches import create_sketch_table
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 1
+
+# Fixed ids for the known categories; unknown categories get the next free id
+DEFAULT_CATEGORIES = ('biodegradable', 'recyclable', 'hazardous')
+
+
+def create_schema(cursor):
+    """Create the normalized tables, indexes and view if they do not exist"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS categories (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+    ''')
+    cursor.executemany(
+        'INSERT OR IGNORE INTO categories (id, name) VALUES (?, ?)',
+        [(index + 1, name) for index, name in enumerate(DEFAULT_CATEGORIES)]
+    )
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tip_sets (
+            id INTEGER PRIMARY KEY,
+            tips TEXT NOT NULL UNIQUE
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS classifications (
+            id TEXT PRIMARY KEY,
+            timestamp DATETIME,
+            input_type TEXT,
+            input_data TEXT,
+            category_id INTEGER REFERENCES categories (id),
+            confidence REAL,
+            sustainability_score REAL,
+            tip_set_id INTEGER REFERENCES tip_sets (id)
+        )
+    ''')
+
+    # Keyset index for range queries and resumable exports
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_classifications_timestamp
+        ON classifications (timestamp, id)
+    ''')
+
+    cursor.execute(f'CREATE VIEW IF NOT EXISTS classification_details AS {details_select()}')
+
+
+def details_select(table='classifications'):
+    """SELECT of the classification_details columns over a classifications table"""
+    return f'''
+        SELECT
+            c.id AS id,
+            c.timestamp AS timestamp,
+            c.input_type AS input_type,
+            c.input_data AS input_data,
+            cat.name AS predicted_category,
+            c.confidence AS confidence,
+            c.sustainability_score AS sustainability_score,
+            t.tips AS disposal_tips
+        FROM {table} c
+        LEFT JOIN categories cat ON cat.id = c.category_id
+        LEFT JOIN tip_sets t ON t.id = c.tip_set_id
+    '''
+
+
+def _normalize_tips(raw):
+    """Convert a stored tips value (JSON, Python list repr or plain text) to canonical JSON"""
+    if raw is None:
+        return None
+    for parse in (json.loads, ast.literal_eval):
+        try:
+            value = parse(raw)
+        except (ValueError, SyntaxError):
+            continue
+        if isinstance(value, (list, tuple)):
+            return json.dumps([str(tip) for tip in value])
+    return json.dumps([raw])
+
+
+def _is_legacy_schema(cursor):
+    cursor.execute('PRAGMA table_info(classifications)')
+    columns = {row[1] for row in cursor.fetchall()}
+    return 'predicted_category' in columns
+
+
+def migrate_schema(conn):
+    """Bring the database to SCHEMA_VERSION, converting legacy denormalized rows"""
+    cursor = conn.cursor()
+    cursor.execute('PRAGMA user_version')
+    if cursor.fetchone()[0] >= SCHEMA_VERSION:
+        create_schema(cursor)
+        conn.commit()
+        return
+
+    if not _is_legacy_schema(cursor):
+        create_schema(cursor)
+        cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        conn.commit()
+        return
+
+    logger.info("Migrating classifications to the normalized schema...")
+    cursor.execute('BEGIN')
+    try:
+        cursor.execute('DROP INDEX IF EXISTS idx_classifications_timestamp')
+        cursor.execute('ALTER TABLE classifications RENAME TO classifications_legacy')
+        create_schema(cursor)
+
+        cursor.execute('''
+            INSERT OR IGNORE INTO categories (name)
+            SELECT DISTINCT predicted_category FROM classifications_legacy
+            WHERE predicted_category IS NOT NULL
+        ''')
+
+        # Tip lists were stored as Python reprs, so canonicalize them in Python;
+        # there are only a handful of distinct values
+        cursor.execute('CREATE TEMP TABLE tip_set_map (raw TEXT PRIMARY KEY, tip_set_id INTEGER)')
+        cursor.execute('SELECT DISTINCT disposal_tips FROM classifications_legacy WHERE disposal_tips IS NOT NULL')
+        for (raw,) in cursor.fetchall():
+            tips = _normalize_tips(raw)
+            cursor.execute('INSERT OR IGNORE INTO tip_sets (tips) VALUES (?)', (tips,))
+            cursor.execute('SELECT id FROM tip_sets WHERE tips = ?', (tips,))
+            cursor.execute('INSERT INTO tip_set_map (raw, tip_set_id) VALUES (?, ?)', (raw, cursor.fetchone()[0]))
+
+        cursor.execute('''
+            INSERT INTO classifications
+            (id, timestamp, input_type, input_data, category_id, confidence, sustainability_score, tip_set_id)
+            SELECT
+                l.id, l.timestamp, l.input_type, l.input_data,
+                cat.id, l.confidence, l.sustainability_score, m.tip_set_id
+            FROM classifications_legacy l
+            LEFT JOIN categories cat ON cat.name = l.predicted_category
+            LEFT JOIN tip_set_map m ON m.raw = l.disposal_tips
+        ''')
+        migrated = cursor.rowcount
+
+        cursor.execute('DROP TABLE tip_set_map')
+        cursor.execute('DROP TABLE classifications_legacy')
+        cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    # Reclaim the space held by the denormalized rows
+    conn.execute('VACUUM')
+    logger.info(f"Migrated {migrated} classifications to the normalized schema")
+
+
+class LookupCache:
+    """Process-wide cache of category and tip-set ids"""
+
+    def __init__(self):
+        self._categories = {}
+        self._tip_sets = {}
+        self._lock = threading.Lock()
+
+    def category_id(self, cursor, name):
+        """Id of a category name, inserting it on first use"""
+        category_id = self._categories.get(name)
+        if category_id is None:
+            cursor.execute('INSERT OR IGNORE INTO categories (name) VALUES (?)', (name,))
+            cursor.execute('SELECT id FROM categories WHERE name = ?', (name,))
+            category_id = cursor.fetchone()[0]
+            with self._lock:
+                self._categories[name] = category_id
+        return category_id
+
+    def tip_set_id(self, cursor, tips):
+        """Id of a tip list, inserting it on first use"""
+        if tips is None:
+            return None
+        key = tuple(tips)
+        tip_set_id = self._tip_sets.get(key)
+        if tip_set_id is None:
+            encoded = json.dumps(list(key))
+            cursor.execute('INSERT OR IGNORE INTO tip_sets (tips) VALUES (?)', (encoded,))
+            cursor.execute('SELECT id FROM tip_sets WHERE tips = ?', (encoded,))
+            tip_set_id = cursor.fetchone()[0]
+            with self._lock:
+                self._tip_sets[key] = tip_set_id
+        return tip_set_id
+
+    def clear(self):
+        with self._lock:
+            self._categories.clear()
+            self._tip_sets.clear()
+
+
+def initialize_database(conn):
+    """Create or migrate every table the backend writes to"""
+    cursor = conn.cursor()
+    migrate_schema(conn)
+    create_analytics_table(cursor)
+    create_rollup_tables(cursor)
+    create_sketch_table(cursor)
+    conn.commit()
+
+    # Backfill rollups for databases created before they existed
+    if rollups_need_backfill(cursor):
+        rebuild_rollups(conn)
+
+
+def store_classifications(conn, lookups, rows, counters=None, table_for=None):
+    """Insert classifications and update rollups and analytics in one transaction.
+
+    rows are (id, timestamp, input_type, input_data, category, confidence,
+    sustainability_score, tips) tuples with datetime timestamps. Returns the
+    tip-set id of each row. With a shared counter store the rollups are left
+    to its flusher and only the rows are written here. table_for maps a row's
+    timestamp to the table it is inserted into (classifications by default).
+    On failure the transaction is rolled back, the lookup cache cleared and
+    the error raised.
+    """
+    cursor = conn.cursor()
+    try:
+        values = [
+            (
+                classification_id, timestamp, input_type, input_data,
+                lookups.category_id(cursor, category),
+                confidence, score,
+                lookups.tip_set_id(cursor, tips)
+            )
+            for classification_id, timestamp, input_type, input_data, category, confidence, score, tips in rows
+        ]
+        tables = {}
+        for value in values:
+            tables.setdefault(table_for(value[1]) if table_for else 'classifications', []).append(value)
+        for table, table_values in tables.items():
+            cursor.executemany(f'''
+                INSERT INTO {table}
+                (id, timestamp, input_type, input_data, category_id, confidence, sustainability_score, tip_set_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', table_values)
+
+        if counters is None:
+            _update_analytics(cursor, rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        # Ids cached during a failed transaction may never have been committed
+        lookups.clear()
+        raise
+
+    if counters is not None:
+        # Counted only once the rows are committed
+        overflow = []
+        for row in rows:
+            timestamp, input_type, category, confidence, score = row[1], row[2], row[4], row[5], row[6]
+            try:
+                counters.add(counter_key(timestamp, input_type, category), 1, confidence, score)
+            except CounterStoreFull as e:
+                logger.warning(f"{e}; updating analytics directly")
+                overflow.append(row)
+        if overflow:
+            _update_analytics(cursor, overflow)
+            conn.commit()
+    return [value[7] for value in values]
+
+
+def _update_analytics(cursor, rows):
+    days = set()
+    for _, timestamp, input_type, _, category, confidence, score, _ in rows:
+        update_rollups(cursor, timestamp, input_type, category, confidence, score)
+        days.add(timestamp.strftime('%Y-%m-%d'))
+    for day in sorted(days):
+        refresh_analytics_day(cursor, day)
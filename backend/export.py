@@ -0,0 +1,165 @@
+"""
+Streaming export of the classifications table.
+
+Rows are read with keyset pagination over (timestamp, id): each chunk is one
+query on its own short-lived connection, starting after the last row of the
+previous chunk. No read transaction stays open while a chunk is sent, so a
+slow client never locks writers out, memory stays constant regardless of the
+size of the export, and any export can be resumed from the last row a client
+received.
+"""
+import base64
+import csv
+import io
+import itertools
+import json
+import sqlite3
+import zlib
+from datetime import datetime, timedelta
+
+EXPORT_COLUMNS = (
+    'id', 'timestamp', 'input_type', 'input_data', 'predicted_category',
+    'confidence', 'sustainability_score', 'disposal_tips'
+)
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+
+def encode_cursor(timestamp, row_id):
+    """Opaque resume token for the row (timestamp, id)"""
+    raw = json.dumps([timestamp, row_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Decode a resume token back into (timestamp, id); raises ValueError when malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        timestamp, row_id = json.loads(raw)
+    except Exception:
+        raise ValueError("Invalid export cursor")
+    if not isinstance(timestamp, str) or not isinstance(row_id, str):
+        raise ValueError("Invalid export cursor")
+    return timestamp, row_id
+
+
+def day_bounds(start_date=None, end_date=None):
+    """Timestamp bounds [low, high) for inclusive YYYY-MM-DD dates; None means unbounded"""
+    low = f"{datetime.strptime(start_date, '%Y-%m-%d'):%Y-%m-%d} 00:00:00" if start_date else None
+    high = None
+    if end_date:
+        high = f"{datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1):%Y-%m-%d} 00:00:00"
+    return low, high
+
+
+def iter_rows(db_path, start_date=None, end_date=None, after=None, chunk_size=1000):
+    """Yield lists of at most chunk_size rows ordered by (timestamp, id)"""
+    return iter_keyset_rows(
+        lambda: sqlite3.connect(db_path), start_date, end_date, after=after, chunk_size=chunk_size
+    )
+
+
+def iter_keyset_rows(connect, start_date=None, end_date=None, after=None, chunk_size=1000):
+    """iter_rows over the classification_details view of the connections connect() opens.
+
+    Each chunk is read on a new connection that is closed before the chunk
+    is yielded.
+    """
+    low, high = day_bounds(start_date, end_date)
+
+    conditions = []
+    params = []
+    if low:
+        conditions.append('timestamp >= ?')
+        params.append(low)
+    if high:
+        conditions.append('timestamp < ?')
+        params.append(high)
+
+    while True:
+        keyset = list(conditions)
+        keyset_params = list(params)
+        if after:
+            keyset.append('(timestamp, id) > (?, ?)')
+            keyset_params.extend(after)
+        where = f"WHERE {' AND '.join(keyset)}" if keyset else ''
+
+        conn = connect()
+        try:
+            rows = conn.execute(f'''
+                SELECT {', '.join(EXPORT_COLUMNS)}
+                FROM classification_details
+                {where}
+                ORDER BY timestamp, id
+                LIMIT ?
+            ''', keyset_params + [chunk_size]).fetchall()
+        finally:
+            conn.close()
+
+        if not rows:
+            break
+        yield rows
+        if len(rows) < chunk_size:
+            break
+        after = (rows[-1][1], rows[-1][0])
+
+
+def ndjson_chunks(row_chunks):
+    """Encode row chunks as NDJSON, with a {"_cursor": ...} resume record after each chunk"""
+    for rows in row_chunks:
+        lines = [json.dumps(dict(zip(EXPORT_COLUMNS, row)), separators=(',', ':')) for row in rows]
+        last = rows[-1]
+        lines.append(json.dumps({'_cursor': encode_cursor(last[1], last[0])}))
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def csv_chunks(row_chunks, include_header=True):
+    """Encode row chunks as CSV"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if include_header:
+        writer.writerow(EXPORT_COLUMNS)
+
+    for rows in row_chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate(0)
+
+    # Header-only export when there were no rows
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress a byte stream into a single gzip member chunk by chunk"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_stream(storage, export_format, start_date=None, end_date=None, after=None,
+                  compress=False, chunk_size=1000, archive_reader=None):
+    """Full export byte stream of a storage backend for the given format and range.
+
+    When archive_reader is given, archived rows (which are all older than the
+    live ones) are streamed first.
+    """
+    row_chunks = storage.iter_export_rows(start_date, end_date, after=after, chunk_size=chunk_size)
+    if archive_reader is not None:
+        row_chunks = itertools.chain(
+            archive_reader.iter_rows(start_date, end_date, after=after, chunk_size=chunk_size),
+            row_chunks
+        )
+    if export_format == 'ndjson':
+        chunks = ndjson_chunks(row_chunks)
+    else:
+        # Resumed CSV exports skip the header so parts can be concatenated
+        chunks = csv_chunks(row_chunks, include_header=after is None)
+    return gzip_chunks(chunks) if compress else chunks
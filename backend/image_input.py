@@ -0,0 +1,90 @@
+"""
+Compact image inputs for /classify/image.
+
+Edge devices that resize on-device can send the model input directly as a
+raw RGB uint8 tensor (optionally zlib/gzip compressed), either as the
+request body or base64-encoded in JSON, so the server skips image decoding
+and resizing. Every payload is checked against the exact expected shape.
+"""
+import base64
+import binascii
+import zlib
+
+import numpy as np
+
+RAW_TENSOR_MIMETYPES = ('application/octet-stream', 'application/x-ecosort-rgb')
+
+# Bytes accepted before decompression; a raw 224x224x3 tensor is 150528 bytes
+MAX_PAYLOAD_BYTES = 10 * 1024 * 1024
+
+# zlib wbits per compression name; 47 auto-detects zlib or gzip headers
+COMPRESSION_WBITS = {'zlib': 15, 'deflate': 15, 'gzip': 31, 'auto': 47}
+
+
+class PayloadError(ValueError):
+    """Malformed compact image payload; reported to the client as a 400"""
+
+
+def decompress(data, compression, expected_size):
+    """Inflate data, reading at most one byte more than expected so oversized payloads fail fast"""
+    if compression in (None, '', 'identity', 'none'):
+        return data
+    wbits = COMPRESSION_WBITS.get(compression)
+    if wbits is None:
+        raise PayloadError(f"Unsupported compression '{compression}'")
+    try:
+        decompressor = zlib.decompressobj(wbits)
+        raw = decompressor.decompress(data, expected_size + 1)
+    except zlib.error as e:
+        raise PayloadError(f"Invalid {compression} data: {e}")
+    if len(raw) > expected_size or decompressor.unconsumed_tail:
+        raise PayloadError(f"Decompressed tensor is larger than {expected_size} bytes")
+    return raw
+
+
+def parse_shape(value):
+    """Parse '224,224,3' / '224x224x3' / [224, 224, 3] into a tuple of ints"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.replace('x', ',').split(',')
+    try:
+        return tuple(int(dimension) for dimension in value)
+    except (TypeError, ValueError):
+        raise PayloadError(f"Invalid shape {value!r}")
+
+
+def tensor_from_bytes(data, input_size, shape=None, compression=None):
+    """Validate and wrap raw RGB bytes as a (input_size, input_size, 3) uint8 array without copying"""
+    expected_shape = (input_size, input_size, 3)
+    if shape is not None and tuple(shape) != expected_shape:
+        raise PayloadError(f"Expected shape {list(expected_shape)}, got {list(shape)}")
+    if len(data) > MAX_PAYLOAD_BYTES:
+        raise PayloadError(f"Payload larger than {MAX_PAYLOAD_BYTES} bytes")
+
+    expected_size = input_size * input_size * 3
+    raw = decompress(data, compression, expected_size)
+    if len(raw) != expected_size:
+        raise PayloadError(
+            f"Expected {expected_size} bytes for a {input_size}x{input_size}x3 uint8 tensor, got {len(raw)}"
+        )
+    return np.frombuffer(raw, dtype=np.uint8).reshape(expected_shape)
+
+
+def tensor_from_json(payload, input_size):
+    """Decode {"tensor": <base64>, "shape": [h, w, 3], "compression": "zlib"} into an array.
+
+    Returns (array, payload bytes) so callers can key caches on the bytes.
+    """
+    if not isinstance(payload, dict) or not isinstance(payload.get('tensor'), str):
+        raise PayloadError("JSON body must contain a base64 'tensor' string")
+    shape = parse_shape(payload.get('shape'))
+    if shape is None:
+        raise PayloadError("JSON body must contain 'shape'")
+    if payload.get('dtype', 'uint8') != 'uint8':
+        raise PayloadError("Only uint8 tensors are supported")
+    try:
+        data = base64.b64decode(payload['tensor'], validate=True)
+    except (binascii.Error, ValueError) as e:
+        raise PayloadError(f"Invalid base64 tensor: {e}")
+    return tensor_from_bytes(data, input_size, shape, payload.get('compression')), data
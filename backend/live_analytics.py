@@ -0,0 +1,190 @@
+"""
+In-process publish/subscribe of classification counter deltas for the
+/analytics/stream server-sent events endpoint.
+
+Every stored classification is published once as a small delta and copied
+into each subscriber's bounded buffer, so connected dashboards cost no
+database work after their initial /analytics snapshot. A subscriber that
+falls behind by more than its buffer loses the buffered deltas and gets a
+resync event telling it to fetch a fresh snapshot instead.
+
+Each delta's event id is its sequence number. A snapshot taken inside
+snapshot() reports the sequence it includes, and the ready event reports
+the sequence a subscription starts after. A dashboard applies only deltas
+above its snapshot's sequence, and refetches when the snapshot is older
+than the subscription.
+
+The broker lives in one process and sees only the classifications stored
+by that process. Live dashboards therefore need a single worker process
+(with threads for the open connections), not several worker processes.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+def format_event(event, data, event_id=None):
+    """One server-sent event in wire format"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return '\n'.join(lines) + '\n\n'
+
+
+class Subscription:
+    """Bounded queue of (sequence, delta) pairs for one connected dashboard"""
+
+    def __init__(self, max_buffer, sequence=0):
+        self.buffer = deque()
+        # Deltas up to this sequence were published before the subscription
+        self.sequence = sequence
+        self.max_buffer = max_buffer
+        self.overflowed = False
+        self.closed = False
+
+
+class AnalyticsBroker:
+    """Fans classification deltas out to live dashboard subscribers"""
+
+    def __init__(self, max_subscribers=500, max_buffer=256, heartbeat_interval=15.0):
+        self.max_subscribers = max(int(max_subscribers), 1)
+        self.max_buffer = max(int(max_buffer), 1)
+        self.heartbeat_interval = float(heartbeat_interval)
+        self._condition = threading.Condition()
+        self._subscribers = set()
+        self._sequence = 0
+        self._publishing = 0
+        self._snapshotting = 0
+        self.stats = {'published': 0, 'delivered': 0, 'overflows': 0, 'rejected': 0, 'connections': 0}
+
+    @classmethod
+    def from_env(cls):
+        """Build a broker from ECOSORT_SSE_* environment variables"""
+        return cls(
+            max_subscribers=int(os.environ.get('ECOSORT_SSE_MAX_SUBSCRIBERS', 500)),
+            max_buffer=int(os.environ.get('ECOSORT_SSE_BUFFER', 256)),
+            heartbeat_interval=float(os.environ.get('ECOSORT_SSE_HEARTBEAT', 15.0))
+        )
+
+    def publish(self, timestamp, input_type, category, confidence, score):
+        """Queue the counter delta of one stored classification for every subscriber"""
+        delta = {
+            'date': timestamp.strftime('%Y-%m-%d'),
+            'input_type': input_type,
+            'category': category,
+            'confidence': confidence,
+            'sustainability_score': score
+        }
+        with self._condition:
+            self._sequence += 1
+            self.stats['published'] += 1
+            if not self._subscribers:
+                return
+            for subscription in self._subscribers:
+                if subscription.overflowed:
+                    continue
+                if len(subscription.buffer) >= subscription.max_buffer:
+                    # The client's counters can no longer be kept exact; it refetches instead
+                    subscription.buffer.clear()
+                    subscription.overflowed = True
+                    self.stats['overflows'] += 1
+                else:
+                    subscription.buffer.append((self._sequence, delta))
+            self._condition.notify_all()
+
+    @contextmanager
+    def publishing(self):
+        """Hold around storing a classification and publishing it, so a snapshot sees both or neither"""
+        with self._condition:
+            while self._snapshotting:
+                self._condition.wait()
+            self._publishing += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._publishing -= 1
+                if not self._publishing:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def snapshot(self):
+        """Hold publishing back while the caller reads a snapshot; yields the last sequence it includes"""
+        with self._condition:
+            self._snapshotting += 1
+            while self._publishing:
+                self._condition.wait()
+            sequence = self._sequence
+        try:
+            yield sequence
+        finally:
+            with self._condition:
+                self._snapshotting -= 1
+                self._condition.notify_all()
+
+    def subscribe(self):
+        """A new Subscription, or None when max_subscribers dashboards are already connected"""
+        with self._condition:
+            if len(self._subscribers) >= self.max_subscribers:
+                self.stats['rejected'] += 1
+                return None
+            subscription = Subscription(self.max_buffer, self._sequence)
+            self._subscribers.add(subscription)
+            self.stats['connections'] += 1
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self._condition:
+            subscription.closed = True
+            self._subscribers.discard(subscription)
+            self._condition.notify_all()
+
+    def stream(self, subscription):
+        """Server-sent events for a subscription: deltas, resyncs and heartbeat comments.
+
+        Heartbeats keep proxies from closing idle connections and let the
+        server notice disconnected clients, which unsubscribes them.
+        """
+        try:
+            yield 'retry: 3000\n\n'
+            yield format_event('ready', {
+                'heartbeat_interval': self.heartbeat_interval,
+                'sequence': subscription.sequence
+            })
+            while True:
+                deadline = time.monotonic() + self.heartbeat_interval
+                with self._condition:
+                    while not (subscription.buffer or subscription.overflowed or subscription.closed):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._condition.wait(remaining)
+                    if subscription.closed:
+                        return
+                    events = list(subscription.buffer)
+                    subscription.buffer.clear()
+                    overflowed, subscription.overflowed = subscription.overflowed, False
+                    self.stats['delivered'] += len(events)
+
+                if overflowed:
+                    yield format_event('resync', {'reason': 'buffer_overflow'})
+                elif events:
+                    yield ''.join(format_event('delta', delta, sequence) for sequence, delta in events)
+                else:
+                    yield ': heartbeat\n\n'
+        finally:
+            self.unsubscribe(subscription)
+
+    def get_stats(self):
+        with self._condition:
+            stats = dict(self.stats)
+            stats['subscribers'] = len(self._subscribers)
+            stats['buffered'] = sum(len(subscription.buffer) for subscription in self._subscribers)
+        stats['max_subscribers'] = self.max_subscribers
+        stats['max_buffer'] = self.max_buffer
+        return stats
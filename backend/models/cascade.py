@@ -0,0 +1,93 @@
+import threading
+import numpy as np
+from PIL import Image
+
+# Written by models/calibrate_cascade.py, relative to the backend directory like the model files
+CASCADE_STAGE_PATH = 'models/cascade_color_stage.npz'
+
+THUMBNAIL_SIZE = 32
+HUE_BINS = 12
+TONE_BINS = 4
+
+def color_features(img):
+    """Cheap color statistics of a thumbnail: HSV histograms plus RGB mean and spread"""
+    thumbnail = img.convert('RGB').resize((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.BILINEAR)
+    rgb = np.asarray(thumbnail, dtype=np.float32).reshape(-1, 3) / 255.0
+    hsv = np.asarray(thumbnail.convert('HSV'), dtype=np.float32).reshape(-1, 3) / 255.0
+    
+    # Weight hue by saturation so grey pixels do not vote for a hue
+    hue = np.histogram(hsv[:, 0], bins=HUE_BINS, range=(0.0, 1.0), weights=hsv[:, 1])[0]
+    hue = hue / max(hue.sum(), 1e-6)
+    saturation = np.histogram(hsv[:, 1], bins=TONE_BINS, range=(0.0, 1.0))[0] / len(hsv)
+    value = np.histogram(hsv[:, 2], bins=TONE_BINS, range=(0.0, 1.0))[0] / len(hsv)
+    
+    return np.concatenate([hue, saturation, value, rgb.mean(axis=0), rgb.std(axis=0)]).astype(np.float32)
+
+class ColorStatsStage:
+    """First cascade stage: multinomial logistic regression over color_features"""
+    
+    def __init__(self, categories, mean, scale, coef, intercept, threshold, calibration=None):
+        self.categories = list(categories)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+        self.coef = np.asarray(coef, dtype=np.float32)
+        self.intercept = np.asarray(intercept, dtype=np.float32)
+        self.threshold = float(threshold)
+        # Validation figures recorded when the threshold was calibrated
+        self.calibration = calibration or {}
+    
+    @classmethod
+    def load(cls, path=CASCADE_STAGE_PATH):
+        data = np.load(path)
+        calibration = {
+            key[len('calibration_'):]: float(data[key])
+            for key in data.files if key.startswith('calibration_')
+        }
+        return cls(
+            [str(category) for category in data['categories']],
+            data['mean'], data['scale'], data['coef'], data['intercept'],
+            data['threshold'], calibration
+        )
+    
+    def save(self, path=CASCADE_STAGE_PATH):
+        np.savez(
+            path,
+            categories=np.array(self.categories),
+            mean=self.mean,
+            scale=self.scale,
+            coef=self.coef,
+            intercept=self.intercept,
+            threshold=np.float64(self.threshold),
+            **{f"calibration_{key}": np.float64(value) for key, value in self.calibration.items()}
+        )
+    
+    def predict_proba_features(self, features):
+        """Class probabilities for a (n, feature_dim) feature matrix"""
+        logits = ((np.atleast_2d(features) - self.mean) / self.scale) @ self.coef.T + self.intercept
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+    
+    def predict_proba(self, img):
+        return self.predict_proba_features(color_features(img))[0]
+
+class CascadeStats:
+    """Thread-safe count of which stage answered each request"""
+    
+    def __init__(self, stages):
+        self._lock = threading.Lock()
+        self.counts = {stage: 0 for stage in stages}
+    
+    def record(self, stage):
+        with self._lock:
+            self.counts[stage] += 1
+    
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self.counts)
+        total = sum(counts.values())
+        return {
+            'requests': total,
+            'counts': counts,
+            'hit_rates': {stage: count / total if total else 0.0 for stage, count in counts.items()}
+        }
@@ -2,6 +2,9 @@ import numpy as np
 from PIL import Image
 import os
 
+from models.cascade import CASCADE_STAGE_PATH, CascadeStats, ColorStatsStage
+from models.perceptual_cache import PerceptualCache
+
 # Check TensorFlow availability without importing it immediately
 TF_AVAILABLE = False
 try:
@@ -10,15 +13,69 @@ try:
 except ImportError:
     print("TensorFlow not available, using fallback classification")
 
+# Model variants selectable with ECOSORT_IMAGE_MODEL: (model file, input size).
+# 'student' is the compact model written by models/distill_image_model.py
+MODEL_VARIANTS = {
+    'full': ('models/waste_classifier_model.h5', 224),
+    'student': ('models/waste_classifier_student.h5', 160)
+}
+
 class ImageClassifier:
-    def __init__(self):
+    def __init__(self, variant=None, cascade=None, perceptual_cache=None):
         self.model = None
         self.categories = ['biodegradable', 'recyclable', 'hazardous']
+        self.variant = (variant or os.environ.get('ECOSORT_IMAGE_MODEL', 'full')).lower()
+        if self.variant not in MODEL_VARIANTS:
+            print(f"Unknown image model variant '{self.variant}', using 'full'")
+            self.variant = 'full'
+        self.input_size = MODEL_VARIANTS[self.variant][1]
         self.tf_available = TF_AVAILABLE
         if self.tf_available:
             self.load_model()
         else:
             print("TensorFlow not available, using fallback image classification")
+        
+        # Optional cheap first stage that answers confident images without the full model
+        if cascade is None:
+            cascade = os.environ.get('ECOSORT_IMAGE_CASCADE', '').lower() in ('1', 'true', 'yes')
+        self.cascade_stage = self.load_cascade_stage() if cascade else None
+        self.cascade_stats = CascadeStats(['color_stats', 'model'])
+        
+        # Optional near-duplicate result cache keyed by perceptual hash
+        if perceptual_cache is None:
+            perceptual_cache = os.environ.get('ECOSORT_PHASH_CACHE', '').lower() in ('1', 'true', 'yes')
+        self.perceptual_cache = PerceptualCache(
+            radius=int(os.environ.get('ECOSORT_PHASH_RADIUS', 4)),
+            max_entries=int(os.environ.get('ECOSORT_PHASH_MAX_ENTRIES', 10000)),
+            min_confidence=float(os.environ.get('ECOSORT_PHASH_MIN_CONFIDENCE', 0.8))
+        ) if perceptual_cache else None
+    
+    def load_cascade_stage(self):
+        """Load the calibrated color-statistics stage, if one has been calibrated"""
+        if not os.path.exists(CASCADE_STAGE_PATH):
+            print(f"No cascade stage found at {CASCADE_STAGE_PATH}, cascade disabled")
+            return None
+        try:
+            stage = ColorStatsStage.load(CASCADE_STAGE_PATH)
+        except Exception as e:
+            print(f"Error loading cascade stage: {e}, cascade disabled")
+            return None
+        if stage.categories != self.categories:
+            print("Cascade stage categories do not match the classifier, cascade disabled")
+            return None
+        if os.environ.get('ECOSORT_CASCADE_THRESHOLD'):
+            stage.threshold = float(os.environ['ECOSORT_CASCADE_THRESHOLD'])
+        print(f"Image cascade enabled (threshold {stage.threshold:.2f})")
+        return stage
+    
+    def get_cascade_stats(self):
+        """Per-stage hit rates since startup plus the calibrated accuracy figures"""
+        stats = self.cascade_stats.snapshot()
+        stats['enabled'] = self.cascade_stage is not None
+        if self.cascade_stage is not None:
+            stats['threshold'] = self.cascade_stage.threshold
+            stats['calibration'] = self.cascade_stage.calibration
+        return stats
     
     def load_model(self):
         """Load the pre-trained model or create a new one"""
@@ -32,12 +89,18 @@ class ImageClassifier:
             self.tf_available = False
             return
             
-        model_path = 'models/waste_classifier_model.h5'
+        model_path, self.input_size = MODEL_VARIANTS[self.variant]
+        if self.variant != 'full' and not os.path.exists(model_path):
+            print(f"No {self.variant} model found at {model_path}, using the full model")
+            self.variant = 'full'
+            model_path, self.input_size = MODEL_VARIANTS['full']
         
         if os.path.exists(model_path):
             try:
                 self.model = tf.keras.models.load_model(model_path)
-                print("Loaded pre-trained waste classification model")
+                # Trust the saved input shape over the variant default
+                self.input_size = self.model.input_shape[1] or self.input_size
+                print(f"Loaded pre-trained waste classification model ({self.variant})")
             except Exception as e:
                 print(f"Error loading model: {e}, creating new one")
                 self.create_model()
@@ -58,6 +121,7 @@ class ImageClassifier:
             
             # Load pre-trained MobileNetV2
             base_model = MobileNetV2(weights='imagenet', include_top=False, input_shape=(224, 224, 3))
+            self.variant, self.input_size = 'full', 224
             
             # Freeze the base model layers
             for layer in base_model.layers:
@@ -95,8 +159,9 @@ class ImageClassifier:
         try:
             from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
             
-            # Resize image to 224x224
-            img = img.resize((224, 224))
+            # Resize image to the model input size (pre-resized tensors skip this)
+            if img.size != (self.input_size, self.input_size):
+                img = img.resize((self.input_size, self.input_size))
             
             # Convert to array and expand dimensions
             img_array = np.array(img)
@@ -110,8 +175,140 @@ class ImageClassifier:
             print(f"Error preprocessing image: {e}")
             return None
     
-    def predict(self, img):
-        """Predict waste category from image"""
+    def get_perceptual_cache_stats(self):
+        """Hit rate and settings of the near-duplicate cache"""
+        if self.perceptual_cache is None:
+            return {'enabled': False}
+        return {'enabled': True, **self.perceptual_cache.get_stats()}
+    
+    def lookup(self, img):
+        """Perceptual hash of img and the cached prediction of a near-duplicate, if any.
+        
+        Returns (None, None) when the perceptual cache is off. Callers under
+        admission control look up before taking a slot, so cache hits never
+        count as model load.
+        """
+        if self.perceptual_cache is None:
+            return None, None
+        key = self.perceptual_cache.hash(img)
+        return key, self.perceptual_cache.get(key)
+    
+    def predict(self, img, degraded=False, key=None):
+        """Predict waste category from image.
+        
+        degraded=True (set by admission control under overload) skips the
+        neural model and answers from the cheapest engine available. key is
+        the hash from a lookup() that missed; predict then skips its own
+        lookup and caches the result under it.
+        """
+        if self.perceptual_cache is None:
+            return self._predict_uncached(img, degraded)
+        
+        # A near-duplicate of an earlier image reuses its prediction
+        if key is None:
+            key, cached = self.lookup(img)
+            if cached is not None:
+                return cached
+        
+        prediction = self._predict_uncached(img, degraded)
+        if not degraded:
+            self.perceptual_cache.put(key, prediction)
+        return prediction
+    
+    def image_from_array(self, array):
+        """PIL image of an RGB uint8 array already at the model input size"""
+        array = np.asarray(array)
+        expected_shape = (self.input_size, self.input_size, 3)
+        if array.shape != expected_shape or array.dtype != np.uint8:
+            raise ValueError(f"Expected a uint8 array of shape {expected_shape}, "
+                             f"got {array.dtype} {array.shape}")
+        return Image.fromarray(array, 'RGB')
+    
+    def predict_array(self, array, degraded=False):
+        """Predict from an RGB uint8 array already at the model input size, skipping decode and resize"""
+        return self.predict(self.image_from_array(array), degraded=degraded)
+    
+    def predict_batch(self, images, batch_size=32):
+        """Predict a list of images, sharing model forward passes.
+        
+        Cache hits and confident cascade answers are resolved per image as in
+        predict; the remaining images go through the model batch_size at a time.
+        """
+        results = [None] * len(images)
+        keys = [None] * len(images)
+        computed = []
+        pending = []
+        
+        for index, img in enumerate(images):
+            if self.perceptual_cache is not None:
+                keys[index] = self.perceptual_cache.hash(img)
+                results[index] = self.perceptual_cache.get(keys[index])
+                if results[index] is not None:
+                    continue
+            computed.append(index)
+            
+            if self.cascade_stage is not None:
+                probabilities = self.cascade_stage.predict_proba(img)
+                if probabilities.max() >= self.cascade_stage.threshold:
+                    self.cascade_stats.record('color_stats')
+                    results[index] = self._prediction_from_probabilities(probabilities)
+                    continue
+                self.cascade_stats.record('model')
+            pending.append(index)
+        
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            for index, prediction in zip(chunk, self._predict_model_batch([images[i] for i in chunk])):
+                results[index] = prediction
+        
+        if self.perceptual_cache is not None:
+            for index in computed:
+                self.perceptual_cache.put(keys[index], results[index])
+        return results
+    
+    def _predict_model_batch(self, images):
+        """Full-model predictions for a list of images in one forward pass"""
+        if not self.tf_available or self.model is None:
+            return [self._fallback_prediction(img) for img in images]
+        
+        try:
+            processed = [self.preprocess_image(img) for img in images]
+            if any(array is None for array in processed):
+                return [self._fallback_prediction(img) for img in images]
+            
+            predictions = self.model.predict(np.concatenate(processed), verbose=0)
+            return [self._prediction_from_probabilities(probabilities) for probabilities in predictions]
+        except Exception as e:
+            print(f"Error in batch image prediction: {e}")
+            return [self._fallback_prediction(img) for img in images]
+    
+    def _predict_uncached(self, img, degraded=False):
+        if degraded:
+            if self.cascade_stage is not None:
+                return self._prediction_from_probabilities(self.cascade_stage.predict_proba(img))
+            return self._fallback_prediction(img)
+        
+        if self.cascade_stage is not None:
+            probabilities = self.cascade_stage.predict_proba(img)
+            if probabilities.max() >= self.cascade_stage.threshold:
+                self.cascade_stats.record('color_stats')
+                return self._prediction_from_probabilities(probabilities)
+            self.cascade_stats.record('model')
+        
+        return self._predict_model(img)
+    
+    def _prediction_from_probabilities(self, probabilities):
+        predicted_class = int(np.argmax(probabilities))
+        return {
+            'category': self.categories[predicted_class],
+            'confidence': float(probabilities[predicted_class]),
+            'all_probabilities': {
+                cat: float(prob) for cat, prob in zip(self.categories, probabilities)
+            }
+        }
+    
+    def _predict_model(self, img):
+        """Full-model prediction, or the fallback when no model is loaded"""
         if not self.tf_available or self.model is None:
             return self._fallback_prediction(img)
             
@@ -0,0 +1,126 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+from PIL import Image
+
+def dhash(img, hash_size=8):
+    """Difference hash: brightness gradients of a tiny grayscale thumbnail as a hash_size**2-bit int.
+    
+    Resizing, re-encoding and small exposure changes leave most bits intact,
+    so near-duplicate photos end up a small Hamming distance apart.
+    """
+    thumbnail = img.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = np.asarray(thumbnail, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+class BKTree:
+    """Burkhard-Keller tree over integer hashes under Hamming distance"""
+    
+    def __init__(self):
+        self.root = None
+        self.size = 0
+    
+    def add(self, key):
+        if self.root is None:
+            self.root = (key, {})
+            self.size = 1
+            return
+        node = self.root
+        while True:
+            distance = hamming(key, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (key, {})
+                self.size += 1
+                return
+            node = child
+    
+    def search(self, key, radius):
+        """(distance, key) pairs within radius, nearest first"""
+        if self.root is None:
+            return []
+        found = []
+        stack = [self.root]
+        while stack:
+            node_key, children = stack.pop()
+            distance = hamming(key, node_key)
+            if distance <= radius:
+                found.append((distance, node_key))
+            # Triangle inequality: only subtrees at distance d +- radius can match
+            for child_distance, child in children.items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        found.sort()
+        return found
+
+class PerceptualCache:
+    """LRU cache of image predictions looked up by dHash within a Hamming radius.
+    
+    A larger radius catches more re-encoded or cropped copies but risks
+    returning another item's prediction; min_confidence keeps uncertain
+    predictions out of the cache so they are never propagated.
+    """
+    
+    def __init__(self, radius=4, max_entries=10000, min_confidence=0.0, hash_size=8):
+        self.radius = int(radius)
+        self.max_entries = max(int(max_entries), 1)
+        self.min_confidence = float(min_confidence)
+        self.hash_size = hash_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._tree = BKTree()
+        self.stats = {'hits': 0, 'exact_hits': 0, 'misses': 0, 'stored': 0, 'evicted': 0, 'hit_distance_sum': 0}
+    
+    def hash(self, img):
+        return dhash(img, self.hash_size)
+    
+    def get(self, key):
+        """Cached prediction of the nearest stored hash within the radius, or None"""
+        with self._lock:
+            for distance, neighbor in self._tree.search(key, self.radius):
+                # The tree keeps evicted keys until the next rebuild; skip them
+                if neighbor in self._entries:
+                    self._entries.move_to_end(neighbor)
+                    self.stats['hits'] += 1
+                    self.stats['exact_hits'] += distance == 0
+                    self.stats['hit_distance_sum'] += distance
+                    return self._entries[neighbor]
+            self.stats['misses'] += 1
+            return None
+    
+    def put(self, key, prediction):
+        if prediction['confidence'] < self.min_confidence:
+            return
+        with self._lock:
+            if key not in self._entries:
+                self._tree.add(key)
+                self.stats['stored'] += 1
+            self._entries[key] = prediction
+            self._entries.move_to_end(key)
+            
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evicted'] += 1
+            
+            # BK-trees cannot delete, so rebuild once evicted keys dominate
+            if self._tree.size > 2 * self.max_entries:
+                self._tree = BKTree()
+                for entry in self._entries:
+                    self._tree.add(entry)
+    
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['mean_hit_distance'] = stats.pop('hit_distance_sum') / stats['hits'] if stats['hits'] else 0.0
+        stats['radius'] = self.radius
+        stats['min_confidence'] = self.min_confidence
+        return stats
@@ -1,90 +1,238 @@
 import json
 import os
+import hashlib
+import threading
+import time
+from types import MappingProxyType
+import numpy as np
+
+try:
+    import tomllib
+    TOML_AVAILABLE = True
+except ImportError:
+    TOML_AVAILABLE = False
+
+DEFAULT_KNOWLEDGE_BASE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'sustainability_kb.json'
+)
+
+# Item condition codes accepted by calculate_eco_scores; anything else scores as 'none'
+CONDITION_CODES = ('none', 'damaged', 'contaminated')
+
+# Fields every category entry in the knowledge base must define
+REQUIRED_FIELDS = ('score', 'impact', 'tips')
+
+
+def _freeze(value):
+    """Recursively convert dicts to read-only mappings and lists to tuples"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _thaw(value):
+    """Plain dict/list copy of a frozen value, for JSON encoding"""
+    if isinstance(value, MappingProxyType):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(item) for item in value]
+    return value
+
+
+def _encode(value):
+    return json.dumps(_thaw(value), separators=(',', ':')).encode('utf-8')
+
+
+class KnowledgeCard:
+    """Everything known about one category, with its JSON encodings built once"""
+
+    def __init__(self, category, data):
+        self.category = category
+        self.data = data
+        self.body = _encode(data)
+        self.etag = hashlib.sha1(self.body).hexdigest()
+        # Members shared by every classify response for this category, without braces
+        self.classify_fragment = _encode({
+            'sustainability_score': data['score'],
+            'disposal_tips': data['tips'],
+            'environmental_impact': data['impact']
+        })[1:-1]
+
+
+class CompiledKnowledge:
+    """Immutable lookup tables and cards for one knowledge base version and region"""
+
+    def __init__(self, version, categories, default, region=None):
+        self.version = version
+        self.region = region
+        self.sustainability_data = _freeze(categories)
+        self.default_data = _freeze(default)
+
+        self.knowledge_cards = {
+            category: KnowledgeCard(category, _freeze({'category': category, **data}))
+            for category, data in categories.items()
+        }
+        self.default_card = KnowledgeCard('unknown', _freeze({'category': 'unknown', **default}))
+
+        # Category codes index base_scores; the extra last slot holds the unknown default
+        self.category_codes = tuple(categories)
+        self.category_index = {category: code for code, category in enumerate(self.category_codes)}
+        self.base_scores = np.array(
+            [categories[category]['score'] for category in self.category_codes] + [default['score']],
+            dtype=np.float64
+        )
+
+
+def load_knowledge_file(path):
+    """Read a knowledge base file (JSON, or TOML when tomllib is available)"""
+    if path.endswith('.toml'):
+        if not TOML_AVAILABLE:
+            raise ValueError("TOML knowledge bases require Python 3.11+")
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _validate_category(name, data):
+    for field in REQUIRED_FIELDS:
+        if field not in data:
+            raise ValueError(f"Category '{name}' is missing '{field}'")
+    if not isinstance(data['score'], (int, float)):
+        raise ValueError(f"Category '{name}' score must be a number")
+    if not isinstance(data['tips'], list):
+        raise ValueError(f"Category '{name}' tips must be a list")
+
+
+def compile_knowledge(source):
+    """Validate a parsed knowledge base and compile it into per-region tables.
+
+    Region entries override individual fields of the base categories (and the
+    default), so a municipality only lists what differs. Returns a dict
+    mapping region name (None for the base) to CompiledKnowledge.
+    """
+    version = str(source.get('version', 'unversioned'))
+    categories = source.get('categories') or {}
+    if not categories:
+        raise ValueError("Knowledge base defines no categories")
+    default = source.get('default')
+    if default is None:
+        raise ValueError("Knowledge base has no default entry")
+
+    categories = {name.lower(): data for name, data in categories.items()}
+    for name, data in categories.items():
+        _validate_category(name, data)
+    _validate_category('default', default)
+
+    compiled = {None: CompiledKnowledge(version, categories, default)}
+    for region, overrides in (source.get('regions') or {}).items():
+        region_overrides = {name.lower(): data for name, data in (overrides.get('categories') or {}).items()}
+        region_categories = {
+            name: {**data, **region_overrides.get(name, {})}
+            for name, data in categories.items()
+        }
+        region_default = {**default, **(overrides.get('default') or {})}
+        for name, data in region_categories.items():
+            _validate_category(f"{region}/{name}", data)
+        compiled[region.lower()] = CompiledKnowledge(version, region_categories, region_default, region=region.lower())
+    return compiled
+
 
 class SustainabilityScorer:
-    def __init__(self):
-        self.sustainability_data = self._load_sustainability_data()
+    def __init__(self, knowledge_base_path=None):
+        self.knowledge_base_path = knowledge_base_path or os.environ.get(
+            'ECOSORT_KB_PATH', DEFAULT_KNOWLEDGE_BASE_PATH
+        )
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._loaded_mtime = None
+        self._compiled = None
+        self.loaded_at = None
+        self.reload()
+    
+    def reload(self):
+        """Load and compile the knowledge base file, then swap it in atomically.
+        
+        The new tables are fully built before a single reference swap, so
+        in-flight requests keep the version they started with, and a broken
+        file leaves the current version in place (the error is raised).
+        """
+        with self._reload_lock:
+            mtime = os.path.getmtime(self.knowledge_base_path)
+            compiled = compile_knowledge(load_knowledge_file(self.knowledge_base_path))
+            self._compiled = compiled
+            self._loaded_mtime = mtime
+            self.loaded_at = time.time()
+            print(f"Loaded sustainability knowledge base version {compiled[None].version}")
+            return compiled[None].version
+    
+    def start_watcher(self, interval=5.0):
+        """Poll the knowledge base file and reload it when it changes"""
+        if self._watcher is not None:
+            return
+        
+        def watch():
+            failed_mtime = None
+            while True:
+                time.sleep(interval)
+                try:
+                    mtime = os.path.getmtime(self.knowledge_base_path)
+                except OSError:
+                    # Missing, or between the unlink and rename of an atomic replace; check again next poll
+                    continue
+                if mtime in (self._loaded_mtime, failed_mtime):
+                    continue
+                try:
+                    self.reload()
+                except Exception as e:
+                    # Retry only once the file changes again
+                    failed_mtime = mtime
+                    print(f"Knowledge base reload failed, keeping current version: {e}")
+        
+        self._watcher = threading.Thread(target=watch, name='kb-watcher', daemon=True)
+        self._watcher.start()
     
-    def _load_sustainability_data(self):
-        """Load sustainability data for different waste categories"""
+    def knowledge(self, region=None):
+        """Compiled tables for a region, falling back to the base knowledge"""
+        compiled = self._compiled
+        if region:
+            return compiled.get(region.lower(), compiled[None])
+        return compiled[None]
+    
+    def get_info(self):
+        """Version and source of the active knowledge base"""
+        compiled = self._compiled
         return {
-            'biodegradable': {
-                'score': 8.5,
-                'impact': 'Low',
-                'tips': [
-                    'Compost at home or use municipal composting services',
-                    'Use as garden mulch or soil amendment',
-                    'Feed to animals if safe (check local regulations)',
-                    'Break down naturally in 2-6 months',
-                    'Reduces landfill methane emissions'
-                ],
-                'environmental_benefits': [
-                    'Reduces greenhouse gas emissions',
-                    'Creates nutrient-rich soil',
-                    'Minimizes landfill waste',
-                    'Supports circular economy'
-                ],
-                'decomposition_time': '2-6 months',
-                'carbon_footprint': 'Very Low'
-            },
-            'recyclable': {
-                'score': 7.0,
-                'impact': 'Medium',
-                'tips': [
-                    'Clean and sort materials properly',
-                    'Check local recycling guidelines',
-                    'Rinse containers before recycling',
-                    'Remove caps and labels when possible',
-                    'Use designated recycling bins'
-                ],
-                'environmental_benefits': [
-                    'Conserves natural resources',
-                    'Reduces energy consumption',
-                    'Decreases pollution',
-                    'Creates new products'
-                ],
-                'decomposition_time': '100-1000 years',
-                'carbon_footprint': 'Low'
-            },
-            'hazardous': {
-                'score': 2.0,
-                'impact': 'High',
-                'tips': [
-                    'Never dispose in regular trash or down drains',
-                    'Use designated hazardous waste collection sites',
-                    'Contact local waste management authorities',
-                    'Store safely until proper disposal',
-                    'Follow manufacturer disposal instructions'
-                ],
-                'environmental_benefits': [
-                    'Prevents soil and water contamination',
-                    'Protects human and animal health',
-                    'Reduces environmental pollution',
-                    'Ensures proper treatment'
-                ],
-                'decomposition_time': 'Never (persistent)',
-                'carbon_footprint': 'Very High'
-            }
+            'version': compiled[None].version,
+            'path': os.path.abspath(self.knowledge_base_path),
+            'loaded_at': self.loaded_at,
+            'regions': sorted(region for region in compiled if region is not None),
+            'categories': list(compiled[None].category_codes)
         }
     
-    def get_score(self, category):
-        """Get sustainability score and information for a category"""
-        if category.lower() in self.sustainability_data:
-            return self.sustainability_data[category.lower()]
-        else:
-            # Return default data for unknown categories
-            return {
-                'score': 5.0,
-                'impact': 'Unknown',
-                'tips': ['Please consult local waste management guidelines'],
-                'environmental_benefits': ['Proper disposal reduces environmental impact'],
-                'decomposition_time': 'Unknown',
-                'carbon_footprint': 'Unknown'
-            }
+    @property
+    def sustainability_data(self):
+        return self.knowledge().sustainability_data
+    
+    @property
+    def category_codes(self):
+        return self.knowledge().category_codes
     
-    def calculate_eco_score(self, category, confidence, additional_factors=None):
+    def get_score(self, category, region=None):
+        """Get sustainability score and information for a category (read-only)"""
+        knowledge = self.knowledge(region)
+        return knowledge.sustainability_data.get(category.lower(), knowledge.default_data)
+    
+    def get_knowledge_card(self, category, region=None):
+        """Get the pre-encoded knowledge card for a category"""
+        knowledge = self.knowledge(region)
+        return knowledge.knowledge_cards.get(category.lower(), knowledge.default_card)
+    
+    def calculate_eco_score(self, category, confidence, additional_factors=None, region=None):
         """Calculate a comprehensive eco-score based on multiple factors"""
-        base_data = self.get_score(category)
+        base_data = self.get_score(category, region)
         base_score = base_data['score']
         
         # Adjust score based on confidence
@@ -111,100 +259,70 @@ class SustainabilityScorer:
         
         return min(max(adjusted_score, 0.0), 10.0)
     
-    def get_disposal_alternatives(self, category):
-        """Get alternative disposal methods for a category"""
-        alternatives = {
-            'biodegradable': [
-                'Home composting',
-                'Municipal composting',
-                'Garden mulch',
-                'Animal feed (if safe)',
-                'Natural decomposition'
-            ],
-            'recyclable': [
-                'Curbside recycling',
-                'Recycling centers',
-                'Upcycling projects',
-                'Donation to reuse programs',
-                'Manufacturer take-back programs'
-            ],
-            'hazardous': [
-                'Hazardous waste facilities',
-                'Special collection events',
-                'Manufacturer disposal programs',
-                'Professional waste management services',
-                'Local government collection programs'
-            ]
-        }
+    def encode_categories(self, categories, region=None):
+        """Map category names to the integer codes used by calculate_eco_scores"""
+        knowledge = self.knowledge(region)
+        unknown = len(knowledge.category_codes)
+        return np.array(
+            [knowledge.category_index.get(str(category).lower(), unknown) for category in categories],
+            dtype=np.int64
+        )
+    
+    def encode_conditions(self, conditions):
+        """Map condition names to indexes into CONDITION_CODES"""
+        index = {condition: code for code, condition in enumerate(CONDITION_CODES)}
+        return np.array([index.get(condition, 0) for condition in conditions], dtype=np.int64)
+    
+    def calculate_eco_scores(self, category_codes, confidences, quantities=None, condition_codes=None, region=None):
+        """Vectorized calculate_eco_score over arrays of items.
+        
+        category_codes index category_codes (out-of-range codes use the
+        unknown-category default), condition_codes index CONDITION_CODES, and
+        NaN quantities count as missing. The multiplications happen in the
+        same order as the scalar version, so results are bit-identical.
+        """
+        knowledge = self.knowledge(region)
+        category_codes = np.asarray(category_codes, dtype=np.int64)
+        confidences = np.asarray(confidences, dtype=np.float64)
+        
+        unknown = len(knowledge.category_codes)
+        codes = np.where((category_codes >= 0) & (category_codes < unknown), category_codes, unknown)
+        scores = knowledge.base_scores[codes] * np.minimum(confidences, 1.0)
+        
+        if quantities is not None:
+            quantities = np.asarray(quantities, dtype=np.float64)
+            scores = scores * np.where(quantities > 10, 0.8, np.where(quantities > 5, 0.9, 1.0))
+        
+        if condition_codes is not None:
+            condition_codes = np.asarray(condition_codes, dtype=np.int64)
+            valid = (condition_codes >= 0) & (condition_codes < len(CONDITION_CODES))
+            multipliers = np.array([1.0, 0.9, 0.7], dtype=np.float64)
+            scores = scores * multipliers[np.where(valid, condition_codes, 0)]
         
-        return alternatives.get(category.lower(), ['Consult local guidelines'])
+        return np.clip(scores, 0.0, 10.0)
     
-    def get_environmental_impact_breakdown(self, category):
+    def get_disposal_alternatives(self, category, region=None):
+        """Get alternative disposal methods for a category"""
+        return self.get_knowledge_card(category, region).data.get('disposal_alternatives', ())
+    
+    def get_environmental_impact_breakdown(self, category, region=None):
         """Get detailed environmental impact breakdown"""
-        impact_data = {
-            'biodegradable': {
-                'landfill_impact': 'High (methane production)',
-                'water_impact': 'Low',
-                'air_impact': 'Medium (if not composted)',
-                'soil_impact': 'Positive (if composted)',
-                'wildlife_impact': 'Low'
-            },
-            'recyclable': {
-                'landfill_impact': 'Medium (space usage)',
-                'water_impact': 'Medium (pollution)',
-                'air_impact': 'Medium (manufacturing emissions)',
-                'soil_impact': 'Low',
-                'wildlife_impact': 'Medium (habitat disruption)'
-            },
-            'hazardous': {
-                'landfill_impact': 'Very High (contamination)',
-                'water_impact': 'Very High (pollution)',
-                'air_impact': 'High (toxic emissions)',
-                'soil_impact': 'Very High (contamination)',
-                'wildlife_impact': 'Very High (toxicity)'
-            }
-        }
-        
-        return impact_data.get(category.lower(), {})
+        return self.get_knowledge_card(category, region).data.get('impact_breakdown', MappingProxyType({}))
     
-    def get_sustainability_tips(self, category):
+    def get_sustainability_tips(self, category, region=None):
         """Get sustainability improvement tips for a category"""
-        tips = {
-            'biodegradable': [
-                'Start a home composting system',
-                'Use reusable containers instead of disposable ones',
-                'Buy products with minimal packaging',
-                'Support local farmers markets',
-                'Practice zero-waste cooking'
-            ],
-            'recyclable': [
-                'Buy products made from recycled materials',
-                'Choose products with recyclable packaging',
-                'Reduce consumption of single-use items',
-                'Support companies with recycling programs',
-                'Educate others about proper recycling'
-            ],
-            'hazardous': [
-                'Choose non-toxic alternatives when possible',
-                'Buy only what you need to avoid waste',
-                'Use rechargeable batteries',
-                'Choose eco-friendly cleaning products',
-                'Support hazardous waste collection programs'
-            ]
-        }
-        
-        return tips.get(category.lower(), ['Reduce consumption and waste generation'])
+        return self.get_knowledge_card(category, region).data.get('sustainability_tips', ())
     
-    def get_category_comparison(self):
+    def get_category_comparison(self, region=None):
         """Get comparison data between all categories"""
         comparison = {}
         
-        for category, data in self.sustainability_data.items():
+        for category, data in self.knowledge(region).sustainability_data.items():
             comparison[category] = {
                 'score': data['score'],
                 'impact': data['impact'],
-                'decomposition_time': data['decomposition_time'],
-                'carbon_footprint': data['carbon_footprint']
+                'decomposition_time': data.get('decomposition_time', 'Unknown'),
+                'carbon_footprint': data.get('carbon_footprint', 'Unknown')
             }
         
         return comparison
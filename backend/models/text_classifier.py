@@ -136,42 +136,54 @@ class TextClassifier:
         
         return text
     
-    def predict(self, text):
-        """Predict waste category from text"""
-        if not self.sklearn_available or self.model is None:
+    def predict(self, text, degraded=False):
+        """Predict waste category from text; degraded=True forces the keyword fallback"""
+        if degraded or not self.sklearn_available or self.model is None:
             return self._fallback_classification(text)
             
         try:
             # Preprocess text
             processed_text = self.preprocess_text(text)
             
-            # Make prediction
-            predicted_category = self.model.predict([processed_text])[0]
-            
             # Get prediction probabilities
             probabilities = self.model.predict_proba([processed_text])[0]
             
-            # Find confidence for predicted category
-            category_index = self.categories.index(predicted_category)
-            confidence = float(probabilities[category_index])
-            
-            # Create result with all probabilities
-            all_probabilities = {
-                cat: float(prob) for cat, prob in zip(self.categories, probabilities)
-            }
-            
-            return {
-                'category': predicted_category,
-                'confidence': confidence,
-                'all_probabilities': all_probabilities,
-                'processed_text': processed_text
-            }
+            return self._result_from_probabilities(probabilities, processed_text)
             
         except Exception as e:
             print(f"Error in text prediction: {e}")
             # Fallback to keyword-based classification
             return self._fallback_classification(text)
     
+    def predict_batch(self, texts):
+        """Predict many texts with one vectorizer and model call"""
+        if not self.sklearn_available or self.model is None:
+            return [self._fallback_classification(text) for text in texts]
+        
+        try:
+            processed = [self.preprocess_text(text) for text in texts]
+            probabilities = self.model.predict_proba(processed)
+            return [
+                self._result_from_probabilities(row, processed_text)
+                for row, processed_text in zip(probabilities, processed)
+            ]
+        except Exception as e:
+            print(f"Error in batch text prediction: {e}")
+            return [self._fallback_classification(text) for text in texts]
+    
+    def _result_from_probabilities(self, probabilities, processed_text):
+        # predict_proba columns follow the model's classes_ (alphabetical), not self.categories
+        by_category = {cat: float(prob) for cat, prob in zip(self.model.classes_, probabilities)}
+        all_probabilities = {cat: by_category.get(cat, 0.0) for cat in self.categories}
+        predicted_category = max(all_probabilities, key=all_probabilities.get)
+        
+        return {
+            'category': predicted_category,
+            'confidence': all_probabilities[predicted_category],
+            'all_probabilities': all_probabilities,
+            'processed_text': processed_text
+        }
+    
     def _fallback_classification(self, text):
         """Fallback classification using keyword matching"""
         text_lower = text.lower()
@@ -0,0 +1,155 @@
+import cProfile
+import io
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+
+
+class RequestProfiler:
+    """Opt-in cProfile capture of live requests into a bounded on-disk ring"""
+
+    def __init__(self, profile_dir='profiles', max_profiles=50, max_overhead_percent=5.0,
+                 sample_rate=0.0, window_seconds=60.0):
+        self.profile_dir = profile_dir
+        self.max_profiles = max(int(max_profiles), 1)
+        self.max_overhead = max(float(max_overhead_percent), 0.0) / 100.0
+        self.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+        self.window_seconds = float(window_seconds)
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._total_time = 0.0
+        self._profiled_time = 0.0
+        self.stats = {'profiled': 0, 'skipped_budget': 0, 'skipped_busy': 0}
+
+    @classmethod
+    def from_env(cls):
+        """Build a profiler from ECOSORT_PROFILE_* environment variables"""
+        return cls(
+            profile_dir=os.environ.get('ECOSORT_PROFILE_DIR', 'profiles'),
+            max_profiles=int(os.environ.get('ECOSORT_PROFILE_MAX_FILES', 50)),
+            max_overhead_percent=float(os.environ.get('ECOSORT_PROFILE_MAX_OVERHEAD', 5.0)),
+            sample_rate=float(os.environ.get('ECOSORT_PROFILE_SAMPLE_RATE', 0.0))
+        )
+
+    def _roll_window(self, now):
+        if now - self._window_start > self.window_seconds:
+            self._window_start = now
+            self._total_time = 0.0
+            self._profiled_time = 0.0
+
+    def should_profile(self, requested=False):
+        """Decide whether the current request gets profiled.
+
+        Time spent under the profiler is an upper bound on the overhead it
+        adds, so profiling is refused while profiled wall time exceeds the
+        configured share of all request wall time in the current window.
+        """
+        if not requested and (self.sample_rate <= 0.0 or random.random() >= self.sample_rate):
+            return False
+
+        with self._lock:
+            self._roll_window(time.monotonic())
+            if self._total_time > 0 and self._profiled_time / self._total_time >= self.max_overhead:
+                self.stats['skipped_budget'] += 1
+                return False
+        return True
+
+    def start(self):
+        """Start a profile for the calling thread, or None if one cannot be started"""
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is already active (Python 3.12+ allows only one)
+            with self._lock:
+                self.stats['skipped_busy'] += 1
+            return None
+        return profile
+
+    def record_request(self, elapsed, profiled=False):
+        """Account a finished request against the overhead budget"""
+        with self._lock:
+            self._roll_window(time.monotonic())
+            self._total_time += elapsed
+            if profiled:
+                self._profiled_time += elapsed
+
+    def finish(self, profile, endpoint, elapsed):
+        """Stop a profile, write it to the ring and return its name"""
+        profile.disable()
+        os.makedirs(self.profile_dir, exist_ok=True)
+
+        safe_endpoint = ''.join(c if c.isalnum() else '_' for c in endpoint).strip('_') or 'request'
+        name = f"{int(time.time() * 1000)}-{safe_endpoint}-{int(elapsed * 1000)}ms-{uuid.uuid4().hex[:8]}.prof"
+        profile.dump_stats(os.path.join(self.profile_dir, name))
+
+        with self._lock:
+            self.stats['profiled'] += 1
+            self._trim_ring()
+        return name
+
+    def _trim_ring(self):
+        profiles = sorted(f for f in os.listdir(self.profile_dir) if f.endswith('.prof'))
+        for stale in profiles[:-self.max_profiles]:
+            try:
+                os.remove(os.path.join(self.profile_dir, stale))
+            except OSError:
+                pass
+
+    def list_profiles(self):
+        """List stored profiles, newest first"""
+        if not os.path.isdir(self.profile_dir):
+            return []
+
+        profiles = []
+        for name in sorted(os.listdir(self.profile_dir), reverse=True):
+            if not name.endswith('.prof'):
+                continue
+            path = os.path.join(self.profile_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            profiles.append({
+                'name': name,
+                'size_bytes': stat.st_size,
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(stat.st_mtime))
+            })
+        return profiles
+
+    def profile_path(self, name):
+        """Resolve a profile name inside the ring, or None if it does not exist"""
+        if os.path.basename(name) != name or not name.endswith('.prof'):
+            return None
+        path = os.path.join(self.profile_dir, name)
+        return path if os.path.isfile(path) else None
+
+    def render_profile(self, name, sort_by='cumulative', limit=40):
+        """Render a stored profile as a pstats call listing"""
+        path = self.profile_path(name)
+        if path is None:
+            return None
+
+        if sort_by not in {key.value for key in pstats.SortKey}:
+            sort_by = 'cumulative'
+
+        buffer = io.StringIO()
+        stats = pstats.Stats(path, stream=buffer)
+        stats.strip_dirs().sort_stats(sort_by).print_stats(limit)
+        stats.print_callees(limit)
+        return buffer.getvalue()
+
+    def get_stats(self):
+        """Current profiler counters and budget usage"""
+        with self._lock:
+            share = self._profiled_time / self._total_time if self._total_time else 0.0
+            return {
+                **self.stats,
+                'sample_rate': self.sample_rate,
+                'max_overhead_percent': self.max_overhead * 100.0,
+                'window_profiled_percent': round(share * 100.0, 3),
+                'max_profiles': self.max_profiles
+            }
@@ -0,0 +1,233 @@
+"""
+Hierarchical hourly/daily/monthly rollups of the classifications table.
+
+Every stored classification is added to one bucket per granularity, split by
+input_type and category, so long-range analytics read a handful of
+pre-aggregated rows instead of scanning raw history.
+"""
+import sqlite3
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# (table, bucket strftime format) from finest to coarsest
+ROLLUP_LEVELS = {
+    'hour': ('rollup_hourly', '%Y-%m-%d %H'),
+    'day': ('rollup_daily', '%Y-%m-%d'),
+    'month': ('rollup_monthly', '%Y-%m')
+}
+
+
+def create_rollup_tables(cursor):
+    """Create the rollup tables if they do not exist"""
+    for table, _ in ROLLUP_LEVELS.values():
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                bucket TEXT NOT NULL,
+                input_type TEXT NOT NULL,
+                category TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                confidence_sum REAL NOT NULL DEFAULT 0,
+                score_sum REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (bucket, input_type, category)
+            ) WITHOUT ROWID
+        ''')
+
+
+def update_rollups(cursor, timestamp, input_type, category, confidence, score, count=1):
+    """Add one classification (or a pre-summed group of them) to every rollup level"""
+    for table, bucket_format in ROLLUP_LEVELS.values():
+        cursor.execute(f'''
+            INSERT INTO {table} (bucket, input_type, category, count, confidence_sum, score_sum)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (bucket, input_type, category) DO UPDATE SET
+                count = count + excluded.count,
+                confidence_sum = confidence_sum + excluded.confidence_sum,
+                score_sum = score_sum + excluded.score_sum
+        ''', (timestamp.strftime(bucket_format), input_type, category, count, confidence, score))
+
+
+def create_analytics_table(cursor):
+    """Create the per-day analytics table read by /analytics"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analytics (
+            id TEXT PRIMARY KEY,
+            date DATE,
+            biodegradable_count INTEGER,
+            recyclable_count INTEGER,
+            hazardous_count INTEGER,
+            total_classifications INTEGER
+        )
+    ''')
+
+
+def refresh_analytics_day(cursor, day):
+    """Recompute one day's analytics row (YYYY-MM-DD) from the daily rollup instead of recounting raw rows"""
+    cursor.execute('''
+        INSERT OR REPLACE INTO analytics
+        (id, date, biodegradable_count, recyclable_count, hazardous_count, total_classifications)
+        SELECT
+            ?,
+            ?,
+            COALESCE(SUM(CASE WHEN category = 'biodegradable' THEN count END), 0),
+            COALESCE(SUM(CASE WHEN category = 'recyclable' THEN count END), 0),
+            COALESCE(SUM(CASE WHEN category = 'hazardous' THEN count END), 0),
+            COALESCE(SUM(count), 0)
+        FROM rollup_daily
+        WHERE bucket = ?
+    ''', (day, day, day))
+
+
+def rebuild_rollups(conn):
+    """Recompute all rollups from the raw classifications table"""
+    cursor = conn.cursor()
+    create_rollup_tables(cursor)
+
+    # Raw timestamps are stored as 'YYYY-MM-DD HH:MM:SS[.ffffff]', so bucket keys are prefixes
+    prefix_lengths = {'hour': 13, 'day': 10, 'month': 7}
+    for level, (table, _) in ROLLUP_LEVELS.items():
+        cursor.execute(f'DELETE FROM {table}')
+        cursor.execute(f'''
+            INSERT INTO {table} (bucket, input_type, category, count, confidence_sum, score_sum)
+            SELECT
+                SUBSTR(timestamp, 1, {prefix_lengths[level]}),
+                COALESCE(input_type, 'unknown'),
+                COALESCE(predicted_category, 'unknown'),
+                COUNT(*),
+                COALESCE(SUM(confidence), 0),
+                COALESCE(SUM(sustainability_score), 0)
+            FROM classification_details
+            GROUP BY 1, 2, 3
+        ''')
+    conn.commit()
+    logger.info("Analytics rollups rebuilt from classifications")
+
+
+def rollups_need_backfill(cursor):
+    """True when raw classifications exist but the rollups are empty"""
+    cursor.execute('SELECT EXISTS (SELECT 1 FROM rollup_monthly)')
+    if cursor.fetchone()[0]:
+        return False
+    cursor.execute('SELECT EXISTS (SELECT 1 FROM classifications)')
+    return bool(cursor.fetchone()[0])
+
+
+def _next_month(moment):
+    return moment.replace(year=moment.year + moment.month // 12, month=moment.month % 12 + 1, day=1)
+
+
+def plan_range(start, end):
+    """Split the half-open range [start, end) into the coarsest covering buckets.
+
+    Both bounds are truncated to the hour. Returns a list of
+    (table, first_bucket, last_bucket) segments using hours up to the first
+    day boundary, days up to the first month boundary, whole months, and then
+    days and hours again for the tail.
+    """
+    start = start.replace(minute=0, second=0, microsecond=0)
+    end = end.replace(minute=0, second=0, microsecond=0)
+    segments = []
+
+    def add(level, first, last_exclusive, step):
+        if first >= last_exclusive:
+            return
+        table, bucket_format = ROLLUP_LEVELS[level]
+        segments.append((table, first.strftime(bucket_format), step(last_exclusive).strftime(bucket_format)))
+
+    one_hour_back = lambda moment: moment - timedelta(hours=1)
+    one_day_back = lambda moment: moment - timedelta(days=1)
+    one_month_back = lambda moment: (moment - timedelta(days=1)).replace(day=1)
+
+    day_start = start if start.hour == 0 else start.replace(hour=0) + timedelta(days=1)
+    day_end = end.replace(hour=0)
+    if day_start >= day_end:
+        # Range never covers a whole day: hours only
+        add('hour', start, end, one_hour_back)
+        return segments
+
+    month_start = day_start if day_start.day == 1 else _next_month(day_start)
+    month_end = day_end.replace(day=1)
+
+    add('hour', start, day_start, one_hour_back)
+    if month_start >= month_end:
+        add('day', day_start, day_end, one_day_back)
+    else:
+        add('day', day_start, month_start, one_day_back)
+        add('month', month_start, month_end, one_month_back)
+        add('day', month_end, day_end, one_day_back)
+    add('hour', day_end, end, one_hour_back)
+    return segments
+
+
+def query_rollups(cursor, start, end):
+    """Aggregate counts, confidence and score sums over [start, end) by input_type and category"""
+    totals = {}
+    for table, first_bucket, last_bucket in plan_range(start, end):
+        cursor.execute(f'''
+            SELECT input_type, category, SUM(count), SUM(confidence_sum), SUM(score_sum)
+            FROM {table}
+            WHERE bucket BETWEEN ? AND ?
+            GROUP BY input_type, category
+        ''', (first_bucket, last_bucket))
+
+        for input_type, category, count, confidence_sum, score_sum in cursor.fetchall():
+            entry = totals.setdefault((input_type, category), [0, 0.0, 0.0])
+            entry[0] += count
+            entry[1] += confidence_sum
+            entry[2] += score_sum
+
+    return [
+        {
+            'input_type': input_type,
+            'category': category,
+            'count': count,
+            'confidence_sum': confidence_sum,
+            'score_sum': score_sum
+        }
+        for (input_type, category), (count, confidence_sum, score_sum) in sorted(totals.items())
+    ]
+
+
+def summarize_day_range(cursor, start_date, end_date, pending=()):
+    """Summarize whole days start_date..end_date (inclusive, YYYY-MM-DD) from the rollups.
+
+    pending holds extra query_rollups-style rows not yet in the tables, such
+    as the deltas waiting in a shared counter store.
+    """
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
+    rows = (query_rollups(cursor, start, end) if start < end else []) + list(pending)
+    return summarize_rows(rows)
+
+
+def summarize_rows(rows):
+    """Distribution, averages and totals from rows with input_type, category, count and sums"""
+    category_totals = {}
+    input_type_distribution = {}
+    for row in rows:
+        entry = category_totals.setdefault(row['category'], [0, 0.0, 0.0])
+        entry[0] += row['count']
+        entry[1] += row['confidence_sum']
+        entry[2] += row['score_sum']
+        input_type_distribution[row['input_type']] = input_type_distribution.get(row['input_type'], 0) + row['count']
+
+    return {
+        'category_distribution': {category: values[0] for category, values in category_totals.items()},
+        'category_averages': {
+            category: {
+                'average_confidence': values[1] / values[0] if values[0] else 0.0,
+                'average_sustainability_score': values[2] / values[0] if values[0] else 0.0
+            }
+            for category, values in category_totals.items()
+        },
+        'input_type_distribution': input_type_distribution,
+        'total_classifications': sum(values[0] for values in category_totals.values())
+    }
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    conn = sqlite3.connect('ecosort.db')
+    rebuild_rollups(conn)
+    conn.close()
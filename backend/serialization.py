@@ -0,0 +1,53 @@
+"""
+Response encoding for the classify endpoints.
+
+Clients choose the compact mode with ?response=compact or an Accept header
+of application/vnd.ecosort.compact+json, and MessagePack with
+Accept: application/msgpack. orjson and msgpack are used when installed;
+the standard json module is the fallback.
+"""
+import json
+
+from flask import Response
+
+ORJSON_AVAILABLE = False
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    pass
+
+MSGPACK_AVAILABLE = False
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    pass
+
+COMPACT_MIMETYPE = 'application/vnd.ecosort.compact+json'
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack')
+
+
+def dumps(value):
+    """Compact JSON bytes, through orjson when available"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+
+def negotiate(request):
+    """(compact, encoding) requested by a classify call; encoding is 'json' or 'msgpack'"""
+    # Only explicitly listed types count; browsers send */*
+    accepted = {mimetype for mimetype, quality in request.accept_mimetypes if quality > 0}
+    if MSGPACK_AVAILABLE and accepted.intersection(MSGPACK_MIMETYPES):
+        # Binary clients are high-volume clients: MessagePack is always compact
+        return True, 'msgpack'
+    compact = request.args.get('response') == 'compact' or COMPACT_MIMETYPE in accepted
+    return compact, 'json'
+
+
+def encode_response(fields, encoding='json', compact=True):
+    """Response for a dict of fields in the negotiated encoding"""
+    if encoding == 'msgpack':
+        return Response(msgpack.packb(fields), mimetype=MSGPACK_MIMETYPES[0])
+    return Response(dumps(fields), mimetype=COMPACT_MIMETYPE if compact else 'application/json')
@@ -0,0 +1,440 @@
+"""
+Analytics counters shared by every worker process.
+
+Instead of updating the rollup and analytics tables inside each
+classification's transaction, workers add the classification to an
+hourly (bucket, input_type, category) counter in a shared store, and one
+elected flusher process periodically writes the accumulated deltas in a
+single transaction. Readers add the deltas still pending in the store, so
+every worker answers /analytics with the same numbers.
+
+Stores:
+    local   counters of this process only (one worker)
+    shared  a memory-mapped file (in /dev/shm where available) updated under
+            flock, for the workers of one host
+    redis   a Redis hash, for workers on several hosts (needs the redis package)
+"""
+import fcntl
+import logging
+import mmap
+import os
+import socket
+import struct
+import tempfile
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime
+
+from rollups import refresh_analytics_day, update_rollups
+
+REDIS_AVAILABLE = False
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+BUCKET_FORMAT = '%Y-%m-%d %H'
+
+
+class CounterStoreFull(Exception):
+    """The shared store has no free slot; the caller writes the classification directly"""
+
+
+def counter_key(timestamp, input_type, category):
+    return timestamp.strftime(BUCKET_FORMAT), input_type, category
+
+
+class CounterStore(ABC):
+    """Pending (count, confidence_sum, score_sum) per (hour bucket, input_type, category)"""
+
+    @abstractmethod
+    def add(self, key, count, confidence_sum, score_sum):
+        """Add a classification delta to the key's pending counter"""
+
+    @abstractmethod
+    def snapshot(self):
+        """{key: [count, confidence_sum, score_sum]} of every pending delta"""
+
+    @abstractmethod
+    def subtract(self, deltas):
+        """Remove flushed deltas, keeping anything added since the snapshot"""
+
+    @abstractmethod
+    def try_elect(self):
+        """True if this process is (or just became) the flusher"""
+
+    @contextmanager
+    def flush_lock(self, exclusive=False):
+        """Held shared by readers and exclusively by the flusher between commit and subtract"""
+        yield
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def from_env():
+        """Store named by ECOSORT_COUNTERS ('local', 'shared' or 'redis'), or None to write directly"""
+        kind = os.environ.get('ECOSORT_COUNTERS', 'direct').lower()
+        if kind == 'direct':
+            return None
+        if kind == 'local':
+            return LocalCounterStore()
+        if kind == 'shared':
+            default_dir = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+            return SharedMemoryCounterStore(
+                os.environ.get('ECOSORT_COUNTERS_PATH', os.path.join(default_dir, 'ecosort-counters'))
+            )
+        if kind == 'redis':
+            return RedisCounterStore(os.environ.get('ECOSORT_REDIS_URL', 'redis://localhost:6379/0'))
+        raise ValueError(f"Unknown ECOSORT_COUNTERS store '{kind}'")
+
+
+class LocalCounterStore(CounterStore):
+    """Counters in this process, for single-worker deployments"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._counters = {}
+
+    def add(self, key, count, confidence_sum, score_sum):
+        with self._lock:
+            entry = self._counters.setdefault(key, [0, 0.0, 0.0])
+            entry[0] += count
+            entry[1] += confidence_sum
+            entry[2] += score_sum
+
+    def snapshot(self):
+        with self._lock:
+            return {key: list(entry) for key, entry in self._counters.items()}
+
+    def subtract(self, deltas):
+        with self._lock:
+            for key, (count, confidence_sum, score_sum) in deltas.items():
+                entry = self._counters[key]
+                if entry[0] == count:
+                    del self._counters[key]
+                else:
+                    entry[0] -= count
+                    entry[1] -= confidence_sum
+                    entry[2] -= score_sum
+
+    def try_elect(self):
+        return True
+
+    @contextmanager
+    def flush_lock(self, exclusive=False):
+        with self._flush_lock:
+            yield
+
+
+class SharedMemoryCounterStore(CounterStore):
+    """Open-addressing hash table of counters in a memory-mapped file.
+
+    Every process maps the same file; updates hold an exclusive flock on it
+    (plus a thread lock, since flock does not exclude threads sharing a
+    descriptor) for the few microseconds of the increment. The flusher is
+    whichever process holds the flock on <path>.flusher, which the kernel
+    releases if that process dies.
+    """
+
+    MAGIC = b'ECOCNT01'
+    SLOT = struct.Struct('<64sqdd')
+
+    def __init__(self, path, slots=1024):
+        self.path = path
+        self.slots = slots
+        self.size = len(self.MAGIC) + slots * self.SLOT.size
+        self._thread_lock = threading.Lock()
+        self._flusher_fd = None
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._file_lock():
+            if os.fstat(self._fd).st_size != self.size:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, self.size)
+                os.pwrite(self._fd, self.MAGIC, 0)
+        self._map = mmap.mmap(self._fd, self.size)
+
+    @contextmanager
+    def _file_lock(self):
+        with self._thread_lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _offset(self, index):
+        return len(self.MAGIC) + index * self.SLOT.size
+
+    @staticmethod
+    def _encode(key):
+        encoded = '\x1f'.join(key).encode('utf-8')
+        if len(encoded) > 64:
+            raise CounterStoreFull(f"Counter key longer than 64 bytes: {key!r}")
+        return encoded.ljust(64, b'\0')
+
+    def add(self, key, count, confidence_sum, score_sum):
+        encoded = self._encode(key)
+        start = zlib.crc32(encoded) % self.slots
+        with self._file_lock():
+            for probe in range(self.slots):
+                offset = self._offset((start + probe) % self.slots)
+                slot_key, slot_count, slot_confidence, slot_score = self.SLOT.unpack_from(self._map, offset)
+                if slot_key == encoded or slot_key[0] == 0:
+                    self.SLOT.pack_into(self._map, offset, encoded, slot_count + count,
+                                        slot_confidence + confidence_sum, slot_score + score_sum)
+                    return
+        raise CounterStoreFull(f"All {self.slots} counter slots are in use")
+
+    def _read(self):
+        counters = {}
+        for index in range(self.slots):
+            slot_key, count, confidence_sum, score_sum = self.SLOT.unpack_from(self._map, self._offset(index))
+            if slot_key[0] != 0 and count:
+                counters[tuple(slot_key.rstrip(b'\0').decode('utf-8').split('\x1f'))] = \
+                    [count, confidence_sum, score_sum]
+        return counters
+
+    def snapshot(self):
+        with self._file_lock():
+            return self._read()
+
+    def subtract(self, deltas):
+        with self._file_lock():
+            counters = self._read()
+            for key, (count, confidence_sum, score_sum) in deltas.items():
+                entry = counters.get(key)
+                if entry is None:
+                    continue
+                if entry[0] == count:
+                    del counters[key]
+                else:
+                    entry[0] -= count
+                    entry[1] -= confidence_sum
+                    entry[2] -= score_sum
+
+            # Rewrite the table so flushed hours free their slots and probe chains stay short
+            self._map[len(self.MAGIC):] = bytes(self.size - len(self.MAGIC))
+            for key, (count, confidence_sum, score_sum) in counters.items():
+                encoded = self._encode(key)
+                start = zlib.crc32(encoded) % self.slots
+                for probe in range(self.slots):
+                    offset = self._offset((start + probe) % self.slots)
+                    if self._map[offset] == 0:
+                        self.SLOT.pack_into(self._map, offset, encoded, count, confidence_sum, score_sum)
+                        break
+
+    def try_elect(self):
+        if self._flusher_fd is not None:
+            return True
+        fd = os.open(self.path + '.flusher', os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._flusher_fd = fd
+        return True
+
+    @contextmanager
+    def flush_lock(self, exclusive=False):
+        # A descriptor per holder, so threads of one process also exclude each other
+        fd = os.open(self.path + '.flush', os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+        finally:
+            os.close(fd)
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+        if self._flusher_fd is not None:
+            os.close(self._flusher_fd)
+            self._flusher_fd = None
+
+
+# Subtract flushed deltas and drop counters that reached zero, atomically
+_REDIS_SUBTRACT = '''
+for i = 1, #ARGV, 4 do
+    local field = ARGV[i]
+    local count = redis.call('HINCRBY', KEYS[1], field .. '|n', -tonumber(ARGV[i + 1]))
+    if count <= 0 then
+        redis.call('HDEL', KEYS[1], field .. '|n', field .. '|c', field .. '|s')
+    else
+        redis.call('HINCRBYFLOAT', KEYS[1], field .. '|c', -tonumber(ARGV[i + 2]))
+        redis.call('HINCRBYFLOAT', KEYS[1], field .. '|s', -tonumber(ARGV[i + 3]))
+    end
+end
+'''
+
+# Take or renew the flusher lease if it is free or already ours
+_REDIS_ELECT = '''
+local holder = redis.call('GET', KEYS[1])
+if holder == false or holder == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+end
+return 0
+'''
+
+
+class RedisCounterStore(CounterStore):
+    """Counters in one Redis hash, for workers spread over several hosts.
+
+    The flusher holds a lease key renewed on every election check. Reads are
+    not serialized against flushes across hosts, so a read racing a flush
+    can briefly count a delta twice.
+    """
+
+    def __init__(self, url, prefix='ecosort:counters', lease_ms=10000):
+        if not REDIS_AVAILABLE:
+            raise RuntimeError("The redis package is required for ECOSORT_COUNTERS=redis")
+        self.client = redis.Redis.from_url(url)
+        self.hash_key = prefix
+        self.lease_key = prefix + ':flusher'
+        self.lease_ms = lease_ms
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self._subtract = self.client.register_script(_REDIS_SUBTRACT)
+        self._elect = self.client.register_script(_REDIS_ELECT)
+
+    def add(self, key, count, confidence_sum, score_sum):
+        field = '\x1f'.join(key)
+        pipeline = self.client.pipeline(transaction=True)
+        pipeline.hincrby(self.hash_key, field + '|n', count)
+        pipeline.hincrbyfloat(self.hash_key, field + '|c', confidence_sum)
+        pipeline.hincrbyfloat(self.hash_key, field + '|s', score_sum)
+        pipeline.execute()
+
+    def snapshot(self):
+        counters = {}
+        for field, value in self.client.hgetall(self.hash_key).items():
+            name, kind = field.decode('utf-8').rsplit('|', 1)
+            entry = counters.setdefault(tuple(name.split('\x1f')), [0, 0.0, 0.0])
+            entry['ncs'.index(kind)] = int(value) if kind == 'n' else float(value)
+        return {key: entry for key, entry in counters.items() if entry[0]}
+
+    def subtract(self, deltas):
+        arguments = []
+        for key, (count, confidence_sum, score_sum) in deltas.items():
+            arguments.extend(['\x1f'.join(key), count, confidence_sum, score_sum])
+        if arguments:
+            self._subtract(keys=[self.hash_key], args=arguments)
+
+    def try_elect(self):
+        return bool(self._elect(keys=[self.lease_key], args=[self.worker, self.lease_ms]))
+
+
+def flush_counters(store, conn):
+    """Write every pending delta to the rollups and analytics tables; returns the number of counters"""
+    deltas = store.snapshot()
+    if not deltas:
+        return 0
+    cursor = conn.cursor()
+    try:
+        days = set()
+        for (bucket, input_type, category), (count, confidence_sum, score_sum) in deltas.items():
+            timestamp = datetime.strptime(bucket, BUCKET_FORMAT)
+            update_rollups(cursor, timestamp, input_type, category, confidence_sum, score_sum, count=count)
+            days.add(timestamp.strftime('%Y-%m-%d'))
+        for day in sorted(days):
+            refresh_analytics_day(cursor, day)
+
+        # Readers must not see the deltas both committed and still pending
+        with store.flush_lock(exclusive=True):
+            conn.commit()
+            store.subtract(deltas)
+    except Exception:
+        conn.rollback()
+        raise
+    return len(deltas)
+
+
+def pending_rollup_rows(store, start_date, end_date):
+    """Pending deltas for days start_date..end_date (YYYY-MM-DD) as query_rollups-style rows"""
+    rows = []
+    for (bucket, input_type, category), (count, confidence_sum, score_sum) in sorted(store.snapshot().items()):
+        if start_date <= bucket[:10] <= end_date:
+            rows.append({
+                'day': bucket[:10],
+                'input_type': input_type,
+                'category': category,
+                'count': count,
+                'confidence_sum': confidence_sum,
+                'score_sum': score_sum
+            })
+    return rows
+
+
+def add_pending_days(daily_rows, pending):
+    """Add pending rows to (date, biodegradable, recyclable, hazardous, total) analytics rows"""
+    days = {row[0]: list(row) for row in daily_rows}
+    columns = {'biodegradable': 1, 'recyclable': 2, 'hazardous': 3}
+    for row in pending:
+        day = days.setdefault(row['day'], [row['day'], 0, 0, 0, 0])
+        if row['category'] in columns:
+            day[columns[row['category']]] += row['count']
+        day[4] += row['count']
+    return [tuple(days[day]) for day in sorted(days)]
+
+
+class CounterFlusher:
+    """Background thread that flushes the store every interval seconds while this process is elected"""
+
+    def __init__(self, store, connect, interval=1.0):
+        self.store = store
+        self.connect = connect
+        self.interval = float(interval)
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {'flushes': 0, 'counters_flushed': 0, 'errors': 0, 'elected': False}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='counter-flusher', daemon=True)
+        self._thread.start()
+
+    def flush(self):
+        if not self.store.try_elect():
+            self.stats['elected'] = False
+            return 0
+        self.stats['elected'] = True
+        conn = self.connect()
+        try:
+            flushed = flush_counters(self.store, conn)
+        finally:
+            conn.close()
+        if flushed:
+            self.stats['flushes'] += 1
+            self.stats['counters_flushed'] += flushed
+        return flushed
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"Counter flush failed: {e}")
+
+    def stop(self):
+        """Stop the thread and flush once more if this process is the flusher"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 5)
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Final counter flush failed: {e}")
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['pending_counters'] = len(self.store.snapshot())
+        stats['store'] = type(self.store).__name__
+        return stats
@@ -0,0 +1,73 @@
+import hashlib
+import threading
+
+
+def text_key(text):
+    """Coalescing key for a text request: case and whitespace do not change the prediction"""
+    return 'text:' + ' '.join(text.lower().split())
+
+
+def image_key(data):
+    """Coalescing key for an image request: the SHA-256 of the uploaded bytes"""
+    return 'image:' + hashlib.sha256(data).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs one computation per key at a time; concurrent callers with the same key share its result.
+
+    Only in-flight calls are shared: once the leader finishes, the next call
+    for that key computes afresh, so results never go stale.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.stats = {'executed': 0, 'coalesced': 0, 'errors': 0}
+
+    def do(self, key, fn):
+        """Return (fn(), shared) where shared is True if another caller computed the result"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.stats['coalesced'] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.stats['executed'] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            with self._lock:
+                self.stats['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['in_flight'] = len(self._calls)
+        requests = stats['executed'] + stats['coalesced']
+        stats['coalesced_rate'] = stats['coalesced'] / requests if requests else 0.0
+        return stats
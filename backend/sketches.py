@@ -0,0 +1,441 @@
+"""
+Constant-memory streaming summaries of classifications.
+
+SpaceSaving tracks the most frequently classified item texts and TDigest
+the confidence and sustainability score distribution of each category.
+Both are updated in memory on every classification, and
+ClassificationSketches saves their state periodically as one row per
+worker process in analytics_sketches. Readers merge every worker's row, so
+the view is the same whichever worker serves it, and nodes can merge each
+other's exported states the same way.
+"""
+import heapq
+import json
+import logging
+import math
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+class SpaceSaving:
+    """Space-Saving heavy hitters: the top items of a stream in `capacity` counters.
+
+    Every item counted more than n / capacity times is guaranteed to be
+    kept. A new item replaces the smallest counter and inherits its count
+    as the `error` bound, so count - error <= true count <= count.
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = max(int(capacity), 1)
+        self.counters = {}
+        # Lazy min-heap of (count, item); entries whose count is outdated are skipped
+        self._heap = []
+
+    def update(self, item, label=None, weight=1):
+        counter = self.counters.get(item)
+        if counter is None:
+            if len(self.counters) >= self.capacity:
+                minimum, victim = self._pop_min()
+                del self.counters[victim]
+                counter = self.counters[item] = [minimum, minimum, label]
+            else:
+                counter = self.counters[item] = [0, 0, label]
+        counter[0] += weight
+        counter[2] = label
+        heapq.heappush(self._heap, (counter[0], item))
+        if len(self._heap) > 4 * self.capacity:
+            self._rebuild_heap()
+
+    def _pop_min(self):
+        while True:
+            count, item = heapq.heappop(self._heap)
+            counter = self.counters.get(item)
+            if counter is not None and counter[0] == count:
+                return count, item
+
+    def _rebuild_heap(self):
+        self._heap = [(counter[0], item) for item, counter in self.counters.items()]
+        heapq.heapify(self._heap)
+
+    def min_count(self):
+        """Count an item outside the summary may have reached"""
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(counter[0] for counter in self.counters.values())
+
+    def merge(self, other):
+        """Fold another summary in (mergeable summaries, Agarwal et al. 2012)"""
+        own_min, other_min = self.min_count(), other.min_count()
+        merged = {}
+        for item in set(self.counters) | set(other.counters):
+            own = self.counters.get(item, [own_min, own_min, None])
+            theirs = other.counters.get(item, [other_min, other_min, None])
+            label = own[2] if own[0] >= theirs[0] and own[2] is not None else theirs[2] or own[2]
+            merged[item] = [own[0] + theirs[0], own[1] + theirs[1], label]
+        kept = heapq.nlargest(self.capacity, merged.items(), key=lambda entry: entry[1][0])
+        self.counters = dict(kept)
+        self._rebuild_heap()
+
+    def top(self, n=10):
+        """(item, count, error, label) for the n largest counters"""
+        ranked = heapq.nlargest(n, self.counters.items(), key=lambda entry: entry[1][0])
+        return [(item, count, error, label) for item, (count, error, label) in ranked]
+
+    def to_dict(self):
+        return {
+            'capacity': self.capacity,
+            'items': [[item, count, error, label] for item, (count, error, label) in self.counters.items()]
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        summary = cls(state['capacity'])
+        summary.counters = {item: [count, error, label] for item, count, error, label in state['items']}
+        summary._rebuild_heap()
+        return summary
+
+
+class TDigest:
+    """Merging t-digest (Dunning) for streaming quantiles with small error near the tails.
+
+    Centroids are merged while they span at most one unit of the k1 scale
+    function, compression / (2 pi) * asin(2q - 1), which keeps them small
+    near q = 0 and q = 1 and bounds their number by about compression / 2
+    whatever the stream length.
+    """
+
+    def __init__(self, compression=100):
+        self.compression = float(compression)
+        self.centroids = []
+        self.buffer = []
+        self.count = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value, weight=1.0):
+        value = float(value)
+        self.buffer.append((value, float(weight)))
+        self.count += weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self.buffer) >= 5 * self.compression:
+            self.compress()
+
+    def compress(self):
+        if not self.buffer:
+            return
+        points = sorted(self.centroids + self.buffer)
+        self.buffer = []
+        total = sum(weight for _, weight in points)
+        merged = []
+        cumulative = 0.0
+        mean, weight = points[0]
+        k_left = self._scale(0.0)
+        for point_mean, point_weight in points[1:]:
+            if self._scale((cumulative + weight + point_weight) / total) - k_left <= 1.0:
+                weight += point_weight
+                mean += (point_mean - mean) * point_weight / weight
+            else:
+                merged.append((mean, weight))
+                cumulative += weight
+                k_left = self._scale(cumulative / total)
+                mean, weight = point_mean, point_weight
+        merged.append((mean, weight))
+        self.centroids = merged
+
+    def _scale(self, q):
+        return self.compression / (2.0 * math.pi) * math.asin(2.0 * min(max(q, 0.0), 1.0) - 1.0)
+
+    def merge(self, other):
+        for mean, weight in other.centroids + other.buffer:
+            self.buffer.append((mean, weight))
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.compress()
+
+    def quantile(self, q):
+        """Estimated value at quantile q in [0, 1], or None when empty"""
+        self.compress()
+        if not self.centroids:
+            return None
+        if len(self.centroids) == 1:
+            return self.centroids[0][0]
+        target = min(max(q, 0.0), 1.0) * self.count
+
+        # Interpolate between centroid centers; the ends interpolate to the exact min and max
+        previous_position, previous_mean = 0.0, self.min
+        cumulative = 0.0
+        for mean, weight in self.centroids:
+            position = cumulative + weight / 2.0
+            if target <= position:
+                span = position - previous_position
+                fraction = (target - previous_position) / span if span > 0 else 0.0
+                return previous_mean + fraction * (mean - previous_mean)
+            previous_position, previous_mean = position, mean
+            cumulative += weight
+        span = self.count - previous_position
+        fraction = (target - previous_position) / span if span > 0 else 1.0
+        return previous_mean + fraction * (self.max - previous_mean)
+
+    def to_dict(self):
+        self.compress()
+        return {
+            'compression': self.compression,
+            'count': self.count,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+            'centroids': self.centroids
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        digest = cls(state['compression'])
+        digest.centroids = [tuple(centroid) for centroid in state['centroids']]
+        digest.count = state['count']
+        if state['count']:
+            digest.min, digest.max = state['min'], state['max']
+        return digest
+
+
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+
+def normalize_item(text, max_length=200):
+    """Key under which item texts are counted: case and whitespace do not make a new item"""
+    return ' '.join(text.lower().split())[:max_length]
+
+
+def create_sketch_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_sketches (
+            worker TEXT PRIMARY KEY,
+            updated_at DATETIME,
+            state TEXT NOT NULL
+        )
+    ''')
+
+
+class ClassificationSketches:
+    """This worker's top items and per-category quantile sketches.
+
+    update() only touches memory. maybe_persist() writes the state to this
+    worker's analytics_sketches row at most every persist_interval seconds,
+    and on start-up a worker adopts (merges and deletes) rows of workers
+    that stopped updating more than stale_after seconds ago, so the table
+    holds about one row per live worker. An idle worker's row looks stale
+    too; when such a worker finds its row adopted, on its next save or
+    merged() read, it keeps only the updates made since its last save,
+    which the adopter never saw.
+    """
+
+    def __init__(self, capacity=1000, compression=100, persist_interval=30.0, stale_after=600.0, worker=None):
+        self.capacity = capacity
+        self.compression = compression
+        self.persist_interval = float(persist_interval)
+        self.stale_after = float(stale_after)
+        self.worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+        self._persist_lock = threading.Lock()
+        self._last_persist = time.monotonic()
+        self._dirty = False
+        self._loaded = False
+        self.items = SpaceSaving(capacity)
+        self.digests = {}
+        # Updates since the last save, for when the saved row is adopted meanwhile
+        self._pending_items = SpaceSaving(capacity)
+        self._pending_digests = {}
+
+    @classmethod
+    def from_env(cls):
+        """Build sketches from ECOSORT_SKETCH_* environment variables"""
+        return cls(
+            capacity=int(os.environ.get('ECOSORT_SKETCH_TOP_ITEMS', 1000)),
+            compression=float(os.environ.get('ECOSORT_SKETCH_COMPRESSION', 100)),
+            persist_interval=float(os.environ.get('ECOSORT_SKETCH_PERSIST_INTERVAL', 30.0))
+        )
+
+    def _digests(self, category, by_category=None):
+        by_category = self.digests if by_category is None else by_category
+        digests = by_category.get(category)
+        if digests is None:
+            digests = by_category[category] = {
+                'confidence': TDigest(self.compression),
+                'sustainability_score': TDigest(self.compression)
+            }
+        return digests
+
+    def update(self, input_type, input_data, category, confidence, score):
+        with self._lock:
+            # Image inputs are file names, which say nothing about the item
+            item = normalize_item(input_data) if input_type == 'text' else None
+            for items, by_category in ((self.items, self.digests), (self._pending_items, self._pending_digests)):
+                if item:
+                    items.update(item, label=category)
+                digests = self._digests(category, by_category)
+                digests['confidence'].add(confidence)
+                digests['sustainability_score'].add(score)
+            self._dirty = True
+
+    def to_dict(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        return {
+            'items': self.items.to_dict(),
+            'digests': {
+                category: {name: digest.to_dict() for name, digest in digests.items()}
+                for category, digests in self.digests.items()
+            }
+        }
+
+    def merge_state(self, state):
+        """Fold a to_dict() state from another worker or node into this one"""
+        with self._lock:
+            self.items.merge(SpaceSaving.from_dict(state['items']))
+            for category, digests in state['digests'].items():
+                own = self._digests(category)
+                for name, digest in digests.items():
+                    own[name].merge(TDigest.from_dict(digest))
+            self._dirty = True
+
+    def load(self, conn):
+        """Resume from this worker's saved row and adopt the rows of stopped workers"""
+        cutoff = (datetime.now() - timedelta(seconds=self.stale_after)).strftime('%Y-%m-%d %H:%M:%S')
+        cursor = conn.cursor()
+        create_sketch_table(cursor)
+        conn.commit()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            cursor.execute(
+                'SELECT worker, state FROM analytics_sketches WHERE worker = ? OR updated_at < ?',
+                (self.worker, cutoff)
+            )
+            rows = cursor.fetchall()
+            for _, state in rows:
+                self.merge_state(json.loads(state))
+            cursor.executemany('DELETE FROM analytics_sketches WHERE worker = ?', [(worker,) for worker, _ in rows])
+            self._write(cursor)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        self._loaded = True
+        self._last_persist = time.monotonic()
+
+    def _write(self, cursor):
+        with self._lock:
+            state = self._state()
+            self._pending_items = SpaceSaving(self.capacity)
+            self._pending_digests = {}
+            self._dirty = False
+        cursor.execute(
+            'INSERT OR REPLACE INTO analytics_sketches (worker, updated_at, state) VALUES (?, ?, ?)',
+            (self.worker, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), json.dumps(state))
+        )
+
+    def _drop_adopted(self, cursor):
+        """Keep only the unsaved updates if another worker adopted this worker's row"""
+        cursor.execute('SELECT 1 FROM analytics_sketches WHERE worker = ?', (self.worker,))
+        if cursor.fetchone() is not None:
+            return
+        # The adopter now counts everything saved in the row
+        logger.info(f"Sketch row of {self.worker} was adopted; keeping only unsaved updates")
+        with self._lock:
+            # Copies, as update() keeps adding to both until the next save
+            self.items = SpaceSaving.from_dict(self._pending_items.to_dict())
+            self.digests = {
+                category: {name: TDigest.from_dict(digest.to_dict()) for name, digest in digests.items()}
+                for category, digests in self._pending_digests.items()
+            }
+
+    def persist(self, conn):
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            self._drop_adopted(cursor)
+            self._write(cursor)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        self._last_persist = time.monotonic()
+
+    def maybe_persist(self, connect):
+        """Persist through connect() if persist_interval has passed; one caller at a time.
+
+        The first call loads this worker's saved state instead.
+        """
+        if self._loaded and (not self._dirty or time.monotonic() - self._last_persist < self.persist_interval):
+            return False
+        if not self._persist_lock.acquire(blocking=False):
+            return False
+        try:
+            conn = connect()
+            try:
+                if self._loaded:
+                    self.persist(conn)
+                else:
+                    self.load(conn)
+            finally:
+                conn.close()
+            return True
+        finally:
+            self._persist_lock.release()
+
+    def close(self, connect):
+        """Persist updates not yet saved, e.g. when the worker exits"""
+        if not self._dirty:
+            return
+        conn = connect()
+        try:
+            if self._loaded:
+                self.persist(conn)
+            else:
+                self.load(conn)
+        finally:
+            conn.close()
+
+    def merged(self, conn):
+        """Sketches of every worker: the saved rows of the others plus this worker's live state"""
+        combined = ClassificationSketches(self.capacity, self.compression, worker='merged')
+        create_sketch_table(conn.cursor())
+        if self._loaded:
+            self._drop_adopted(conn.cursor())
+        combined.merge_state(self.to_dict())
+        rows = conn.execute('SELECT worker, state FROM analytics_sketches WHERE worker != ?', (self.worker,))
+        workers = 1
+        for _, state in rows:
+            combined.merge_state(json.loads(state))
+            workers += 1
+        return combined, workers
+
+    def summary(self, limit=20, category=None):
+        with self._lock:
+            top = self.items.top(len(self.items.counters) if category else limit)
+            if category:
+                top = [entry for entry in top if entry[3] == category][:limit]
+            quantiles = {
+                name: {
+                    'count': int(digests['confidence'].count),
+                    **{
+                        metric: {f"p{round(q * 100)}": digest.quantile(q) for q in QUANTILES}
+                        for metric, digest in digests.items()
+                    }
+                }
+                for name, digests in self.digests.items()
+                if category is None or name == category
+            }
+        return {
+            'top_items': [
+                {'item': item, 'count': count, 'error': error, 'category': label}
+                for item, count, error, label in top
+            ],
+            'quantiles': quantiles
+        }
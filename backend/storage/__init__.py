@@ -0,0 +1,43 @@
+"""
+Pluggable classification storage.
+
+ECOSORT_STORAGE selects the backend ('sqlite', the default, 'partitioned' or
+'duckdb'); ECOSORT_DB_PATH and ECOSORT_DUCKDB_PATH name their database files
+and ECOSORT_PARTITION_DIR holds the monthly partitions.
+"""
+import os
+
+from .base import Storage
+from .duckdb_storage import DUCKDB_AVAILABLE, DuckDBStorage
+from .partitioned_storage import PartitionedSQLiteStorage
+from .sqlite_storage import SQLiteStorage
+
+STORAGE_BACKENDS = {
+    'sqlite': SQLiteStorage,
+    'partitioned': PartitionedSQLiteStorage,
+    'duckdb': DuckDBStorage
+}
+
+
+def sqlite_path():
+    """SQLite database path (ECOSORT_DB_PATH)"""
+    return os.environ.get('ECOSORT_DB_PATH', 'ecosort.db')
+
+
+def create_storage(kind=None, counters=None, path=None):
+    """Storage backend named by kind or ECOSORT_STORAGE.
+
+    path overrides the backend's database file (ECOSORT_DB_PATH, or
+    ECOSORT_DUCKDB_PATH for DuckDB). counters (a shared_counters store) only
+    applies to the SQLite backends, whose rollups it maintains.
+    """
+    kind = (kind or os.environ.get('ECOSORT_STORAGE', 'sqlite')).lower()
+    if kind == 'sqlite':
+        return SQLiteStorage(path or sqlite_path(), counters=counters)
+    if kind == 'partitioned':
+        return PartitionedSQLiteStorage(
+            path or sqlite_path(), os.environ.get('ECOSORT_PARTITION_DIR', 'partitions'), counters=counters
+        )
+    if kind == 'duckdb':
+        return DuckDBStorage(path or os.environ.get('ECOSORT_DUCKDB_PATH', 'ecosort.duckdb'))
+    raise ValueError(f"Unknown ECOSORT_STORAGE backend '{kind}'; expected one of {', '.join(STORAGE_BACKENDS)}")
@@ -0,0 +1,66 @@
+"""
+Interface every classification storage backend implements.
+
+Rows are (id, timestamp, input_type, input_data, category, confidence,
+sustainability_score, tips) tuples with datetime timestamps, as taken by
+database.store_classifications. Export rows follow export.EXPORT_COLUMNS.
+"""
+from abc import ABC, abstractmethod
+
+# Categories with their own column in the daily statistics
+DAILY_CATEGORIES = ('biodegradable', 'recyclable', 'hazardous')
+
+
+def daily_statistics_entry(date, biodegradable, recyclable, hazardous, total):
+    return {
+        'date': date,
+        'biodegradable': biodegradable,
+        'recyclable': recyclable,
+        'hazardous': hazardous,
+        'total': total
+    }
+
+
+class Storage(ABC):
+    """Where classifications are written and where analytics and exports read them"""
+
+    name = None
+
+    def __init__(self, path):
+        self.path = path
+
+    @abstractmethod
+    def initialize(self):
+        """Create or migrate the schema"""
+
+    def insert(self, row):
+        """Store one classification; returns its tip-set id"""
+        return self.insert_many([row])[0]
+
+    @abstractmethod
+    def insert_many(self, rows):
+        """Store classifications in one transaction; returns the tip-set id of each row"""
+
+    @abstractmethod
+    def existing_ids(self, ids):
+        """The subset of ids that are already stored"""
+
+    @abstractmethod
+    def range_analytics(self, start_date, end_date):
+        """Analytics for the inclusive YYYY-MM-DD day range.
+
+        Returns daily_statistics (one daily_statistics_entry per day with
+        classifications, in date order), category_distribution,
+        category_averages, input_type_distribution and total_classifications.
+        """
+
+    @abstractmethod
+    def iter_export_rows(self, start_date=None, end_date=None, after=None, chunk_size=1000):
+        """Yield lists of EXPORT_COLUMNS rows ordered by (timestamp, id), after the (timestamp, id) cursor"""
+
+    @abstractmethod
+    def get_tip_set(self, tip_set_id):
+        """Tip list stored under tip_set_id, or None"""
+
+    def close(self):
+        pass
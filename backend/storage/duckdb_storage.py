@@ -0,0 +1,216 @@
+"""
+DuckDB storage: one denormalized, column-oriented classifications table.
+
+Range analytics are computed from the raw rows on every call. That needs no
+rollups, because DuckDB scans only the timestamp, category and metric
+columns with vectorized execution. It is much faster than SQLite over
+long histories, but only one process may open the database file for
+writing.
+"""
+import json
+import threading
+from datetime import datetime, timedelta
+
+from export import day_bounds
+from rollups import summarize_rows
+
+from .base import DAILY_CATEGORIES, Storage, daily_statistics_entry
+
+DUCKDB_AVAILABLE = False
+try:
+    import duckdb
+    DUCKDB_AVAILABLE = True
+except ImportError:
+    pass
+
+
+class DuckDBStorage(Storage):
+    """Columnar store for analytics over large histories"""
+
+    name = 'duckdb'
+
+    def __init__(self, path='ecosort.duckdb'):
+        if not DUCKDB_AVAILABLE:
+            raise RuntimeError("The duckdb package is required for ECOSORT_STORAGE=duckdb")
+        super().__init__(path)
+        self._conn = duckdb.connect(path)
+        self._lock = threading.Lock()
+        self._tip_sets = {}
+
+    def _cursor(self):
+        # DuckDB connections are not thread-safe; cursors are per-thread connections to the same database
+        return self._conn.cursor()
+
+    def initialize(self):
+        cursor = self._cursor()
+        try:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS tip_sets (
+                    id INTEGER PRIMARY KEY,
+                    tips VARCHAR NOT NULL UNIQUE
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS classifications (
+                    id VARCHAR PRIMARY KEY,
+                    timestamp TIMESTAMP,
+                    input_type VARCHAR,
+                    input_data VARCHAR,
+                    category VARCHAR,
+                    confidence DOUBLE,
+                    sustainability_score DOUBLE,
+                    tip_set_id INTEGER
+                )
+            ''')
+        finally:
+            cursor.close()
+
+    def _tip_set_id(self, cursor, tips):
+        if tips is None:
+            return None
+        key = tuple(tips)
+        tip_set_id = self._tip_sets.get(key)
+        if tip_set_id is None:
+            encoded = json.dumps(list(key))
+            row = cursor.execute('SELECT id FROM tip_sets WHERE tips = ?', [encoded]).fetchone()
+            if row is None:
+                row = cursor.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM tip_sets').fetchone()
+                cursor.execute('INSERT INTO tip_sets (id, tips) VALUES (?, ?)', [row[0], encoded])
+            tip_set_id = self._tip_sets[key] = row[0]
+        return tip_set_id
+
+    def insert_many(self, rows):
+        cursor = self._cursor()
+        try:
+            # New tip sets take the next free id, so inserts are serialized
+            with self._lock:
+                cursor.begin()
+                try:
+                    values = [
+                        (
+                            classification_id, timestamp, input_type, input_data, category,
+                            confidence, score, self._tip_set_id(cursor, tips)
+                        )
+                        for classification_id, timestamp, input_type, input_data, category, confidence, score, tips
+                        in rows
+                    ]
+                    cursor.executemany('''
+                        INSERT INTO classifications
+                        (id, timestamp, input_type, input_data, category, confidence, sustainability_score, tip_set_id)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', values)
+                    cursor.commit()
+                except Exception:
+                    cursor.rollback()
+                    # Ids cached during a failed transaction may never have been committed
+                    self._tip_sets.clear()
+                    raise
+        finally:
+            cursor.close()
+        return [value[7] for value in values]
+
+    def existing_ids(self, ids):
+        ids = list(ids)
+        if not ids:
+            return set()
+        cursor = self._cursor()
+        try:
+            rows = cursor.execute(
+                f"SELECT id FROM classifications WHERE id IN ({','.join('?' * len(ids))})", ids
+            ).fetchall()
+        finally:
+            cursor.close()
+        return {row[0] for row in rows}
+
+    def range_analytics(self, start_date, end_date):
+        low = datetime.strptime(start_date, '%Y-%m-%d')
+        high = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
+        category_counts = ', '.join(
+            f"COUNT(*) FILTER (WHERE category = '{category}')" for category in DAILY_CATEGORIES
+        )
+
+        cursor = self._cursor()
+        try:
+            daily_stats = cursor.execute(f'''
+                SELECT strftime(timestamp, '%Y-%m-%d') AS day, {category_counts}, COUNT(*)
+                FROM classifications
+                WHERE timestamp >= ? AND timestamp < ?
+                GROUP BY day
+                ORDER BY day
+            ''', [low, high]).fetchall()
+
+            totals = cursor.execute('''
+                SELECT input_type, category, COUNT(*),
+                       COALESCE(SUM(confidence), 0), COALESCE(SUM(sustainability_score), 0)
+                FROM classifications
+                WHERE timestamp >= ? AND timestamp < ?
+                GROUP BY input_type, category
+                ORDER BY input_type, category
+            ''', [low, high]).fetchall()
+        finally:
+            cursor.close()
+
+        summary = summarize_rows([
+            {
+                'input_type': input_type,
+                'category': category,
+                'count': count,
+                'confidence_sum': confidence_sum,
+                'score_sum': score_sum
+            }
+            for input_type, category, count, confidence_sum, score_sum in totals
+        ])
+        summary['daily_statistics'] = [daily_statistics_entry(*row) for row in daily_stats]
+        return summary
+
+    def iter_export_rows(self, start_date=None, end_date=None, after=None, chunk_size=1000):
+        low, high = day_bounds(start_date, end_date)
+
+        conditions = []
+        params = []
+        if low:
+            conditions.append('c.timestamp >= CAST(? AS TIMESTAMP)')
+            params.append(low)
+        if high:
+            conditions.append('c.timestamp < CAST(? AS TIMESTAMP)')
+            params.append(high)
+        if after:
+            conditions.append(
+                '(c.timestamp > CAST(? AS TIMESTAMP) OR (c.timestamp = CAST(? AS TIMESTAMP) AND c.id > ?))'
+            )
+            params.extend([after[0], after[0], after[1]])
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+        cursor = self._cursor()
+        try:
+            # Timestamps are formatted like Python's str(datetime), as stored by SQLite
+            cursor.execute(f'''
+                SELECT c.id,
+                       CASE WHEN microsecond(c.timestamp) % 1000000 = 0
+                            THEN strftime(c.timestamp, '%Y-%m-%d %H:%M:%S')
+                            ELSE strftime(c.timestamp, '%Y-%m-%d %H:%M:%S.%f') END,
+                       c.input_type, c.input_data, c.category,
+                       c.confidence, c.sustainability_score, t.tips
+                FROM classifications c
+                LEFT JOIN tip_sets t ON t.id = c.tip_set_id
+                {where}
+                ORDER BY c.timestamp, c.id
+            ''', params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+    def get_tip_set(self, tip_set_id):
+        cursor = self._cursor()
+        try:
+            row = cursor.execute('SELECT tips FROM tip_sets WHERE id = ?', [tip_set_id]).fetchone()
+        finally:
+            cursor.close()
+        return json.loads(row[0]) if row else None
+
+    def close(self):
+        self._conn.close()
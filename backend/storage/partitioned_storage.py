@@ -0,0 +1,197 @@
+"""
+Time-partitioned SQLite storage: one database file per month of classifications.
+
+The main database keeps the categories, tip sets, rollups and analytics
+tables. Classification rows go to <partition_dir>/classifications-YYYY-MM.db,
+which is attached to the main connection when needed. Each partition's index
+only covers its own month. Range reads attach only the months they cover,
+and dropping a month deletes one file instead of running a DELETE. A
+connection attaches at most one partition, which keeps reads within
+SQLite's limit on attached databases.
+"""
+import logging
+import os
+import re
+from datetime import datetime
+
+from database import details_select, store_classifications
+from export import iter_keyset_rows
+
+from .sqlite_storage import SQLiteStorage
+
+logger = logging.getLogger(__name__)
+
+PARTITION_FILE = re.compile(r'^classifications-(\d{4}-\d{2})\.db$')
+
+
+def _month_bounds(month):
+    """Timestamp bounds [low, high) of a 'YYYY-MM' month"""
+    start = datetime.strptime(month, '%Y-%m')
+    end = start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return f"{start:%Y-%m-%d} 00:00:00", f"{end:%Y-%m-%d} 00:00:00"
+
+
+class PartitionedSQLiteStorage(SQLiteStorage):
+    """SQLite storage with classifications split into monthly database files.
+
+    Analytics read the rollups in the main database, so they never open a
+    partition. Dropping a month removes its raw rows but, as with the
+    Parquet archive, keeps its totals in the rollups.
+    """
+
+    name = 'partitioned'
+
+    def __init__(self, path='ecosort.db', partition_dir='partitions', counters=None):
+        super().__init__(path, counters=counters)
+        self.partition_dir = partition_dir
+
+    def partition_path(self, month):
+        return os.path.join(self.partition_dir, f"classifications-{month}.db")
+
+    def list_partitions(self, start_date=None, end_date=None):
+        """Partition files as (month, path) pairs in chronological order, pruned to the date range"""
+        if not os.path.isdir(self.partition_dir):
+            return []
+
+        first_month = start_date[:7] if start_date else None
+        last_month = end_date[:7] if end_date else None
+
+        partitions = []
+        for name in sorted(os.listdir(self.partition_dir)):
+            match = PARTITION_FILE.match(name)
+            if not match:
+                continue
+            month = match.group(1)
+            if (first_month and month < first_month) or (last_month and month > last_month):
+                continue
+            partitions.append((month, os.path.join(self.partition_dir, name)))
+        return partitions
+
+    def attach(self, conn, month):
+        """Attach a month's partition to conn, creating it if needed; returns its schema name"""
+        datetime.strptime(month, '%Y-%m')
+        schema = f"partition_{month.replace('-', '_')}"
+        os.makedirs(self.partition_dir, exist_ok=True)
+        conn.execute(f'ATTACH DATABASE ? AS {schema}', (self.partition_path(month),))
+
+        # Category and tip-set ids refer to the tables in the main database
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {schema}.classifications (
+                id TEXT PRIMARY KEY,
+                timestamp DATETIME,
+                input_type TEXT,
+                input_data TEXT,
+                category_id INTEGER,
+                confidence REAL,
+                sustainability_score REAL,
+                tip_set_id INTEGER
+            )
+        ''')
+        conn.execute(f'''
+            CREATE INDEX IF NOT EXISTS {schema}.idx_classifications_timestamp
+            ON classifications (timestamp, id)
+        ''')
+        return schema
+
+    def connect_month(self, month):
+        """Main database connection whose classification_details covers one month's partition.
+
+        The TEMP view shadows the main database's own view.
+        """
+        conn = self.connect()
+        try:
+            schema = self.attach(conn, month)
+            conn.execute(f"CREATE TEMP VIEW classification_details AS {details_select(f'{schema}.classifications')}")
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def initialize(self):
+        super().initialize()
+
+        # Rows written before partitioning move to their month's partition
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT DISTINCT SUBSTR(timestamp, 1, 7) FROM main.classifications
+                WHERE timestamp IS NOT NULL
+                ORDER BY 1
+            ''')
+            for (month,) in cursor.fetchall():
+                schema = self.attach(conn, month)
+                low, high = _month_bounds(month)
+                cursor.execute(f'''
+                    INSERT INTO {schema}.classifications
+                    (id, timestamp, input_type, input_data, category_id, confidence, sustainability_score, tip_set_id)
+                    SELECT id, timestamp, input_type, input_data, category_id, confidence, sustainability_score, tip_set_id
+                    FROM main.classifications
+                    WHERE timestamp >= ? AND timestamp < ?
+                ''', (low, high))
+                moved = cursor.rowcount
+                cursor.execute('DELETE FROM main.classifications WHERE timestamp >= ? AND timestamp < ?', (low, high))
+                conn.commit()
+                conn.execute(f'DETACH DATABASE {schema}')
+                logger.info(f"Moved {moved} classifications for {month} to {self.partition_path(month)}")
+        finally:
+            conn.close()
+
+    def insert_many(self, rows):
+        conn = self.connect()
+        try:
+            # One transaction across the main database and every partition written to
+            schemas = {month: self.attach(conn, month) for month in {row[1].strftime('%Y-%m') for row in rows}}
+            return store_classifications(
+                conn, self.lookups, rows, counters=self.counters,
+                table_for=lambda timestamp: f"{schemas[timestamp.strftime('%Y-%m')]}.classifications"
+            )
+        finally:
+            conn.close()
+
+    def existing_ids(self, ids):
+        ids = set(ids)
+        # Ids do not say which month they were stored in; recent partitions are the likeliest
+        found = super().existing_ids(ids)
+        for month, _ in reversed(self.list_partitions()):
+            if found >= ids:
+                break
+            conn = self.connect()
+            try:
+                schema = self.attach(conn, month)
+                rows = conn.execute(
+                    f"SELECT id FROM {schema}.classifications WHERE id IN ({','.join('?' * len(ids))})", list(ids)
+                ).fetchall()
+            finally:
+                conn.close()
+            found.update(row[0] for row in rows)
+        return found
+
+    def iter_export_rows(self, start_date=None, end_date=None, after=None, chunk_size=1000):
+        # Months do not overlap, so reading them one after another keeps (timestamp, id) order.
+        # Every chunk is its own query, so no lock is held on the main database
+        # or a partition while a chunk is sent
+        for month, _ in self.list_partitions(start_date, end_date):
+            if after and month < after[0][:7]:
+                continue
+            yield from iter_keyset_rows(
+                lambda month=month: self.connect_month(month), start_date, end_date,
+                after=after, chunk_size=chunk_size
+            )
+
+    def drop_partition(self, month):
+        """Delete a past month's partition file; returns False if there was none"""
+        datetime.strptime(month, '%Y-%m')
+        if month >= datetime.now().strftime('%Y-%m'):
+            raise ValueError("Only partitions of past months can be dropped")
+
+        path = self.partition_path(month)
+        if not os.path.exists(path):
+            return False
+        os.remove(path)
+        # A hot journal left by a crashed writer would otherwise be replayed into a recreated file
+        for suffix in ('-journal', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        logger.info(f"Dropped classification partition {month}")
+        return True
@@ -0,0 +1,101 @@
+"""
+SQLite storage: the normalized classifications table with hourly, daily and
+monthly rollups, as created by database.initialize_database.
+"""
+import json
+import sqlite3
+from contextlib import nullcontext
+
+from database import LookupCache, initialize_database, store_classifications
+from export import iter_rows
+from rollups import summarize_day_range
+from shared_counters import add_pending_days, pending_rollup_rows
+
+from .base import Storage, daily_statistics_entry
+
+
+class SQLiteStorage(Storage):
+    """Row store with pre-aggregated rollups; analytics read the rollups, not raw rows.
+
+    With a shared counter store (shared_counters), inserts leave the rollups
+    to the counter flusher and analytics add the counts still pending there.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path='ecosort.db', counters=None):
+        super().__init__(path)
+        self.counters = counters
+        # Category and tip-set ids for the normalized classifications table
+        self.lookups = LookupCache()
+
+    def connect(self):
+        return sqlite3.connect(self.path)
+
+    def initialize(self):
+        conn = self.connect()
+        try:
+            initialize_database(conn)
+        finally:
+            conn.close()
+
+    def insert_many(self, rows):
+        conn = self.connect()
+        try:
+            return store_classifications(conn, self.lookups, rows, counters=self.counters)
+        finally:
+            conn.close()
+
+    def existing_ids(self, ids):
+        ids = list(ids)
+        if not ids:
+            return set()
+        conn = self.connect()
+        try:
+            rows = conn.execute(
+                f"SELECT id FROM classifications WHERE id IN ({','.join('?' * len(ids))})", ids
+            ).fetchall()
+        finally:
+            conn.close()
+        return {row[0] for row in rows}
+
+    def range_analytics(self, start_date, end_date):
+        # The lock keeps a counter flush from landing between reading the
+        # pending counts and reading the tables
+        with self.counters.flush_lock() if self.counters else nullcontext():
+            pending = pending_rollup_rows(self.counters, start_date, end_date) if self.counters else []
+
+            conn = self.connect()
+            try:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT
+                        date,
+                        biodegradable_count,
+                        recyclable_count,
+                        hazardous_count,
+                        total_classifications
+                    FROM analytics
+                    WHERE date BETWEEN ? AND ?
+                    ORDER BY date
+                ''', (start_date, end_date))
+                daily_stats = add_pending_days(cursor.fetchall(), pending)
+
+                # Category distribution and totals come from the coarsest covering rollups
+                summary = summarize_day_range(cursor, start_date, end_date, pending)
+            finally:
+                conn.close()
+
+        summary['daily_statistics'] = [daily_statistics_entry(*row) for row in daily_stats]
+        return summary
+
+    def iter_export_rows(self, start_date=None, end_date=None, after=None, chunk_size=1000):
+        return iter_rows(self.path, start_date, end_date, after=after, chunk_size=chunk_size)
+
+    def get_tip_set(self, tip_set_id):
+        conn = self.connect()
+        try:
+            row = conn.execute('SELECT tips FROM tip_sets WHERE id = ?', (tip_set_id,)).fetchone()
+        finally:
+            conn.close()
+        return json.loads(row[0]) if row else None
@@ -0,0 +1,380 @@
+"""
+Conveyor-belt stream classification.
+
+Reads frames from an MJPEG stream (HTTP URL, file or stdin) or a directory
+of frame images. A frame that differs from the background belt starts an
+object, and consecutive frames until the belt is empty again belong to that
+object. Frames that barely changed since the last classified frame are
+skipped, the rest are classified in batches, and each object is reported
+and stored as one row with the averaged prediction of its frames.
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import sys
+import time
+import urllib.request
+import uuid
+from datetime import datetime
+
+import numpy as np
+from PIL import Image
+
+from storage import create_storage
+
+logger = logging.getLogger(__name__)
+
+FRAME_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# Side of the color thumbnail used for frame differencing
+DIFF_SIZE = 32
+
+
+def jpeg_end(data, start):
+    """Index just past the EOI of the JPEG whose SOI is at data[start].
+
+    Returns None if data ends first and -1 if the marker structure is broken.
+    Marker segments are skipped by their length, so the EOI of an EXIF or
+    JFIF thumbnail inside an APPn segment does not end the frame.
+    """
+    pos = start + 2
+    size = len(data)
+    while True:
+        if pos + 1 >= size:
+            return None
+        if data[pos] != 0xFF:
+            return -1
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            pos += 1
+            continue
+        if marker == 0xD9:
+            return pos + 2
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            pos += 2
+            continue
+        if pos + 3 >= size:
+            return None
+        length = int.from_bytes(data[pos + 2:pos + 4], 'big')
+        if length < 2:
+            return -1
+        pos += 2 + length
+        if marker == 0xDA:
+            # Entropy-coded data runs to the next marker; 0xFF00 is an escaped
+            # 0xFF and restart markers belong to the scan
+            while True:
+                pos = data.find(b'\xff', pos)
+                if pos < 0 or pos + 1 >= size:
+                    return None
+                following = data[pos + 1]
+                if following == 0xFF:
+                    pos += 1
+                elif following == 0x00 or 0xD0 <= following <= 0xD7:
+                    pos += 2
+                else:
+                    break
+
+
+def iter_mjpeg(stream, chunk_size=65536):
+    """Yield JPEG frames from a multipart MJPEG (or concatenated JPEG) byte stream"""
+    buffer = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        buffer += chunk
+        while True:
+            start = buffer.find(b'\xff\xd8')
+            if start < 0:
+                buffer = buffer[-1:]
+                break
+            end = jpeg_end(buffer, start)
+            if end is None:
+                buffer = buffer[start:]
+                break
+            if end < 0:
+                logger.warning("Skipping malformed JPEG frame in MJPEG stream")
+                buffer = buffer[start + 2:]
+                continue
+            yield buffer[start:end]
+            buffer = buffer[end:]
+
+
+def iter_frame_directory(directory, follow=False, poll_interval=0.5):
+    """Yield frame file contents in name order, optionally waiting for new frames"""
+    seen = set()
+    while True:
+        names = sorted(
+            name for name in os.listdir(directory)
+            if name.lower().endswith(FRAME_EXTENSIONS) and name not in seen
+        )
+        for name in names:
+            seen.add(name)
+            with open(os.path.join(directory, name), 'rb') as f:
+                yield f.read()
+        if not follow:
+            return
+        if not names:
+            time.sleep(poll_interval)
+
+
+def open_source(source, follow=False):
+    """Frame iterator for a frame directory, an MJPEG URL, an MJPEG file or '-' for stdin"""
+    if os.path.isdir(source):
+        return iter_frame_directory(source, follow=follow)
+    if source == '-':
+        return iter_mjpeg(sys.stdin.buffer)
+    if source.startswith(('http://', 'https://')):
+        return iter_mjpeg(urllib.request.urlopen(source))
+    return iter_mjpeg(open(source, 'rb'))
+
+
+def diff_thumbnail(data):
+    """Small RGB float array of a frame, decoded at reduced size where the codec allows"""
+    img = Image.open(io.BytesIO(data))
+    # JPEG can decode straight to a fraction of its size, far cheaper than a full decode.
+    # Color is kept so objects as bright as the belt still stand out
+    img.draft('RGB', (DIFF_SIZE * 2, DIFF_SIZE * 2))
+    return np.asarray(img.convert('RGB').resize((DIFF_SIZE, DIFF_SIZE), Image.BILINEAR), dtype=np.float32)
+
+
+def frame_difference(a, b):
+    """Mean over pixels of the largest per-channel absolute difference"""
+    return np.abs(a - b).max(axis=2).mean()
+
+
+class TrackedObject:
+    """Running aggregate of the frame predictions of one object on the belt"""
+
+    def __init__(self, number, first_frame):
+        self.number = number
+        self.first_frame = first_frame
+        self.last_frame = first_frame
+        self.probability_sums = {}
+        self.frames_classified = 0
+
+    def add(self, prediction):
+        for category, probability in prediction['all_probabilities'].items():
+            self.probability_sums[category] = self.probability_sums.get(category, 0.0) + probability
+        self.frames_classified += 1
+
+    def result(self):
+        averages = {
+            category: total / self.frames_classified
+            for category, total in self.probability_sums.items()
+        }
+        category = max(averages, key=averages.get)
+        return {
+            'object': self.number,
+            'category': category,
+            'confidence': averages[category],
+            'all_probabilities': averages,
+            'first_frame': self.first_frame,
+            'last_frame': self.last_frame,
+            'frames_classified': self.frames_classified
+        }
+
+
+class StreamClassifier:
+    """Frame gate, batcher and per-object aggregator in front of ImageClassifier.predict_batch.
+
+    object_threshold is the mean absolute pixel difference from the
+    background that marks a frame as containing an object; change_threshold
+    is the difference from the last classified frame below which a frame is
+    skipped as unchanged; an object ends after gap_frames empty frames.
+    """
+
+    def __init__(self, image_classifier, batch_size=16, change_threshold=3.0, object_threshold=12.0,
+                 gap_frames=5, background_alpha=0.05):
+        self.image_classifier = image_classifier
+        self.batch_size = batch_size
+        self.change_threshold = change_threshold
+        self.object_threshold = object_threshold
+        self.gap_frames = gap_frames
+        self.background_alpha = background_alpha
+
+        self.background = None
+        self.last_classified = None
+        self.current = None
+        self.empty_run = 0
+        self.pending = []
+        self.finished = []
+        self.objects = 0
+        self.stats = {'frames': 0, 'empty': 0, 'unchanged': 0, 'classified': 0, 'batches': 0, 'objects': 0}
+
+    def process(self, frame_number, data):
+        """Feed one encoded frame; returns the results of objects that ended"""
+        self.stats['frames'] += 1
+        thumbnail = diff_thumbnail(data)
+
+        if self.background is None:
+            # The first frame is taken to show the empty belt
+            self.background = thumbnail
+            self.stats['empty'] += 1
+            return self._drain()
+
+        if frame_difference(thumbnail, self.background) < self.object_threshold:
+            self.stats['empty'] += 1
+            # Track slow lighting changes on the empty belt
+            self.background += self.background_alpha * (thumbnail - self.background)
+            if self.current is not None:
+                self.empty_run += 1
+                if self.empty_run >= self.gap_frames:
+                    self._end_object()
+            return self._drain()
+
+        self.empty_run = 0
+        if self.current is None:
+            self.objects += 1
+            self.current = TrackedObject(self.objects, frame_number)
+            self.last_classified = None
+        self.current.last_frame = frame_number
+
+        if self.last_classified is not None and \
+                frame_difference(thumbnail, self.last_classified) < self.change_threshold:
+            self.stats['unchanged'] += 1
+            return self._drain()
+
+        self.last_classified = thumbnail
+        image = Image.open(io.BytesIO(data)).convert('RGB')
+        self.pending.append((self.current, image))
+        if len(self.pending) >= self.batch_size:
+            self._classify_pending()
+        return self._drain()
+
+    def close(self):
+        """End the object still on the belt and return every remaining result"""
+        if self.current is not None:
+            self._end_object()
+        return self._drain()
+
+    def _classify_pending(self):
+        if not self.pending:
+            return
+        predictions = self.image_classifier.predict_batch([image for _, image in self.pending],
+                                                          batch_size=self.batch_size)
+        for (tracked, _), prediction in zip(self.pending, predictions):
+            tracked.add(prediction)
+        self.stats['classified'] += len(self.pending)
+        self.stats['batches'] += 1
+        self.pending = []
+
+    def _end_object(self):
+        # Its frames may still be waiting for a batch
+        self._classify_pending()
+        if self.current.frames_classified:
+            self.finished.append(self.current)
+            self.stats['objects'] += 1
+        self.current = None
+        self.empty_run = 0
+
+    def _drain(self):
+        finished, self.finished = self.finished, []
+        return finished
+
+
+def build_rows(source, finished, scorer):
+    """Classification rows for finished objects, one per object"""
+    rows = []
+    for tracked in finished:
+        result = tracked.result()
+        data = scorer.get_score(result['category']) if scorer is not None else {}
+        rows.append((
+            str(uuid.uuid4()),
+            datetime.now(),
+            'stream',
+            f"{source}#object-{result['object']} (frames {result['first_frame']}-{result['last_frame']})",
+            result['category'],
+            result['confidence'],
+            data.get('score', 0.0),
+            list(data.get('tips', []))
+        ))
+    return rows
+
+
+def run(source, db_path=None, store=True, flush_every=10, follow=False, **options):
+    """Classify a stream until it ends, storing objects through the ECOSORT_STORAGE backend.
+
+    db_path overrides the backend's database file.
+    """
+    from models.image_classifier import ImageClassifier
+    from models.sustainability_scorer import SustainabilityScorer
+
+    stream = StreamClassifier(ImageClassifier(), **options)
+    scorer = SustainabilityScorer()
+
+    storage = None
+    if store:
+        storage = create_storage(path=db_path)
+        storage.initialize()
+
+    unsaved = []
+    started = time.perf_counter()
+
+    def emit(finished):
+        for tracked in finished:
+            print(json.dumps(tracked.result()), flush=True)
+        if storage is not None:
+            unsaved.extend(build_rows(source, finished, scorer))
+            # Objects are written in small transactions rather than per frame
+            if len(unsaved) >= flush_every:
+                storage.insert_many(unsaved)
+                unsaved.clear()
+
+    try:
+        for frame_number, data in enumerate(open_source(source, follow=follow)):
+            try:
+                emit(stream.process(frame_number, data))
+            except OSError as e:
+                logger.warning(f"Skipping undecodable frame {frame_number}: {e}")
+    except KeyboardInterrupt:
+        logger.info("Interrupted, finishing the current object")
+    finally:
+        emit(stream.close())
+        if storage is not None:
+            if unsaved:
+                storage.insert_many(unsaved)
+            storage.close()
+
+    elapsed = time.perf_counter() - started
+    stats = dict(stream.stats)
+    stats['frames_per_second'] = stats['frames'] / elapsed if elapsed else 0.0
+    logger.info(f"Stream finished: {json.dumps(stats)}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify objects on a conveyor-belt camera stream")
+    parser.add_argument('source', help="Frame directory, MJPEG file or URL, or '-' for MJPEG on stdin")
+    parser.add_argument('--db', help="Database of the ECOSORT_STORAGE backend "
+                                     "(default: ECOSORT_DB_PATH, or ECOSORT_DUCKDB_PATH for DuckDB)")
+    parser.add_argument('--no-store', action='store_true', help="Only print per-object results")
+    parser.add_argument('--follow', action='store_true',
+                        help="Keep watching a frame directory for new frames")
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--change-threshold', type=float, default=3.0,
+                        help="Mean pixel change below which a frame is skipped as unchanged")
+    parser.add_argument('--object-threshold', type=float, default=12.0,
+                        help="Mean pixel difference from the empty belt that marks an object")
+    parser.add_argument('--gap-frames', type=int, default=5,
+                        help="Empty frames that end an object")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    run(
+        args.source,
+        db_path=args.db,
+        store=not args.no_store,
+        follow=args.follow,
+        batch_size=args.batch_size,
+        change_threshold=args.change_threshold,
+        object_threshold=args.object_threshold,
+        gap_frames=args.gap_frames
+    )
+
+
+if __name__ == '__main__':
+    main()
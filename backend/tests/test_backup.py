@@ -0,0 +1,87 @@
+"""
+Snapshots, retention and verified restore of backup.py.
+"""
+import os
+import sqlite3
+
+import pytest
+
+from backup import BackupError, create_snapshot, integrity_check, list_backups, restore_backup
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = os.path.join(tmp_path, 'ecosort.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)')
+    conn.executemany('INSERT INTO items (name) VALUES (?)', [(f"item {i}" * 20,) for i in range(2000)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def count_items(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM items').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_snapshot_copies_in_steps(db_path, tmp_path):
+    stats = create_snapshot(db_path, os.path.join(tmp_path, 'backups'), step_pages=8, step_sleep=0)
+    assert stats['steps'] > 1
+    assert stats['restarts'] == 0
+    assert stats['bytes'] == stats['pages'] * stats['page_size']
+    assert integrity_check(stats['path']) == ['ok']
+    assert count_items(stats['path']) == 2000
+
+
+def test_wal_snapshot_is_self_contained(db_path, tmp_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute("INSERT INTO items (name) VALUES ('in the wal')")
+    conn.commit()
+
+    stats = create_snapshot(db_path, os.path.join(tmp_path, 'backups'))
+    conn.close()
+    assert stats['journal_mode'] == 'wal'
+    assert stats['max_writer_pause_ms'] == 0
+    snapshot = sqlite3.connect(stats['path'])
+    assert snapshot.execute('PRAGMA journal_mode').fetchone()[0] == 'delete'
+    snapshot.close()
+    assert count_items(stats['path']) == 2001
+
+
+def test_min_age_and_retention(db_path, tmp_path):
+    backup_dir = os.path.join(tmp_path, 'backups')
+    first = create_snapshot(db_path, backup_dir)
+    assert create_snapshot(db_path, backup_dir, min_age=3600) is None
+
+    # Names have one-second resolution, so rename the first to look older
+    os.replace(first['path'], os.path.join(backup_dir, 'ecosort-20000101-000000.db'))
+    second = create_snapshot(db_path, backup_dir, keep=1)
+    assert second['pruned'] == [os.path.join(backup_dir, 'ecosort-20000101-000000.db')]
+    assert [path for _, path in list_backups(backup_dir, db_path)] == [second['path']]
+
+
+def test_restore_round_trip(db_path, tmp_path):
+    stats = create_snapshot(db_path, os.path.join(tmp_path, 'backups'))
+    conn = sqlite3.connect(db_path)
+    conn.execute('DELETE FROM items')
+    conn.commit()
+    conn.close()
+
+    assert restore_backup(stats['path'], db_path)['integrity'] == 'ok'
+    assert count_items(db_path) == 2000
+
+
+def test_restore_refuses_corrupt_snapshot(db_path, tmp_path):
+    stats = create_snapshot(db_path, os.path.join(tmp_path, 'backups'))
+    with open(stats['path'], 'r+b') as snapshot:
+        snapshot.seek(stats['page_size'] * 2)
+        snapshot.write(b'\xff' * stats['page_size'])
+
+    with pytest.raises(BackupError):
+        restore_backup(stats['path'], db_path)
+    assert count_items(db_path) == 2000
@@ -0,0 +1,39 @@
+"""
+Re-running bulk classification into a database that already holds its rows.
+"""
+import os
+
+from bulk_classify import StorageSink
+from storage import SQLiteStorage
+
+from test_storage_conformance import export_all, sample_rows
+
+
+def test_restart_skips_rows_of_an_earlier_run(tmp_path):
+    storage = SQLiteStorage(os.path.join(tmp_path, 'ecosort.db'))
+    rows = sample_rows()
+    for _ in range(2):
+        sink = StorageSink(storage)
+        sink.write('text', 0, rows[:2])
+        sink.write('text', 2, rows[2:])
+    assert [exported[0] for exported in export_all(storage)] == ['a', 'b', 'c', 'd', 'e']
+
+
+def test_resume_checks_only_the_first_batch(tmp_path):
+    storage = SQLiteStorage(os.path.join(tmp_path, 'ecosort.db'))
+    rows = sample_rows()
+    StorageSink(storage).write('text', 0, rows[:2])
+
+    checked = []
+    existing_ids = storage.existing_ids
+
+    def record(ids):
+        checked.append(list(ids))
+        return existing_ids(checked[-1])
+
+    storage.existing_ids = record
+    sink = StorageSink(storage, resumed=True)
+    sink.write('text', 0, rows[:2])
+    sink.write('text', 2, rows[2:])
+    assert checked == [['a', 'b']]
+    assert [exported[0] for exported in export_all(storage)] == ['a', 'b', 'c', 'd', 'e']
@@ -0,0 +1,31 @@
+"""
+Keyset-paginated export reads of SQLiteStorage.
+"""
+import os
+import sqlite3
+from datetime import datetime
+
+from storage import SQLiteStorage
+
+from test_storage_conformance import row, sample_rows
+
+
+def test_open_export_does_not_block_writers(tmp_path):
+    storage = SQLiteStorage(os.path.join(tmp_path, 'ecosort.db'))
+    storage.initialize()
+    storage.insert_many(sample_rows())
+
+    chunks = storage.iter_export_rows(chunk_size=2)
+    assert [exported[0] for exported in next(chunks)] == ['a', 'b']
+
+    # A client that has not read the next chunk holds no lock
+    conn = sqlite3.connect(storage.path, timeout=0.1)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.rollback()
+    finally:
+        conn.close()
+    storage.insert(row('f', datetime(2024, 4, 2, 12, 0, 0, 1)))
+
+    # Later chunks continue after the last row sent and see the new row
+    assert [exported[0] for chunk in chunks for exported in chunk] == ['c', 'd', 'e', 'f']
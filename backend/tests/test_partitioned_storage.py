@@ -0,0 +1,100 @@
+"""
+Partition layout, pruning and retention of PartitionedSQLiteStorage.
+"""
+import os
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from storage import PartitionedSQLiteStorage, SQLiteStorage
+
+from test_storage_conformance import export_all, row, sample_rows
+
+
+@pytest.fixture
+def storage(tmp_path):
+    backend = PartitionedSQLiteStorage(os.path.join(tmp_path, 'ecosort.db'), os.path.join(tmp_path, 'partitions'))
+    backend.initialize()
+    return backend
+
+
+def test_rows_go_to_their_month(storage):
+    storage.insert_many(sample_rows())
+    assert [month for month, _ in storage.list_partitions()] == ['2024-03', '2024-04']
+
+    conn = sqlite3.connect(storage.partition_path('2024-03'))
+    assert conn.execute('SELECT COUNT(*) FROM classifications').fetchone()[0] == 4
+    conn.close()
+
+    conn = storage.connect()
+    assert conn.execute('SELECT COUNT(*) FROM classifications').fetchone()[0] == 0
+    conn.close()
+
+
+def test_export_reads_only_months_in_range(storage, monkeypatch):
+    storage.insert_many(sample_rows())
+    assert [month for month, _ in storage.list_partitions('2024-04-01', '2024-04-30')] == ['2024-04']
+
+    attached = []
+    attach = storage.attach
+    monkeypatch.setattr(storage, 'attach', lambda conn, month: attached.append(month) or attach(conn, month))
+    assert [exported[0] for exported in export_all(storage, start_date='2024-04-01', end_date='2024-04-30')] == ['e']
+    assert set(attached) == {'2024-04'}
+
+
+def test_export_spans_more_partitions_than_attach_limit(storage):
+    rows = [row(f'{month:02d}', datetime(2023, month, 15)) for month in range(1, 13)]
+    for partition_row in rows:
+        storage.insert(partition_row)
+    assert len(storage.list_partitions()) == 12
+    assert [exported[0] for exported in export_all(storage, chunk_size=5)] == [r[0] for r in rows]
+
+
+def test_open_export_does_not_block_writers(storage):
+    storage.insert_many(sample_rows())
+    chunks = storage.iter_export_rows(chunk_size=2)
+    assert [exported[0] for exported in next(chunks)] == ['a', 'b']
+
+    # Neither the main database nor a partition is locked between chunks
+    for path in (storage.path, storage.partition_path('2024-03')):
+        conn = sqlite3.connect(path, timeout=0.1)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.rollback()
+        finally:
+            conn.close()
+    storage.insert(row('f', datetime(2024, 3, 6, 12, 0, 0, 1)))
+
+    assert [exported[0] for chunk in chunks for exported in chunk] == ['c', 'd', 'f', 'e']
+
+
+def test_drop_partition_keeps_rollups(storage):
+    storage.insert_many(sample_rows())
+    assert storage.drop_partition('2024-03')
+    assert not storage.drop_partition('2024-03')
+    assert not os.path.exists(storage.partition_path('2024-03'))
+
+    assert [exported[0] for exported in export_all(storage)] == ['e']
+    assert storage.range_analytics('2024-03-01', '2024-03-31')['total_classifications'] == 4
+
+
+def test_drop_current_partition_refused(storage):
+    with pytest.raises(ValueError):
+        storage.drop_partition(datetime.now().strftime('%Y-%m'))
+
+
+def test_initialize_moves_existing_rows(tmp_path):
+    db_path = os.path.join(tmp_path, 'ecosort.db')
+    plain = SQLiteStorage(db_path)
+    plain.initialize()
+    plain.insert_many(sample_rows())
+
+    partitioned = PartitionedSQLiteStorage(db_path, os.path.join(tmp_path, 'partitions'))
+    partitioned.initialize()
+    assert [month for month, _ in partitioned.list_partitions()] == ['2024-03', '2024-04']
+    assert [exported[0] for exported in export_all(partitioned)] == ['a', 'b', 'c', 'd', 'e']
+    assert partitioned.range_analytics('2024-03-01', '2024-04-30')['total_classifications'] == 5
+
+    partitioned.insert(row('f', datetime(2024, 4, 2, 12, 0, 0, 1)))
+    assert [exported[0] for exported in export_all(partitioned, start_date='2024-04-01')] == ['e', 'f']
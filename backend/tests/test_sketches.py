@@ -0,0 +1,70 @@
+"""
+Persistence and adoption of per-worker ClassificationSketches rows.
+"""
+import os
+import sqlite3
+
+import pytest
+
+from sketches import ClassificationSketches
+
+
+@pytest.fixture
+def connect(tmp_path):
+    db_path = os.path.join(tmp_path, 'ecosort.db')
+    return lambda: sqlite3.connect(db_path)
+
+
+def classify(sketches, times, text='Plastic bottle'):
+    for _ in range(times):
+        sketches.update('text', text, 'recyclable', 0.9, 7.0)
+
+
+def merged_count(sketches, connect):
+    conn = connect()
+    try:
+        combined, workers = sketches.merged(conn)
+    finally:
+        conn.close()
+    top = combined.summary(limit=1)['top_items']
+    return (top[0]['count'] if top else 0), workers
+
+
+def test_adopted_idle_worker_does_not_double_count(connect):
+    idle = ClassificationSketches(persist_interval=0, worker='idle')
+    idle.maybe_persist(connect)
+    classify(idle, 3)
+    assert idle.maybe_persist(connect)
+
+    # The idle worker's row is older than stale_after, so a starting worker adopts it
+    conn = connect()
+    conn.execute("UPDATE analytics_sketches SET updated_at = '2000-01-01 00:00:00' WHERE worker = 'idle'")
+    conn.commit()
+    conn.close()
+    starting = ClassificationSketches(persist_interval=0, worker='starting')
+    starting.maybe_persist(connect)
+    assert merged_count(starting, connect) == (3, 1)
+    # The idle worker no longer counts the adopted updates itself
+    assert merged_count(idle, connect) == (3, 2)
+
+    # The idle worker wakes up and saves again
+    classify(idle, 3)
+    assert idle.maybe_persist(connect)
+    assert merged_count(starting, connect) == (6, 2)
+
+    classify(starting, 1)
+    starting.close(connect)
+    assert merged_count(idle, connect) == (7, 2)
+
+
+def test_persist_keeps_own_row(connect):
+    sketches = ClassificationSketches(persist_interval=0, worker='one')
+    sketches.maybe_persist(connect)
+    classify(sketches, 2)
+    sketches.maybe_persist(connect)
+    classify(sketches, 2)
+    sketches.maybe_persist(connect)
+
+    restarted = ClassificationSketches(persist_interval=0, worker='one')
+    restarted.maybe_persist(connect)
+    assert merged_count(restarted, connect) == (4, 1)
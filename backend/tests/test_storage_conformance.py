@@ -0,0 +1,165 @@
+"""
+Behaviour every storage backend must share; each test runs against every
+available backend.
+"""
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+from shared_counters import LocalCounterStore
+from storage import DUCKDB_AVAILABLE, DuckDBStorage, PartitionedSQLiteStorage, SQLiteStorage
+
+RECYCLE_TIPS = ['Rinse containers', 'Check local guidelines']
+COMPOST_TIPS = ['Compost at home']
+
+
+def make_sqlite(tmp_path):
+    return SQLiteStorage(os.path.join(tmp_path, 'ecosort.db'))
+
+
+def make_sqlite_with_counters(tmp_path):
+    # Rollups stay pending in the counter store; reads must still include them
+    return SQLiteStorage(os.path.join(tmp_path, 'ecosort.db'), counters=LocalCounterStore())
+
+
+def make_partitioned(tmp_path):
+    return PartitionedSQLiteStorage(os.path.join(tmp_path, 'ecosort.db'), os.path.join(tmp_path, 'partitions'))
+
+
+def make_duckdb(tmp_path):
+    if not DUCKDB_AVAILABLE:
+        pytest.skip("duckdb is not installed")
+    return DuckDBStorage(os.path.join(tmp_path, 'ecosort.duckdb'))
+
+
+@pytest.fixture(params=[make_sqlite, make_sqlite_with_counters, make_partitioned, make_duckdb],
+                ids=['sqlite', 'sqlite-counters', 'partitioned', 'duckdb'])
+def storage(request, tmp_path):
+    backend = request.param(str(tmp_path))
+    backend.initialize()
+    yield backend
+    backend.close()
+
+
+def row(row_id, timestamp, category='recyclable', input_type='text', confidence=0.8, score=7.0, tips=None):
+    return (row_id, timestamp, input_type, f"item {row_id}", category, confidence, score,
+            RECYCLE_TIPS if tips is None else tips)
+
+
+def sample_rows():
+    return [
+        row('a', datetime(2024, 3, 1, 9, 15, 0, 100), confidence=0.9),
+        row('b', datetime(2024, 3, 1, 17, 40, 0, 200), category='biodegradable', score=8.5, tips=COMPOST_TIPS),
+        row('c', datetime(2024, 3, 2, 8, 0, 0, 300), input_type='image', confidence=0.7),
+        row('d', datetime(2024, 3, 5, 23, 59, 59, 400), category='hazardous', score=2.0, tips=['Take to a depot']),
+        row('e', datetime(2024, 4, 1, 0, 0, 0, 500), category='unknown', score=5.0, tips=[]),
+    ]
+
+
+def export_all(storage, **kwargs):
+    return [exported for chunk in storage.iter_export_rows(**kwargs) for exported in chunk]
+
+
+def test_insert_returns_shared_tip_set_ids(storage):
+    first = storage.insert(row('a', datetime(2024, 3, 1, 9, 0, 0, 1)))
+    ids = storage.insert_many([
+        row('b', datetime(2024, 3, 1, 9, 0, 0, 2)),
+        row('c', datetime(2024, 3, 1, 9, 0, 0, 3), tips=COMPOST_TIPS)
+    ])
+    assert ids[0] == first
+    assert ids[1] != first
+    assert storage.get_tip_set(first) == RECYCLE_TIPS
+    assert storage.get_tip_set(ids[1]) == COMPOST_TIPS
+
+
+def test_get_missing_tip_set(storage):
+    assert storage.get_tip_set(12345) is None
+
+
+def test_range_analytics_totals_and_averages(storage):
+    storage.insert_many(sample_rows())
+    analytics = storage.range_analytics('2024-03-01', '2024-03-31')
+
+    assert analytics['total_classifications'] == 4
+    assert analytics['category_distribution'] == {'recyclable': 2, 'biodegradable': 1, 'hazardous': 1}
+    assert analytics['input_type_distribution'] == {'text': 3, 'image': 1}
+    averages = analytics['category_averages']['recyclable']
+    assert averages['average_confidence'] == pytest.approx(0.8)
+    assert averages['average_sustainability_score'] == pytest.approx(7.0)
+
+
+def test_range_analytics_daily_statistics(storage):
+    storage.insert_many(sample_rows())
+    analytics = storage.range_analytics('2024-03-01', '2024-04-01')
+
+    assert analytics['daily_statistics'] == [
+        {'date': '2024-03-01', 'biodegradable': 1, 'recyclable': 1, 'hazardous': 0, 'total': 2},
+        {'date': '2024-03-02', 'biodegradable': 0, 'recyclable': 1, 'hazardous': 0, 'total': 1},
+        {'date': '2024-03-05', 'biodegradable': 0, 'recyclable': 0, 'hazardous': 1, 'total': 1},
+        # Other categories only count towards the total
+        {'date': '2024-04-01', 'biodegradable': 0, 'recyclable': 0, 'hazardous': 0, 'total': 1},
+    ]
+    assert analytics['total_classifications'] == 5
+
+
+def test_range_analytics_excludes_other_days(storage):
+    storage.insert_many(sample_rows())
+    analytics = storage.range_analytics('2024-03-02', '2024-03-04')
+    assert analytics['total_classifications'] == 1
+    assert [day['date'] for day in analytics['daily_statistics']] == ['2024-03-02']
+
+    empty = storage.range_analytics('2023-01-01', '2023-01-31')
+    assert empty['total_classifications'] == 0
+    assert empty['daily_statistics'] == []
+    assert empty['category_distribution'] == {}
+
+
+def test_export_rows_in_order_with_tips(storage):
+    storage.insert_many(list(reversed(sample_rows())))
+    exported = export_all(storage)
+
+    assert [exported_row[0] for exported_row in exported] == ['a', 'b', 'c', 'd', 'e']
+    assert exported[0] == (
+        'a', '2024-03-01 09:15:00.000100', 'text', 'item a', 'recyclable', 0.9, 7.0, json.dumps(RECYCLE_TIPS)
+    )
+
+
+def test_export_date_bounds(storage):
+    storage.insert_many(sample_rows())
+    exported = export_all(storage, start_date='2024-03-02', end_date='2024-03-05')
+    assert [exported_row[0] for exported_row in exported] == ['c', 'd']
+
+
+def test_export_resumes_after_cursor(storage):
+    storage.insert_many(sample_rows())
+    first_two = export_all(storage)[:2]
+    after = (first_two[-1][1], first_two[-1][0])
+
+    resumed = export_all(storage, after=after)
+    assert [exported_row[0] for exported_row in resumed] == ['c', 'd', 'e']
+
+
+def test_export_chunking(storage):
+    storage.insert_many(sample_rows())
+    chunks = list(storage.iter_export_rows(chunk_size=2))
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+
+
+def test_failed_batch_stores_nothing(storage):
+    storage.insert(row('a', datetime(2024, 3, 1, 9, 0, 0, 1)))
+    with pytest.raises(Exception):
+        storage.insert_many([
+            row('z', datetime(2024, 3, 1, 10, 0, 0, 1)),
+            row('a', datetime(2024, 3, 1, 11, 0, 0, 1))
+        ])
+
+    assert [exported_row[0] for exported_row in export_all(storage)] == ['a']
+    assert storage.range_analytics('2024-03-01', '2024-03-01')['total_classifications'] == 1
+
+
+def test_existing_ids(storage):
+    storage.insert_many(sample_rows())
+    assert storage.existing_ids(['a', 'e', 'zz']) == {'a', 'e'}
+    assert storage.existing_ids([]) == set()
@@ -0,0 +1,53 @@
+"""
+Splitting MJPEG byte streams into JPEG frames.
+"""
+import io
+
+from PIL import Image
+
+from stream_classifier import iter_mjpeg, jpeg_end
+
+
+def jpeg(color, size=(64, 48)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def with_thumbnail(data, thumbnail):
+    """data with a JFIF extension APP0 segment holding a JPEG thumbnail after the SOI"""
+    payload = b'JFXX\x00\x10' + thumbnail
+    segment = b'\xff\xe0' + (len(payload) + 2).to_bytes(2, 'big') + payload
+    return data[:2] + segment + data[2:]
+
+
+def multipart(frames, boundary=b'frame'):
+    return b''.join(
+        b'--' + boundary + b'\r\nContent-Type: image/jpeg\r\nContent-Length: '
+        + str(len(frame)).encode() + b'\r\n\r\n' + frame + b'\r\n'
+        for frame in frames
+    )
+
+
+def test_frame_with_thumbnail_is_not_truncated():
+    frames = [with_thumbnail(jpeg((200, 30, 30)), jpeg((0, 0, 255), (16, 12))), jpeg((30, 200, 30))]
+    assert frames[0].index(b'\xff\xd9') < len(frames[0]) - 2
+
+    # Small chunks split frames and segments across reads
+    split = list(iter_mjpeg(io.BytesIO(multipart(frames)), chunk_size=7))
+
+    assert split == frames
+    assert Image.open(io.BytesIO(split[0])).size == (64, 48)
+
+
+def test_concatenated_jpegs():
+    frames = [jpeg((10 * i, 0, 0)) for i in range(3)]
+    assert list(iter_mjpeg(io.BytesIO(b''.join(frames)))) == frames
+
+
+def test_incomplete_and_malformed_frames():
+    frame = jpeg((0, 0, 0))
+    assert jpeg_end(frame[:-1], 0) is None
+    assert jpeg_end(b'\xff\xd8\x00\x00', 0) == -1
+    # A broken frame is skipped and the next one is still found
+    assert list(iter_mjpeg(io.BytesIO(b'\xff\xd8\x00\x00' + frame))) == [frame]
@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import {
   Box,
   Container,
@@ -41,6 +41,56 @@ import {
 } from 'recharts';
 import axios from 'axios';
 
+const DAILY_FIELDS = ['biodegradable', 'recyclable', 'hazardous'];
+const MAX_PENDING_DELTAS = 1000;
+
+// Add one classification delta from /analytics/stream to an /analytics response
+const applyDelta = (data, delta) => {
+  if (!data || !data.date_range) {
+    return data;
+  }
+  if (delta.date < data.date_range.start || delta.date > data.date_range.end) {
+    return data;
+  }
+
+  const distribution = { ...data.category_distribution };
+  const count = (distribution[delta.category] || 0) + 1;
+  distribution[delta.category] = count;
+
+  const averages = { ...data.category_averages };
+  const previous = averages[delta.category] || { average_confidence: 0, average_sustainability_score: 0 };
+  averages[delta.category] = {
+    average_confidence: previous.average_confidence + (delta.confidence - previous.average_confidence) / count,
+    average_sustainability_score: previous.average_sustainability_score
+      + (delta.sustainability_score - previous.average_sustainability_score) / count,
+  };
+
+  const inputTypes = { ...data.input_type_distribution };
+  inputTypes[delta.input_type] = (inputTypes[delta.input_type] || 0) + 1;
+
+  const daily = [...(data.daily_statistics || [])];
+  let index = daily.findIndex((day) => day.date === delta.date);
+  if (index < 0) {
+    daily.push({ date: delta.date, biodegradable: 0, recyclable: 0, hazardous: 0, total: 0 });
+    daily.sort((a, b) => a.date.localeCompare(b.date));
+    index = daily.findIndex((day) => day.date === delta.date);
+  }
+  const day = { ...daily[index], total: daily[index].total + 1 };
+  if (DAILY_FIELDS.includes(delta.category)) {
+    day[delta.category] += 1;
+  }
+  daily[index] = day;
+
+  return {
+    ...data,
+    daily_statistics: daily,
+    category_distribution: distribution,
+    category_averages: averages,
+    input_type_distribution: inputTypes,
+    total_classifications: data.total_classifications + 1,
+  };
+};
+
 const Analytics = () => {
   const [analyticsData, setAnalyticsData] = useState(null);
   const [loading, setLoading] = useState(true);
@@ -49,6 +99,11 @@ const Analytics = () => {
 
   const COLORS = ['#4CAF50', '#2196F3', '#F44336'];
 
+  // Deltas received since the stream's ready event, replayed onto snapshots
+  // that were taken before them
+  const pendingDeltas = useRef([]);
+  const subscribedAfter = useRef(0);
+
   const fetchAnalytics = useCallback(async () => {
     setLoading(true);
     setError(null);
@@ -70,7 +125,20 @@ const Analytics = () => {
       });
 
       console.log('Analytics response:', response.data);
-      setAnalyticsData(response.data);
+      const snapshot = response.data;
+      setAnalyticsData((current) => {
+        // A snapshot older than the subscription misses deltas published before it;
+        // the fetch started by the ready event replaces it
+        if (current && snapshot.stream_sequence < subscribedAfter.current) {
+          return current;
+        }
+        return pendingDeltas.current
+          .filter(({ sequence }) => sequence > snapshot.stream_sequence)
+          .reduce(
+            (data, { sequence, delta }) => ({ ...applyDelta(data, delta), stream_sequence: sequence }),
+            snapshot
+          );
+      });
     } catch (err) {
       console.error('Analytics fetch error:', err);
       const errorMessage = err.response?.data?.error || 
@@ -92,33 +160,45 @@ const Analytics = () => {
     fetchAnalytics();
   }, [fetchAnalytics]);
 
-  // Add WebSocket connection for real-time updates
+  // Apply live classification deltas from the server-sent events stream
+  // to the loaded snapshot instead of re-polling /analytics
   useEffect(() => {
-    const ws = new WebSocket('ws://localhost:5000/ws');
-    
-    ws.onopen = () => {
-      console.log('WebSocket connected for real-time analytics');
-    };
-    
-    ws.onmessage = (event) => {
-      const data = JSON.parse(event.data);
-      if (data.type === 'classification_update') {
-        console.log('Real-time classification update received:', data);
-        // Refresh analytics data when new classification is made
-        fetchAnalytics();
+    const source = new EventSource('/analytics/stream');
+
+    // The event id is the delta's sequence; deltas a snapshot already counts are skipped
+    source.addEventListener('delta', (event) => {
+      const delta = JSON.parse(event.data);
+      const sequence = Number(event.lastEventId);
+      pendingDeltas.current.push({ sequence, delta });
+      if (pendingDeltas.current.length > MAX_PENDING_DELTAS) {
+        pendingDeltas.current.shift();
       }
+      setAnalyticsData((current) => (
+        current && sequence > current.stream_sequence
+          ? { ...applyDelta(current, delta), stream_sequence: sequence }
+          : current
+      ));
+    });
+
+    // Deltas were dropped because this tab fell behind; reload the snapshot
+    source.addEventListener('resync', () => {
+      fetchAnalytics();
+    });
+
+    source.onerror = () => {
+      console.warn('Live analytics stream interrupted, reconnecting');
     };
-    
-    ws.onclose = () => {
-      console.log('WebSocket disconnected');
-    };
-    
-    ws.onerror = (error) => {
-      console.error('WebSocket error:', error);
-    };
-    
+
+    // Sent on every (re)connect; EventSource reconnects on its own, and only a
+    // snapshot taken after the subscription is known to miss no deltas
+    source.addEventListener('ready', (event) => {
+      subscribedAfter.current = JSON.parse(event.data).sequence;
+      pendingDeltas.current = [];
+      fetchAnalytics();
+    });
+
     return () => {
-      ws.close();
+      source.close();
     };
   }, [fetchAnalytics]);
 
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Fit and calibrate the first stage of the EcoSortAI image cascade.
+
+A logistic regression over thumbnail color statistics is trained on
+data/train. On data/validation, every confidence threshold is scored by the
+share of images the cheap stage answers and the accuracy of the whole
+cascade, and the lowest threshold that keeps accuracy within the allowed
+drop of the full model is saved with the stage.
+"""
+
+import os
+import sys
+import json
+import argparse
+import numpy as np
+from PIL import Image
+from sklearn.linear_model import LogisticRegression
+import tensorflow as tf
+from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
+
+from train_image_model import CATEGORIES, list_images, load_image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'models'))
+from cascade import ColorStatsStage, color_features
+
+STAGE_PATH = 'models/cascade_color_stage.npz'
+REPORT_PATH = 'models/cascade_report.json'
+
+def extract_features(paths):
+    features = np.empty((len(paths), len(color_features(Image.new('RGB', (1, 1))))), dtype=np.float32)
+    for i, path in enumerate(paths):
+        with Image.open(path) as img:
+            features[i] = color_features(img)
+    return features
+
+def model_probabilities(model, paths, batch_size=32):
+    """Full-model softmax outputs, preprocessed exactly as at serving time"""
+    input_size = model.input_shape[1]
+    outputs = []
+    for start in range(0, len(paths), batch_size):
+        images = tf.stack([load_image(path, input_size) for path in paths[start:start + batch_size]])
+        outputs.append(model(preprocess_input(images), training=False).numpy())
+    return np.concatenate(outputs)
+
+def sweep_thresholds(stage_probabilities, model_probabilities, labels, thresholds):
+    """Hit rate of the cheap stage and end-to-end accuracy for each threshold"""
+    stage_correct = stage_probabilities.argmax(axis=1) == labels
+    model_correct = model_probabilities.argmax(axis=1) == labels
+    stage_confidence = stage_probabilities.max(axis=1)
+    
+    rows = []
+    for threshold in thresholds:
+        answered = stage_confidence >= threshold
+        rows.append({
+            'threshold': float(threshold),
+            'stage_hit_rate': float(answered.mean()),
+            'stage_accuracy': float(stage_correct[answered].mean()) if answered.any() else None,
+            'cascade_accuracy': float(np.where(answered, stage_correct, model_correct).mean())
+        })
+    return rows
+
+def calibrate(model_path='models/waste_classifier_model.h5', max_accuracy_drop=0.01,
+              stage_path=STAGE_PATH, report_path=REPORT_PATH):
+    train_paths, train_labels = list_images('data/train')
+    validation_paths, validation_labels = list_images('data/validation')
+    if not train_paths or not validation_paths:
+        print("Training and validation images are required under data/train and data/validation.")
+        return None
+    
+    print(f"Fitting color-statistics stage on {len(train_paths)} images...")
+    x_train = extract_features(train_paths)
+    mean = x_train.mean(axis=0)
+    scale = np.maximum(x_train.std(axis=0), 1e-6)
+    classifier = LogisticRegression(max_iter=2000, C=1.0)
+    classifier.fit((x_train - mean) / scale, train_labels)
+    
+    # Rows of coef_ follow classes_; expand to every category so codes line up
+    coef = np.zeros((len(CATEGORIES), x_train.shape[1]), dtype=np.float32)
+    intercept = np.full(len(CATEGORIES), -1e4, dtype=np.float32)
+    for row, label in enumerate(classifier.classes_):
+        coef[label] = classifier.coef_[row]
+        intercept[label] = classifier.intercept_[row]
+    
+    stage = ColorStatsStage(CATEGORIES, mean, scale, coef, intercept, threshold=1.0)
+    stage_probabilities = stage.predict_proba_features(extract_features(validation_paths))
+    
+    print(f"Scoring {len(validation_paths)} validation images with the full model...")
+    model = tf.keras.models.load_model(model_path)
+    full_probabilities = model_probabilities(model, validation_paths)
+    full_accuracy = float((full_probabilities.argmax(axis=1) == validation_labels).mean())
+    
+    rows = sweep_thresholds(stage_probabilities, full_probabilities, validation_labels,
+                            np.round(np.arange(0.50, 1.0, 0.01), 2))
+    acceptable = [row for row in rows if row['cascade_accuracy'] >= full_accuracy - max_accuracy_drop]
+    # Lowest acceptable threshold routes the most images to the cheap stage
+    chosen = acceptable[0] if acceptable else {'threshold': 1.0, 'stage_hit_rate': 0.0,
+                                               'cascade_accuracy': full_accuracy}
+    
+    stage.threshold = chosen['threshold']
+    stage.calibration = {
+        'full_model_accuracy': full_accuracy,
+        'cascade_accuracy': chosen['cascade_accuracy'],
+        'stage_hit_rate': chosen['stage_hit_rate']
+    }
+    stage.save(stage_path)
+    
+    print(f"\n{'threshold':>10}{'hit rate':>10}{'stage acc':>11}{'cascade acc':>13}")
+    for row in rows[::5]:
+        stage_accuracy = f"{row['stage_accuracy']:.3f}" if row['stage_accuracy'] is not None else 'n/a'
+        print(f"{row['threshold']:>10.2f}{row['stage_hit_rate']:>10.1%}{stage_accuracy:>11}"
+              f"{row['cascade_accuracy']:>13.3f}")
+    print(f"\nFull model accuracy {full_accuracy:.3f}; chose threshold {chosen['threshold']:.2f}: "
+          f"{chosen['stage_hit_rate']:.1%} of images skip the full model, "
+          f"cascade accuracy {chosen['cascade_accuracy']:.3f}")
+    
+    report = {
+        'max_accuracy_drop': max_accuracy_drop,
+        'full_model_accuracy': full_accuracy,
+        'chosen': chosen,
+        'thresholds': rows
+    }
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Stage saved to {stage_path}, report written to {report_path}")
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit and calibrate the image cascade's color-statistics stage")
+    parser.add_argument('--model', default='models/waste_classifier_model.h5',
+                        help="Full model the cascade falls back to")
+    parser.add_argument('--max-accuracy-drop', type=float, default=0.01,
+                        help="Largest acceptable loss of validation accuracy versus the full model")
+    args = parser.parse_args()
+    
+    os.makedirs('models', exist_ok=True)
+    calibrate(model_path=args.model, max_accuracy_drop=args.max_accuracy_drop)
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Knowledge distillation of the EcoSortAI image model into a compact student.
+
+The trained MobileNetV2 (alpha 1.0, 224px) teacher labels every training
+batch with softened class probabilities, and a small student (MobileNetV2
+alpha 0.35 or MobileNetV3-Small at 160px) learns from both those soft
+targets and the ground-truth labels. The script then reports accuracy,
+latency and size for teacher and student side by side.
+"""
+
+import os
+import json
+import time
+import argparse
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.applications import MobileNetV2, MobileNetV3Small
+from tensorflow.keras.models import Model
+from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Dropout, Activation
+from tensorflow.keras.optimizers import Adam
+
+from train_image_model import CATEGORIES, IMAGE_SIZE, build_dataset
+
+TEACHER_PATH = 'models/waste_classifier_model.h5'
+STUDENT_PATH = 'models/waste_classifier_student.h5'
+REPORT_PATH = 'models/distillation_report.json'
+
+# Student architectures; both use the MobileNetV2 [-1, 1] input scaling so
+# ImageClassifier.preprocess_image serves them unchanged
+STUDENTS = {
+    'mobilenet_v2_035': lambda input_shape: MobileNetV2(
+        weights='imagenet', include_top=False, input_shape=input_shape, alpha=0.35
+    ),
+    'mobilenet_v3_small': lambda input_shape: MobileNetV3Small(
+        weights='imagenet', include_top=False, input_shape=input_shape, include_preprocessing=False
+    )
+}
+
+def create_student(architecture='mobilenet_v2_035', input_size=160, num_classes=3):
+    """Compact backbone with a small head; the logits layer is kept for distillation"""
+    base_model = STUDENTS[architecture]((input_size, input_size, 3))
+    base_model.trainable = False
+    
+    x = GlobalAveragePooling2D()(base_model.output)
+    x = Dense(128, activation='relu')(x)
+    x = Dropout(0.3)(x)
+    logits = Dense(num_classes, name='logits')(x)
+    predictions = Activation('softmax', name='predictions')(logits)
+    
+    return Model(inputs=base_model.input, outputs=predictions), base_model
+
+class Distiller(tf.keras.Model):
+    """Trains a student on teacher soft targets plus the true labels.
+    
+    loss = alpha * CE(labels, student) + (1 - alpha) * T^2 * KL(teacher_T || student_T)
+    where _T denotes softmax at temperature T. Images arrive at the teacher's
+    input size and are resized for the student.
+    """
+    
+    def __init__(self, student, teacher, student_size):
+        super().__init__()
+        self.student = student
+        self.teacher = teacher
+        self.student_size = student_size
+        # Softmax output is a function of the logits layer, so train through it
+        self.student_logits = Model(student.input, student.get_layer('logits').output)
+        self.loss_tracker = tf.keras.metrics.Mean(name='loss')
+        self.accuracy = tf.keras.metrics.CategoricalAccuracy(name='accuracy')
+    
+    def compile(self, optimizer, alpha=0.3, temperature=4.0):
+        super().compile(optimizer=optimizer)
+        self.alpha = alpha
+        self.temperature = temperature
+    
+    @property
+    def metrics(self):
+        return [self.loss_tracker, self.accuracy]
+    
+    def _resize(self, images):
+        return tf.image.resize(images, (self.student_size, self.student_size))
+    
+    def train_step(self, data):
+        images, labels = data
+        # Log-probabilities are logits up to a per-sample constant, which softmax ignores
+        teacher_logits = tf.math.log(self.teacher(images, training=False) + 1e-8)
+        soft_targets = tf.nn.softmax(teacher_logits / self.temperature)
+        
+        with tf.GradientTape() as tape:
+            logits = self.student_logits(self._resize(images), training=True)
+            hard_loss = tf.keras.losses.categorical_crossentropy(labels, logits, from_logits=True)
+            soft_loss = tf.keras.losses.kl_divergence(
+                soft_targets, tf.nn.softmax(logits / self.temperature)
+            ) * self.temperature ** 2
+            loss = tf.reduce_mean(self.alpha * hard_loss + (1 - self.alpha) * soft_loss)
+        
+        variables = self.student_logits.trainable_variables
+        self.optimizer.apply_gradients(zip(tape.gradient(loss, variables), variables))
+        
+        self.loss_tracker.update_state(loss)
+        self.accuracy.update_state(labels, tf.nn.softmax(logits))
+        return {metric.name: metric.result() for metric in self.metrics}
+    
+    def test_step(self, data):
+        images, labels = data
+        logits = self.student_logits(self._resize(images), training=False)
+        loss = tf.keras.losses.categorical_crossentropy(labels, logits, from_logits=True)
+        self.loss_tracker.update_state(tf.reduce_mean(loss))
+        self.accuracy.update_state(labels, tf.nn.softmax(logits))
+        return {metric.name: metric.result() for metric in self.metrics}
+
+def evaluate_accuracy(model, dataset, input_size):
+    """Top-1 accuracy of a softmax model over a (images, one-hot labels) dataset"""
+    correct = 0
+    total = 0
+    for images, labels in dataset:
+        if images.shape[1] != input_size:
+            images = tf.image.resize(images, (input_size, input_size))
+        predictions = model(images, training=False)
+        correct += int(tf.reduce_sum(tf.cast(
+            tf.argmax(predictions, axis=1) == tf.argmax(labels, axis=1), tf.int32
+        )))
+        total += int(images.shape[0])
+    return correct / total if total else None
+
+def measure_latency(model, input_size, runs=50, batch_size=32):
+    """Single-image latency percentiles (ms) and batched throughput (images/sec) on this host"""
+    single = np.random.uniform(-1, 1, (1, input_size, input_size, 3)).astype(np.float32)
+    batch = np.random.uniform(-1, 1, (batch_size, input_size, input_size, 3)).astype(np.float32)
+    
+    # Warm up graph tracing and thread pools before timing
+    for _ in range(3):
+        model(single, training=False)
+        model(batch, training=False)
+    
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        model(single, training=False)
+        timings.append((time.perf_counter() - started) * 1000)
+    
+    started = time.perf_counter()
+    for _ in range(max(runs // 5, 1)):
+        model(batch, training=False)
+    elapsed = time.perf_counter() - started
+    
+    return {
+        'p50_ms': float(np.percentile(timings, 50)),
+        'p95_ms': float(np.percentile(timings, 95)),
+        'batch_images_per_sec': batch_size * max(runs // 5, 1) / elapsed
+    }
+
+def model_footprint(model, path):
+    """Parameter count, float32 weight memory and saved file size"""
+    params = int(model.count_params())
+    return {
+        'parameters': params,
+        'weights_mb': params * 4 / 2 ** 20,
+        'file_mb': os.path.getsize(path) / 2 ** 20 if os.path.exists(path) else None
+    }
+
+def distill(architecture='mobilenet_v2_035', input_size=160, epochs=20, fine_tune_epochs=5,
+            alpha=0.3, temperature=4.0, batch_size=32, data_cache=None,
+            teacher_path=TEACHER_PATH, output_path=STUDENT_PATH, report_path=REPORT_PATH):
+    """Distill the teacher into a student, save it and write the trade-off report"""
+    train_dir = 'data/train'
+    validation_dir = 'data/validation'
+    
+    if not os.path.exists(teacher_path):
+        print(f"Teacher model not found at {teacher_path}. Train it with train_image_model.py first.")
+        return None
+    
+    teacher = tf.keras.models.load_model(teacher_path)
+    teacher.trainable = False
+    
+    # Both datasets are preprocessed at the teacher size; the student resizes its copy
+    train_dataset = build_dataset(train_dir, training=True, batch_size=batch_size, cache=data_cache)
+    validation_dataset = build_dataset(validation_dir, training=False, batch_size=batch_size)
+    
+    student, backbone = create_student(architecture, input_size, num_classes=len(CATEGORIES))
+    distiller = Distiller(student, teacher, input_size)
+    
+    print(f"Distilling into {architecture} at {input_size}px (alpha={alpha}, T={temperature})...")
+    distiller.compile(optimizer=Adam(learning_rate=0.001), alpha=alpha, temperature=temperature)
+    distiller.fit(train_dataset, epochs=epochs, validation_data=validation_dataset, verbose=1)
+    
+    if fine_tune_epochs:
+        # Unfreeze the backbone but keep BatchNorm statistics fixed for small datasets
+        backbone.trainable = True
+        for layer in backbone.layers:
+            if isinstance(layer, tf.keras.layers.BatchNormalization):
+                layer.trainable = False
+        print("Fine-tuning the student backbone...")
+        distiller.compile(optimizer=Adam(learning_rate=1e-5), alpha=alpha, temperature=temperature)
+        distiller.fit(train_dataset, epochs=fine_tune_epochs, validation_data=validation_dataset, verbose=1)
+    
+    student.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
+    student.save(output_path)
+    print(f"Student saved to {output_path}")
+    
+    report = {
+        'student_architecture': architecture,
+        'alpha': alpha,
+        'temperature': temperature,
+        'teacher': {
+            'input_size': IMAGE_SIZE,
+            'accuracy': evaluate_accuracy(teacher, validation_dataset, IMAGE_SIZE),
+            'latency': measure_latency(teacher, IMAGE_SIZE),
+            **model_footprint(teacher, teacher_path)
+        },
+        'student': {
+            'input_size': input_size,
+            'accuracy': evaluate_accuracy(student, validation_dataset, input_size),
+            'latency': measure_latency(student, input_size),
+            **model_footprint(student, output_path)
+        }
+    }
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    
+    print_report(report)
+    print(f"Report written to {report_path}")
+    return report
+
+def print_report(report):
+    """Side-by-side accuracy / latency / size table"""
+    print(f"\n{'':<10}{'accuracy':>10}{'p50 ms':>10}{'p95 ms':>10}{'img/s':>10}{'params':>12}{'file MB':>10}")
+    for name in ('teacher', 'student'):
+        entry = report[name]
+        accuracy = f"{entry['accuracy']:.3f}" if entry['accuracy'] is not None else 'n/a'
+        file_mb = f"{entry['file_mb']:.1f}" if entry['file_mb'] is not None else 'n/a'
+        print(f"{name:<10}{accuracy:>10}{entry['latency']['p50_ms']:>10.1f}{entry['latency']['p95_ms']:>10.1f}"
+              f"{entry['latency']['batch_images_per_sec']:>10.1f}{entry['parameters']:>12,}{file_mb:>10}")
+    speedup = report['teacher']['latency']['p50_ms'] / report['student']['latency']['p50_ms']
+    print(f"Student is {speedup:.1f}x faster per image at "
+          f"{report['student']['parameters'] / report['teacher']['parameters']:.1%} of the parameters\n")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distill the EcoSortAI image model into a compact student")
+    parser.add_argument('--student', choices=sorted(STUDENTS), default='mobilenet_v2_035')
+    parser.add_argument('--input-size', type=int, default=160)
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--fine-tune-epochs', type=int, default=5)
+    parser.add_argument('--alpha', type=float, default=0.3,
+                        help="Weight of the ground-truth loss; the rest goes to the teacher's soft targets")
+    parser.add_argument('--temperature', type=float, default=4.0)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--data-cache', default=None,
+                        help="Cache decoded images: '' for memory or a file path for on-disk caching")
+    parser.add_argument('--teacher', default=TEACHER_PATH)
+    parser.add_argument('--output', default=STUDENT_PATH)
+    args = parser.parse_args()
+    
+    os.makedirs('models', exist_ok=True)
+    distill(
+        architecture=args.student,
+        input_size=args.input_size,
+        epochs=args.epochs,
+        fine_tune_epochs=args.fine_tune_epochs,
+        alpha=args.alpha,
+        temperature=args.temperature,
+        batch_size=args.batch_size,
+        data_cache=args.data_cache,
+        teacher_path=args.teacher,
+        output_path=args.output
+    )
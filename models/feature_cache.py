@@ -0,0 +1,125 @@
+"""
+Memory-mapped cache of backbone embeddings for head-only training.
+
+Embeddings are stored in a single .npy memmap of shape
+(capacity, num_views, feature_dim) and indexed by the SHA-1 of each image
+file, so re-running training only embeds files that are new or changed.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """SHA-1 of a file's contents"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FeatureCache:
+    """Append-only embedding store keyed by file hash"""
+
+    def __init__(self, cache_dir, feature_dim, num_views, signature, initial_capacity=1024):
+        self.cache_dir = cache_dir
+        self.feature_dim = feature_dim
+        self.num_views = num_views
+        # Anything that changes the embeddings (backbone, input size, views) must be in the signature
+        self.signature = signature
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.features_path = os.path.join(cache_dir, 'features.npy')
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.entries = {}
+        self.size = 0
+        self.features = None
+
+        if self._load_index():
+            self.features = np.load(self.features_path, mmap_mode='r+')
+        else:
+            self._allocate(initial_capacity)
+
+    def _load_index(self):
+        if not (os.path.exists(self.index_path) and os.path.exists(self.features_path)):
+            return False
+        with open(self.index_path, 'r') as f:
+            index = json.load(f)
+        if (index.get('signature') != self.signature
+                or index.get('feature_dim') != self.feature_dim
+                or index.get('num_views') != self.num_views):
+            print("Feature cache signature changed, rebuilding cache")
+            return False
+        self.entries = index['entries']
+        self.size = index['size']
+        return True
+
+    def _allocate(self, capacity):
+        """Create (or grow into) a memmap with room for capacity images"""
+        features = np.lib.format.open_memmap(
+            self.features_path + '.tmp', mode='w+', dtype=np.float32,
+            shape=(capacity, self.num_views, self.feature_dim)
+        )
+        if self.features is not None and self.size:
+            features[:self.size] = self.features[:self.size]
+        features.flush()
+        del self.features
+        os.replace(self.features_path + '.tmp', self.features_path)
+        self.features = np.load(self.features_path, mmap_mode='r+')
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return self.size
+
+    def missing(self, keys):
+        """Keys that still need to be embedded"""
+        return [key for key in keys if key not in self.entries]
+
+    def add(self, keys, features):
+        """Store embeddings of shape (len(keys), num_views, feature_dim)"""
+        features = np.asarray(features, dtype=np.float32)
+        if features.shape != (len(keys), self.num_views, self.feature_dim):
+            raise ValueError(f"Expected features of shape {(len(keys), self.num_views, self.feature_dim)}, "
+                             f"got {features.shape}")
+
+        needed = self.size + len(keys)
+        if needed > self.features.shape[0]:
+            self._allocate(max(needed, self.features.shape[0] * 2))
+
+        for offset, key in enumerate(keys):
+            row = self.entries.get(key)
+            if row is None:
+                row = self.size
+                self.entries[key] = row
+                self.size += 1
+            self.features[row] = features[offset]
+
+    def get(self, keys, views=None):
+        """Embeddings for keys as an array of shape (len(keys), views, feature_dim)"""
+        rows = np.array([self.entries[key] for key in keys], dtype=np.int64)
+        selected = self.features[np.sort(rows)] if len(rows) else np.empty((0, self.num_views, self.feature_dim), np.float32)
+        # Memmap fancy indexing is fastest on sorted rows; restore the requested order
+        features = selected[np.argsort(np.argsort(rows))] if len(rows) else selected
+        if views is not None:
+            features = features[:, :views]
+        return np.asarray(features)
+
+    def save(self):
+        """Flush embeddings and atomically write the index"""
+        self.features.flush()
+        index = {
+            'signature': self.signature,
+            'feature_dim': self.feature_dim,
+            'num_views': self.num_views,
+            'size': self.size,
+            'entries': self.entries
+        }
+        with open(self.index_path + '.tmp', 'w') as f:
+            json.dump(index, f)
+        os.replace(self.index_path + '.tmp', self.index_path)
@@ -4,16 +4,27 @@ Training script for EcoSortAI image classification model
 """
 
 import os
+import time
+import argparse
 import numpy as np
 import tensorflow as tf
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from tensorflow.keras.applications import MobileNetV2
+from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
 from tensorflow.keras.models import Model
 from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Dropout
 from tensorflow.keras.optimizers import Adam
 from tensorflow.keras.callbacks import ModelCheckpoint, EarlyStopping, ReduceLROnPlateau
 import matplotlib.pyplot as plt
 
+from feature_cache import FeatureCache, file_hash
+
+# Output order of ImageClassifier.categories; class indices must match it at serving time
+CATEGORIES = ['biodegradable', 'recyclable', 'hazardous']
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+IMAGE_SIZE = 224
+# Batches of decoded images shuffled per epoch after the decoded-image cache
+CACHED_SHUFFLE_BATCHES = 2
+
 def create_model(num_classes=3):
     """Create the image classification model"""
     # Load pre-trained MobileNetV2
@@ -40,6 +51,248 @@ def create_model(num_classes=3):
     
     return model
 
+def create_head(feature_dim, num_classes=3):
+    """The Dense head of create_model, taking pooled backbone features as input"""
+    inputs = tf.keras.Input(shape=(feature_dim,))
+    x = Dense(1024, activation='relu')(inputs)
+    x = Dropout(0.5)(x)
+    x = Dense(512, activation='relu')(x)
+    x = Dropout(0.3)(x)
+    outputs = Dense(num_classes, activation='softmax')(x)
+    return Model(inputs=inputs, outputs=outputs)
+
+def list_images(directory, categories=CATEGORIES):
+    """Image paths and integer labels under directory/<category>/, in a deterministic order"""
+    paths, labels = [], []
+    for label, category in enumerate(categories):
+        category_dir = os.path.join(directory, category)
+        if not os.path.isdir(category_dir):
+            continue
+        for name in sorted(os.listdir(category_dir)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(category_dir, name))
+                labels.append(label)
+    return paths, np.array(labels, dtype=np.int64)
+
+def load_image(path, image_size=IMAGE_SIZE):
+    """Decode an image file into a float32 RGB tensor in [0, 255] at the model input size"""
+    image = tf.image.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+    image.set_shape([None, None, 3])
+    return tf.image.resize(image, (image_size, image_size))
+
+def augmented_views(images, num_views, image_size=IMAGE_SIZE):
+    """Fixed, deterministic augmentations of an image batch; view 0 is the original"""
+    def crop(x):
+        return tf.image.resize(tf.image.central_crop(x, 0.8), (image_size, image_size))
+    
+    transforms = [
+        lambda x: x,
+        tf.image.flip_left_right,
+        crop,
+        lambda x: tf.image.flip_left_right(crop(x)),
+        lambda x: tf.clip_by_value(x * 1.15, 0.0, 255.0),
+        lambda x: x * 0.85
+    ]
+    if not 1 <= num_views <= len(transforms):
+        raise ValueError(f"num_views must be between 1 and {len(transforms)}")
+    return [transform(images) for transform in transforms[:num_views]]
+
+def embed_images(backbone, paths, num_views, batch_size=32):
+    """Pooled backbone features of shape (len(paths), num_views, feature_dim)"""
+    feature_dim = backbone.output_shape[-1]
+    features = np.empty((len(paths), num_views, feature_dim), dtype=np.float32)
+    
+    for start in range(0, len(paths), batch_size):
+        batch_paths = paths[start:start + batch_size]
+        images = tf.stack([load_image(path) for path in batch_paths])
+        views = tf.concat(augmented_views(images, num_views), axis=0)
+        embedded = backbone(preprocess_input(views), training=False).numpy()
+        # (views * batch, dim) -> (batch, views, dim)
+        features[start:start + len(batch_paths)] = embedded.reshape(
+            num_views, len(batch_paths), feature_dim
+        ).transpose(1, 0, 2)
+        print(f"Embedded {min(start + batch_size, len(paths))}/{len(paths)} new images")
+    
+    return features
+
+def train_with_feature_cache(epochs=50, num_views=4, cache_dir='models/feature_cache', batch_size=64):
+    """Train only the Dense head on cached backbone embeddings, then save the full model"""
+    train_dir = 'data/train'
+    validation_dir = 'data/validation'
+    
+    if not os.path.exists(train_dir):
+        print("Training data not found. Creating sample structure...")
+        generate_sample_data()
+        return
+    
+    train_paths, train_labels = list_images(train_dir)
+    validation_paths, validation_labels = list_images(validation_dir)
+    if not train_paths:
+        print("No training images found.")
+        return
+    
+    backbone = MobileNetV2(
+        weights='imagenet',
+        include_top=False,
+        input_shape=(IMAGE_SIZE, IMAGE_SIZE, 3),
+        pooling='avg'
+    )
+    cache = FeatureCache(
+        cache_dir,
+        feature_dim=backbone.output_shape[-1],
+        num_views=num_views,
+        signature=f"mobilenet_v2-imagenet-{IMAGE_SIZE}-avg-views{num_views}"
+    )
+    
+    # Embed only files whose contents the cache has not seen
+    train_hashes = [file_hash(path) for path in train_paths]
+    validation_hashes = [file_hash(path) for path in validation_paths]
+    new_files = {}
+    for key, path in zip(train_hashes + validation_hashes, train_paths + validation_paths):
+        if key not in cache and key not in new_files:
+            new_files[key] = path
+    
+    print(f"Feature cache holds {len(cache)} images, embedding {len(new_files)} new ones...")
+    if new_files:
+        keys = list(new_files)
+        cache.add(keys, embed_images(backbone, [new_files[key] for key in keys], num_views))
+        cache.save()
+    
+    # Every augmented view is a training sample; validation uses the original view only
+    x_train = cache.get(train_hashes).reshape(-1, cache.feature_dim)
+    y_train = tf.keras.utils.to_categorical(np.repeat(train_labels, num_views), len(CATEGORIES))
+    validation_data = None
+    if validation_paths:
+        x_val = cache.get(validation_hashes, views=1)[:, 0]
+        y_val = tf.keras.utils.to_categorical(validation_labels, len(CATEGORIES))
+        validation_data = (x_val, y_val)
+    
+    head = create_head(cache.feature_dim, num_classes=len(CATEGORIES))
+    head.compile(
+        optimizer=Adam(learning_rate=0.001),
+        loss='categorical_crossentropy',
+        metrics=['accuracy']
+    )
+    
+    monitor = 'val_loss' if validation_data else 'loss'
+    print("Starting head training on cached features...")
+    history = head.fit(
+        x_train,
+        y_train,
+        batch_size=batch_size,
+        epochs=epochs,
+        shuffle=True,
+        validation_data=validation_data,
+        callbacks=[
+            EarlyStopping(monitor=monitor, patience=10, restore_best_weights=True),
+            ReduceLROnPlateau(monitor=monitor, factor=0.5, patience=5, min_lr=1e-7)
+        ],
+        verbose=1
+    )
+    
+    # Graft the trained head onto the backbone so serving loads the usual full model
+    model = create_model(num_classes=len(CATEGORIES))
+    model_dense = [layer for layer in model.layers if isinstance(layer, Dense)]
+    head_dense = [layer for layer in head.layers if isinstance(layer, Dense)]
+    for target, source in zip(model_dense, head_dense):
+        target.set_weights(source.get_weights())
+    model.compile(
+        optimizer=Adam(learning_rate=0.001),
+        loss='categorical_crossentropy',
+        metrics=['accuracy']
+    )
+    
+    model.save('models/waste_classifier_model.h5')
+    print("Training completed! Model saved to models/waste_classifier_model.h5")
+    
+    if validation_data:
+        plot_training_history(history)
+
+def build_dataset(directory, training, batch_size=32, cache=None, num_shards=1, shard_index=0, seed=1337):
+    """tf.data pipeline yielding (preprocessed images, one-hot labels) batches.
+    
+    Files are listed in a fixed order and sharded before anything else, so
+    every worker sees the same deterministic shard. Training shuffles the
+    file paths, not decoded images, so the shuffle buffer holds strings.
+    Decoding runs in parallel, decoded images are optionally cached
+    (cache='' keeps them in memory, a path caches them on disk), and
+    augmentation runs on whole batches.
+    
+    A cache replays the order of the epoch that filled it, so with a cache
+    the paths are shuffled once and each epoch only reshuffles within a
+    window of CACHED_SHUFFLE_BATCHES batches of decoded images.
+    """
+    paths, labels = list_images(directory)
+    if not paths:
+        raise ValueError(f"No images found in {directory}")
+    
+    dataset = tf.data.Dataset.from_tensor_slices((paths, labels))
+    if num_shards > 1:
+        dataset = dataset.shard(num_shards, shard_index)
+    if training:
+        dataset = dataset.shuffle(len(paths), seed=seed, reshuffle_each_iteration=cache is None)
+    
+    dataset = dataset.map(
+        lambda path, label: (load_image(path), tf.one_hot(label, len(CATEGORIES))),
+        num_parallel_calls=tf.data.AUTOTUNE
+    )
+    if cache is not None:
+        dataset = dataset.cache(cache)
+        if training:
+            dataset = dataset.shuffle(CACHED_SHUFFLE_BATCHES * batch_size, seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+    
+    if training:
+        # ImageDataGenerator's shear_range=0.2 was in degrees, under one pixel
+        # of displacement at 224x224, and Keras 3.4 has no shear layer; the
+        # other augmentations keep their old ranges
+        augmentation = tf.keras.Sequential([
+            tf.keras.layers.RandomFlip('horizontal', seed=seed),
+            tf.keras.layers.RandomRotation(20 / 360, fill_mode='nearest', seed=seed),
+            tf.keras.layers.RandomTranslation(0.2, 0.2, fill_mode='nearest', seed=seed),
+            tf.keras.layers.RandomZoom(0.2, fill_mode='nearest', seed=seed)
+        ])
+        dataset = dataset.map(
+            lambda images, labels: (augmentation(images, training=True), labels),
+            num_parallel_calls=tf.data.AUTOTUNE
+        )
+    
+    # Same preprocessing as ImageClassifier.preprocess_image at serving time
+    dataset = dataset.map(
+        lambda images, labels: (preprocess_input(images), labels),
+        num_parallel_calls=tf.data.AUTOTUNE
+    )
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+class ThroughputCallback(tf.keras.callbacks.Callback):
+    """Report training images/sec per epoch, excluding validation time"""
+    
+    def __init__(self, num_images):
+        super().__init__()
+        self.num_images = num_images
+    
+    def on_epoch_begin(self, epoch, logs=None):
+        self.started = time.perf_counter()
+        self.last_batch_end = self.started
+    
+    def on_train_batch_end(self, batch, logs=None):
+        self.last_batch_end = time.perf_counter()
+    
+    def on_epoch_end(self, epoch, logs=None):
+        elapsed = max(self.last_batch_end - self.started, 1e-9)
+        print(f"Epoch {epoch + 1}: {self.num_images / elapsed:.1f} training images/sec")
+
+def benchmark_input(directory, batch_size=32, data_cache=None, epochs=2):
+    """Measure how fast the input pipeline alone can deliver training images"""
+    dataset = build_dataset(directory, training=True, batch_size=batch_size, cache=data_cache)
+    for epoch in range(epochs):
+        images = 0
+        started = time.perf_counter()
+        for batch_images, _ in dataset:
+            images += int(batch_images.shape[0])
+        elapsed = time.perf_counter() - started
+        print(f"Input pipeline epoch {epoch + 1}: {images} images, {images / elapsed:.1f} images/sec")
+
 def generate_sample_data():
     """Generate sample training data for demonstration"""
     # Create sample directory structure
@@ -53,7 +306,7 @@ def generate_sample_data():
     print("data/train/[category]/ and data/validation/[category]/")
     print("Where [category] is one of: biodegradable, recyclable, hazardous")
 
-def train_model():
+def train_model(epochs=50, batch_size=32, data_cache=None, num_shards=1, shard_index=0):
     """Train the image classification model"""
     # Data directories
     train_dir = 'data/train'
@@ -65,38 +318,28 @@ def train_model():
         generate_sample_data()
         return
     
-    # Data augmentation for training
-    train_datagen = ImageDataGenerator(
-        rescale=1./255,
-        rotation_range=20,
-        width_shift_range=0.2,
-        height_shift_range=0.2,
-        shear_range=0.2,
-        zoom_range=0.2,
-        horizontal_flip=True,
-        fill_mode='nearest'
-    )
-    
-    # Only rescaling for validation
-    validation_datagen = ImageDataGenerator(rescale=1./255)
-    
-    # Load data
-    train_generator = train_datagen.flow_from_directory(
+    # Parallel tf.data input pipelines
+    train_dataset = build_dataset(
         train_dir,
-        target_size=(224, 224),
-        batch_size=32,
-        class_mode='categorical'
+        training=True,
+        batch_size=batch_size,
+        cache=data_cache,
+        num_shards=num_shards,
+        shard_index=shard_index
     )
-    
-    validation_generator = validation_datagen.flow_from_directory(
+    validation_cache = None
+    if data_cache is not None:
+        validation_cache = f"{data_cache}_validation" if data_cache else ''
+    validation_dataset = build_dataset(
         validation_dir,
-        target_size=(224, 224),
-        batch_size=32,
-        class_mode='categorical'
+        training=False,
+        batch_size=batch_size,
+        cache=validation_cache
     )
+    num_train_images = len(list_images(train_dir)[0][shard_index::num_shards])
     
     # Create model
-    model = create_model(num_classes=len(train_generator.class_indices))
+    model = create_model(num_classes=len(CATEGORIES))
     
     # Compile model
     model.compile(
@@ -129,12 +372,10 @@ def train_model():
     # Train model
     print("Starting model training...")
     history = model.fit(
-        train_generator,
-        steps_per_epoch=train_generator.samples // 32,
-        epochs=50,
-        validation_data=validation_generator,
-        validation_steps=validation_generator.samples // 32,
-        callbacks=callbacks,
+        train_dataset,
+        epochs=epochs,
+        validation_data=validation_dataset,
+        callbacks=callbacks + [ThroughputCallback(num_train_images)],
         verbose=1
     )
     
@@ -172,6 +413,24 @@ def plot_training_history(history):
     plt.show()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the EcoSortAI image classification model")
+    parser.add_argument('--mode', choices=['full', 'features'], default='full',
+                        help="'features' trains only the Dense head on cached backbone embeddings")
+    parser.add_argument('--epochs', type=int, default=50)
+    parser.add_argument('--views', type=int, default=4,
+                        help="Augmented views embedded per image in features mode (1-6)")
+    parser.add_argument('--cache-dir', default='models/feature_cache',
+                        help="Embedding cache directory for features mode")
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--data-cache', default=None,
+                        help="Cache decoded images: '' for memory or a file path for on-disk caching")
+    parser.add_argument('--num-shards', type=int, default=1,
+                        help="Split the training files into this many deterministic shards")
+    parser.add_argument('--shard-index', type=int, default=0)
+    parser.add_argument('--benchmark-input', action='store_true',
+                        help="Only time the input pipeline and report images/sec")
+    args = parser.parse_args()
+    
     # Create models directory
     os.makedirs('models', exist_ok=True)
     
@@ -182,4 +441,15 @@ if __name__ == "__main__":
         print("No GPU detected. Training will use CPU (this will be slower).")
     
     # Start training
-    train_model()
+    if args.benchmark_input:
+        benchmark_input('data/train', batch_size=args.batch_size, data_cache=args.data_cache)
+    elif args.mode == 'features':
+        train_with_feature_cache(epochs=args.epochs, num_views=args.views, cache_dir=args.cache_dir)
+    else:
+        train_model(
+            epochs=args.epochs,
+            batch_size=args.batch_size,
+            data_cache=args.data_cache,
+            num_shards=args.num_shards,
+            shard_index=args.shard_index
+        )
@@ -7,6 +7,11 @@ import uuid
 from datetime import datetime, timedelta
 import random
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+from database import LookupCache, migrate_schema
+from rollups import rebuild_rollups
 
 def check_and_populate_database():
     """Check database status and add test data if needed"""
@@ -29,21 +34,9 @@ def check_and_populate_database():
     tables = [row[0] for row in cursor.fetchall()]
     print(f"Tables in database: {tables}")
     
-    # Initialize tables if they don't exist
-    if 'classifications' not in tables:
-        print("Creating classifications table...")
-        cursor.execute('''
-            CREATE TABLE classifications (
-                id TEXT PRIMARY KEY,
-                timestamp DATETIME,
-                input_type TEXT,
-                input_data TEXT,
-                predicted_category TEXT,
-                confidence REAL,
-                sustainability_score REAL,
-                disposal_tips TEXT
-            )
-        ''')
+    # Create (or migrate to) the normalized classifications schema
+    migrate_schema(conn)
+    lookups = LookupCache()
     
     if 'analytics' not in tables:
         print("Creating analytics table...")
@@ -97,9 +90,14 @@ def check_and_populate_database():
                 
                 cursor.execute('''
                     INSERT INTO classifications 
-                    (id, timestamp, input_type, input_data, predicted_category, confidence, sustainability_score, disposal_tips)
+                    (id, timestamp, input_type, input_data, category_id, confidence, sustainability_score, tip_set_id)
                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (classification_id, date, 'text', item, category, confidence, sustainability_score, str(disposal_tips)))
+                ''', (
+                    classification_id, date, 'text', item,
+                    lookups.category_id(cursor, category),
+                    confidence, sustainability_score,
+                    lookups.tip_set_id(cursor, disposal_tips)
+                ))
         
         # Update analytics table
         cursor.execute('DELETE FROM analytics')  # Clear existing analytics
@@ -114,20 +112,23 @@ def check_and_populate_database():
                 VALUES (
                     ?,
                     ?,
-                    (SELECT COUNT(*) FROM classifications WHERE predicted_category = 'biodegradable' AND DATE(timestamp) = ?),
-                    (SELECT COUNT(*) FROM classifications WHERE predicted_category = 'recyclable' AND DATE(timestamp) = ?),
-                    (SELECT COUNT(*) FROM classifications WHERE predicted_category = 'hazardous' AND DATE(timestamp) = ?),
-                    (SELECT COUNT(*) FROM classifications WHERE DATE(timestamp) = ?)
+                    (SELECT COUNT(*) FROM classification_details WHERE predicted_category = 'biodegradable' AND DATE(timestamp) = ?),
+                    (SELECT COUNT(*) FROM classification_details WHERE predicted_category = 'recyclable' AND DATE(timestamp) = ?),
+                    (SELECT COUNT(*) FROM classification_details WHERE predicted_category = 'hazardous' AND DATE(timestamp) = ?),
+                    (SELECT COUNT(*) FROM classification_details WHERE DATE(timestamp) = ?)
                 )
             ''', (date, date, date, date, date, date))
     
     conn.commit()
     
+    # Keep the analytics rollups in sync with the raw rows
+    rebuild_rollups(conn)
+    
     # Verify final counts
     cursor.execute('SELECT COUNT(*) FROM classifications')
     final_count = cursor.fetchone()[0]
     
-    cursor.execute('SELECT predicted_category, COUNT(*) FROM classifications GROUP BY predicted_category')
+    cursor.execute('SELECT predicted_category, COUNT(*) FROM classification_details GROUP BY predicted_category')
     category_counts = dict(cursor.fetchall())
     
     cursor.execute('SELECT COUNT(*) FROM analytics')